@@ -0,0 +1,251 @@
+"""Micro-benchmarks du client, exécutés contre le serveur factice (mock_server.py).
+
+Mesurent le coût propre au client (parsing SSE, retrait des citations,
+récupération du contexte, corps multipart et upload) sans backend GPU. Chaque
+exécution est ajoutée à results/benchmarks.jsonl avec le commit courant ; avec
+--compare, le code de retour est non nul si une médiane régresse au-delà du
+seuil par rapport à un autre commit.
+
+    python benchmarks.py --compare --threshold 0.25
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from ingestion import IngestJob, upload_file
+from mock_server import MockSettings, start_mock_server
+from retrieval import retrieve
+import sse
+from streaming import CitationStripper, strip_citations
+from upload_stream import MultipartFileStream
+from zylon_client import ZylonClient
+
+BENCHMARK_OUTPUT = os.getenv("BENCHMARK_OUTPUT", "results/benchmarks.jsonl")
+UPLOAD_SIZE = 8 * 1024 * 1024  # 8MB
+
+BENCHMARKS = {}
+
+
+def benchmark(name, rounds=20):
+    """Enregistre une fonction de benchmark ; setup(context) retourne la fonction mesurée"""
+    def decorator(setup):
+        BENCHMARKS[name] = (setup, rounds)
+        return setup
+    return decorator
+
+
+def decode_stream(chunks):
+    """Décodage SSE de l'interface de chat : texte et sources"""
+    text, sources = [], []
+    for event in sse.SSEDecoder().iter_events(chunks):
+        if event.kind == sse.TEXT:
+            text.append(event.text)
+        elif event.kind == sse.SOURCES:
+            sources.extend(event.sources)
+    return "".join(text), sources
+
+
+class BenchmarkContext:
+    """Serveur factice sans délai et client partagé par tous les benchmarks"""
+
+    def __init__(self):
+        settings = MockSettings(ttft=0.0, token_rate=0.0, latency=0.0, jitter=0.0,
+                                response_tokens=400, error_rate=0.0, abort_rate=0.0)
+        self.server = start_mock_server(settings)
+        self.client = ZylonClient(self.server.url)
+        self.chat_body = {
+            "messages": [{"role": "user", "content": "Quel est le budget alloué ?"}],
+            "use_context": True,
+            "context_filter": {"collection": "chat_documents"},
+            "stream": True,
+        }
+        with self.client.stream("POST", "/v1/chat/completions", json=self.chat_body) as response:
+            self.sse_chunks = list(response.iter_bytes())
+        self.text_fragments = [
+            event.text for event in sse.SSEDecoder().iter_events(self.sse_chunks) if event.kind == sse.TEXT
+        ]
+
+    def close(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@benchmark("sse_parse", rounds=200)
+def bench_sse_parse(context):
+    chunks = context.sse_chunks
+    return lambda: decode_stream(chunks)
+
+
+@benchmark("citations_strip", rounds=200)
+def bench_citations_strip(context):
+    text = "".join(context.text_fragments) * 50
+    return lambda: strip_citations(text)
+
+
+@benchmark("citations_stream", rounds=200)
+def bench_citations_stream(context):
+    fragments = context.text_fragments * 10
+
+    def run():
+        stripper = CitationStripper()
+        output = [stripper.feed(fragment) for fragment in fragments]
+        output.append(stripper.finish())
+        return "".join(output)
+    return run
+
+
+@benchmark("chat_stream", rounds=30)
+def bench_chat_stream(context):
+    def run():
+        with context.client.stream("POST", "/v1/chat/completions", endpoint="chat", json=context.chat_body) as response:
+            return decode_stream(response.iter_bytes())
+    return run
+
+
+@benchmark("retrieval", rounds=50)
+def bench_retrieval(context):
+    return lambda: context.client.run(
+        retrieve(context.client, "Quel est le budget alloué ?", need_embedding=True)
+    )
+
+
+@benchmark("upload_body", rounds=20)
+def bench_upload_body(context):
+    source = io.BytesIO(os.urandom(UPLOAD_SIZE))
+
+    def run():
+        body = MultipartFileStream(source, "benchmark.pdf")
+        return sum(len(block) for block in body.iter_blocks())
+    return run
+
+
+@benchmark("upload", rounds=10)
+def bench_upload(context):
+    source = io.BytesIO(os.urandom(UPLOAD_SIZE))
+
+    def run():
+        job = IngestJob("benchmark.pdf", source=source, size=UPLOAD_SIZE)
+        return context.client.run(upload_file(context.client, job))
+    return run
+
+
+def measure(function, rounds, warmup=2):
+    for _ in range(warmup):
+        function()
+    timings = []
+    for _ in range(rounds):
+        started_at = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return {
+        "rounds": rounds,
+        "median_ms": statistics.median(timings),
+        "mean_ms": statistics.fmean(timings),
+        "min_ms": min(timings),
+        "stdev_ms": statistics.stdev(timings) if rounds > 1 else 0.0,
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def find_baseline(history, commit, baseline=None):
+    """Dernière exécution d'un autre commit (ou du commit demandé)"""
+    for entry in reversed(history):
+        if baseline is not None:
+            if entry.get("commit") == baseline:
+                return entry
+        elif entry.get("commit") != commit:
+            return entry
+    return None
+
+
+def compare(results, baseline, threshold):
+    """Retourne les benchmarks dont la médiane dépasse celle de référence de plus de threshold"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline["results"].get(name)
+        if not reference:
+            continue
+        ratio = result["median_ms"] / reference["median_ms"] - 1
+        print(f"  {name:<18} {reference['median_ms']:>10.3f} -> {result['median_ms']:>10.3f} ms ({ratio:+.1%})")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks du client Zylon")
+    parser.add_argument("-k", "--filter", default="", help="ne lance que les benchmarks contenant ce texte")
+    parser.add_argument("--rounds", type=int, help="nombre de mesures par benchmark")
+    parser.add_argument("--output", default=BENCHMARK_OUTPUT)
+    parser.add_argument("--compare", action="store_true", help="compare au dernier autre commit mesuré")
+    parser.add_argument("--baseline", help="commit de référence pour --compare")
+    parser.add_argument("--threshold", type=float, default=0.2, help="régression tolérée (0.2 = +20%%)")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    context = BenchmarkContext()
+    results = {}
+    try:
+        for name, (setup, rounds) in BENCHMARKS.items():
+            if args.filter not in name:
+                continue
+            results[name] = measure(setup(context), args.rounds or rounds)
+            result = results[name]
+            print(f"{name:<18} médiane {result['median_ms']:>10.3f} ms  min {result['min_ms']:>10.3f} ms  "
+                  f"({result['rounds']} mesures)")
+    finally:
+        context.close()
+
+    commit = current_commit()
+    entry = {
+        "commit": commit,
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    history = load_history(args.output)
+    status = 0
+    if args.compare:
+        baseline = find_baseline(history, commit, args.baseline)
+        if baseline is None:
+            print("Aucune exécution de référence trouvée.")
+        else:
+            print(f"Comparaison avec {baseline['commit']} :")
+            regressions = compare(results, baseline, args.threshold)
+            if regressions:
+                print(f"Régressions au-delà de {args.threshold:.0%} : {', '.join(regressions)}")
+                status = 1
+    if not args.no_save:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "a", encoding="utf-8") as file:
+            file.write(json.dumps(entry) + "\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
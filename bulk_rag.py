@@ -0,0 +1,206 @@
+"""Exécution de nombreuses questions sur la collection via /v1/qa/bulk-rag.
+
+Les questions sont regroupées en lots envoyés en parallèle (nombre de lots
+simultanés borné) ; chaque réponse est ajoutée au fur et à mesure à une liste
+de lignes convertible en DataFrame pandas et exportable en CSV / JSONL.
+"""
+import asyncio
+import io
+import json
+import math
+import os
+import time
+import uuid
+
+import pandas as pd
+
+from streaming import strip_citations
+
+BULK_RAG_BATCH_SIZE = int(os.getenv("BULK_RAG_BATCH_SIZE", "20"))
+BULK_RAG_CONCURRENCY = int(os.getenv("BULK_RAG_CONCURRENCY", "4"))
+BULK_RAG_TOP_K = int(os.getenv("BULK_RAG_TOP_K", "5"))
+DEFAULT_PROMPT = (
+    "Tu es un assistant spécialisé dans l'analyse de documents. "
+    "Réponds à la question en t'appuyant uniquement sur les documents fournis."
+)
+
+QUERY_COLUMNS = ("query", "question", "questions", "prompt")
+RESULT_COLUMNS = ["query", "response", "sources", "top_score", "batch", "batch_seconds", "error"]
+
+
+def _pick_column(columns):
+    for column in columns:
+        if str(column).strip().lower() in QUERY_COLUMNS:
+            return column
+    return columns[0]
+
+
+def _query_of(item):
+    """Question portée par un élément JSON : chaîne, ou objet dont on prend la colonne de question"""
+    if isinstance(item, dict):
+        return item.get(_pick_column(list(item))) if item else None
+    return item
+
+
+def load_queries(data, file_name):
+    """Lit les questions d'un fichier CSV, JSON (tableau), JSONL ou texte (une question par ligne)"""
+    if isinstance(data, bytes):
+        data = data.decode("utf-8-sig")
+    name = file_name.lower()
+    if name.endswith(".csv"):
+        frame = pd.read_csv(io.StringIO(data), dtype=str)
+        queries = frame[_pick_column(list(frame.columns))].dropna().tolist()
+    elif name.endswith(".json"):
+        items = json.loads(data)
+        if not isinstance(items, list):
+            raise ValueError("Le fichier JSON doit contenir un tableau de questions (chaînes ou objets)")
+        queries = [_query_of(item) for item in items]
+    elif name.endswith(".jsonl"):
+        queries = [_query_of(json.loads(line)) for line in data.splitlines() if line.strip()]
+    else:
+        queries = data.splitlines()
+    return [str(query).strip() for query in queries if query and str(query).strip()]
+
+
+def batch_size_for(count, concurrency=BULK_RAG_CONCURRENCY, max_batch_size=BULK_RAG_BATCH_SIZE):
+    """Taille de lot occupant tous les workers sans dépasser max_batch_size"""
+    if count <= 0:
+        return max_batch_size
+    return max(1, min(max_batch_size, math.ceil(count / concurrency)))
+
+
+class BulkRagRun:
+    """Un lot de questions : découpage, envoi concurrent et résultats accumulés"""
+
+    def __init__(self, queries, prompt=DEFAULT_PROMPT, collection="chat_documents",
+                 top_k=BULK_RAG_TOP_K, batch_size=None, concurrency=BULK_RAG_CONCURRENCY):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.queries = list(queries)
+        self.prompt = prompt
+        self.collection = collection
+        self.top_k = top_k
+        self.concurrency = concurrency
+        self.batch_size = batch_size or batch_size_for(len(self.queries), concurrency)
+        self.batches = [
+            self.queries[start:start + self.batch_size]
+            for start in range(0, len(self.queries), self.batch_size)
+        ]
+        self.rows = []
+        self.failed_batches = 0
+        self.started_at = None
+        self.finished_at = None
+        self._pending = list(range(len(self.batches)))  # lots restant à envoyer
+        self._processed = 0  # questions traitées par l'exécution en cours
+
+    @property
+    def done(self):
+        return len(self.rows)
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def throughput(self):
+        """Questions traitées par seconde (exécution en cours ou dernière exécution)"""
+        return self._processed / self.elapsed if self.elapsed > 0 else 0.0
+
+    def failed_queries(self):
+        return [row["query"] for row in self.rows if row["error"]]
+
+    def retry_failed(self):
+        """Replace les questions en échec dans de nouveaux lots ; retourne leur nombre"""
+        failed = self.failed_queries()
+        self.rows = [row for row in self.rows if not row["error"]]
+        first = len(self.batches)
+        self.batches.extend(
+            failed[start:start + self.batch_size] for start in range(0, len(failed), self.batch_size)
+        )
+        self._pending = list(range(first, len(self.batches)))
+        self.failed_batches = 0
+        return len(failed)
+
+    def _body(self, index, queries):
+        return {
+            "prompt": self.prompt,
+            "queries": queries,
+            "artifact_input": {"type": "ingest", "value": {"collection": self.collection}},
+            "top_k": self.top_k,
+            "correlation_id": f"{self.run_id}-{index}",
+        }
+
+    def _add_results(self, index, queries, results, seconds):
+        by_query = {}
+        for result in results:
+            by_query.setdefault(result.get("query"), []).append(result)
+        for position, query in enumerate(queries):
+            # Association par texte de la question, à défaut par position
+            matches = by_query.get(query)
+            if matches:
+                result = matches.pop(0)
+            elif position < len(results):
+                result = results[position]
+            else:
+                result = {}
+            sources = result.get("sources") or []
+            self.rows.append({
+                "query": query,
+                "response": strip_citations(result.get("response") or ""),
+                "sources": ", ".join(dict.fromkeys(
+                    (source.get("document") or {}).get("artifact", "") for source in sources
+                )),
+                "top_score": max((source.get("score", 0) for source in sources), default=None),
+                "batch": index,
+                "batch_seconds": round(seconds, 3),
+                "error": None if result else "Réponse manquante",
+            })
+
+    async def _run_batch(self, client, index, queries, semaphore):
+        async with semaphore:
+            started_at = time.monotonic()
+            try:
+                response = await client.arequest(
+                    "POST",
+                    "/v1/qa/bulk-rag",
+                    endpoint="bulk_rag",
+                    json=[self._body(index, queries)]
+                )
+                self._add_results(index, queries, response.json(), time.monotonic() - started_at)
+            except Exception as e:
+                self.failed_batches += 1
+                for query in queries:
+                    self.rows.append({
+                        "query": query, "response": None, "sources": None, "top_score": None,
+                        "batch": index, "batch_seconds": round(time.monotonic() - started_at, 3),
+                        "error": str(e),
+                    })
+            self._processed += len(queries)
+
+    async def run(self, client):
+        pending, self._pending = self._pending, []
+        self.started_at, self.finished_at, self._processed = time.monotonic(), None, 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            await asyncio.gather(*(
+                self._run_batch(client, index, self.batches[index], semaphore) for index in pending
+            ))
+        finally:
+            self.finished_at = time.monotonic()
+        return self
+
+    def start(self, client):
+        """Lance le lot sur la boucle du client ; retourne un concurrent.futures.Future"""
+        return client.submit(self.run(client))
+
+    def dataframe(self):
+        """Résultats obtenus jusqu'ici, dans l'ordre des lots"""
+        frame = pd.DataFrame(list(self.rows), columns=RESULT_COLUMNS)
+        return frame.sort_values("batch", kind="stable").reset_index(drop=True)
+
+    def to_csv(self):
+        return self.dataframe().to_csv(index=False).encode("utf-8")
+
+    def to_jsonl(self):
+        return self.dataframe().to_json(orient="records", lines=True, force_ascii=False).encode("utf-8")
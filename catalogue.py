@@ -0,0 +1,185 @@
+"""Catalogue des documents ingérés, mis en cache et indexé pour la recherche.
+
+La liste de /v1/ingest/list est conservée pendant un TTL (et invalidée après
+chaque ingestion ou suppression) au lieu d'être rechargée à chaque rerun ; un
+index de préfixes sur le nom des artefacts et leurs métadonnées permet de
+filtrer des milliers de documents sans parcours complet. Le même index sert à
+restreindre la recherche de contexte aux documents dont le nom ou les
+métadonnées correspondent à la question.
+"""
+import bisect
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+
+CATALOGUE_TTL = float(os.getenv("CATALOGUE_TTL", "60"))
+# Métadonnées proposées comme facettes : clés ayant au plus FACET_MAX_VALUES valeurs distinctes
+FACET_MAX_VALUES = int(os.getenv("FACET_MAX_VALUES", "50"))
+FACET_EXCLUDED_KEYS = {"file_name", "title", "doc_id", "file_id", "artifact"}
+# Périmètre automatique : nombre maximal de documents retenus et score relatif minimal
+SCOPE_MAX_DOCUMENTS = int(os.getenv("SCOPE_MAX_DOCUMENTS", "5"))
+SCOPE_MIN_RATIO = float(os.getenv("SCOPE_MIN_RATIO", "0.5"))
+
+# Mots trop courants pour désigner un document
+STOPWORDS = {
+    "les", "des", "une", "pour", "dans", "sur", "est", "que", "qui", "quoi", "quel", "quelle", "quels",
+    "quelles", "avec", "par", "aux", "ces", "son", "ses", "leur", "leurs", "pas", "plus", "comment",
+    "combien", "document", "documents", "fichier", "selon", "entre", "sont", "ete", "the", "and",
+}
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+def _fold(text):
+    """Minuscules sans accents (« Télétravail » et « teletravail » se correspondent)"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _tokens(text):
+    return TOKEN_PATTERN.findall(_fold(text))
+
+
+def _document_text(doc):
+    """Texte indexé d'un document : nom de l'artefact et valeurs de ses métadonnées"""
+    parts = [doc.get("artifact", "")]
+    for key, value in (doc.get("doc_metadata") or {}).items():
+        parts.append(f"{key} {value}")
+    return _fold(" ".join(parts))
+
+
+class DocumentCatalogue:
+    """Liste des documents d'une collection, avec TTL et recherche par préfixe / sous-chaîne"""
+
+    def __init__(self, client, collection="chat_documents", ttl=CATALOGUE_TTL, on_refresh=None):
+        self.client = client
+        self.collection = collection
+        self.ttl = ttl
+        self.on_refresh = on_refresh
+        self._lock = threading.Lock()
+        self._documents = []
+        self._texts = []
+        self._tokens = []  # liste triée des tokens indexés
+        self._postings = {}  # token -> indices des documents
+        self._facets = {}  # clé de métadonnée -> valeurs distinctes
+        self._expires_at = 0.0
+
+    def _fetch(self):
+        response = self.client.request(
+            "GET",
+            "/v1/ingest/list",
+            endpoint="list",
+            params={"collection": self.collection},
+            headers={"accept": "application/json"}
+        )
+        return response.json().get("data", [])
+
+    def _build_index(self, documents):
+        texts = [_document_text(doc) for doc in documents]
+        postings = {}
+        for index, text in enumerate(texts):
+            for token in set(_tokens(text)):
+                postings.setdefault(token, []).append(index)
+        self._documents = documents
+        self._texts = texts
+        self._postings = postings
+        self._tokens = sorted(postings)
+        values = {}
+        for doc in documents:
+            for key, value in (doc.get("doc_metadata") or {}).items():
+                # Valeurs textuelles uniquement : le filtre compare les valeurs telles quelles
+                if key not in FACET_EXCLUDED_KEYS and isinstance(value, str):
+                    values.setdefault(key, set()).add(value)
+        self._facets = {
+            key: sorted(distinct) for key, distinct in sorted(values.items())
+            if 1 < len(distinct) <= FACET_MAX_VALUES
+        }
+
+    def documents(self):
+        """Retourne la liste des documents, rechargée si le TTL est expiré"""
+        with self._lock:
+            if time.monotonic() >= self._expires_at:
+                documents = self._fetch()
+                self._build_index(documents)
+                self._expires_at = time.monotonic() + self.ttl
+                if self.on_refresh:
+                    self.on_refresh(documents)
+            return self._documents
+
+    def invalidate(self):
+        """Force le rechargement au prochain accès"""
+        with self._lock:
+            self._expires_at = 0.0
+
+    def _prefix_matches(self, term):
+        matches = set()
+        start = bisect.bisect_left(self._tokens, term)
+        for token in self._tokens[start:]:
+            if not token.startswith(term):
+                break
+            matches.update(self._postings[token])
+        return matches
+
+    def search(self, query):
+        """Documents dont le nom ou les métadonnées contiennent tous les termes de la requête"""
+        documents = self.documents()
+        terms = _tokens(query or "")
+        if not terms:
+            return documents
+        with self._lock:
+            selected = None
+            for term in terms:
+                matches = self._prefix_matches(term)
+                # Repli sur une recherche de sous-chaîne (ex. « 2023 » dans « rapport2023 »)
+                if not matches:
+                    matches = {i for i, text in enumerate(self._texts) if term in text}
+                selected = matches if selected is None else selected & matches
+                if not selected:
+                    return []
+            return [self._documents[i] for i in sorted(selected)]
+
+    def facets(self):
+        """Clés de métadonnées utilisables comme filtres, avec leurs valeurs distinctes"""
+        self.documents()
+        with self._lock:
+            return dict(self._facets)
+
+    def infer_scope(self, query, max_documents=SCOPE_MAX_DOCUMENTS, min_ratio=SCOPE_MIN_RATIO):
+        """Artefacts que la question semble viser (termes rares du nom ou des métadonnées)
+
+        Retourne une liste vide si aucun document ne se détache : la recherche porte
+        alors sur toute la collection.
+        """
+        documents = self.documents()
+        terms = [term for term in set(_tokens(query or "")) if len(term) >= 3 and term not in STOPWORDS]
+        if not terms or not documents:
+            return []
+        with self._lock:
+            scores = {}
+            for term in terms:
+                matches = self._prefix_matches(term)
+                # Un terme présent dans la majorité des documents ne discrimine rien
+                if not matches or len(matches) > len(self._documents) / 2:
+                    continue
+                weight = math.log(len(self._documents) / len(matches)) + 1
+                for index in matches:
+                    scores[index] = scores.get(index, 0.0) + weight
+            if not scores:
+                return []
+            best = max(scores.values())
+            ranked = sorted(
+                (index for index, score in scores.items() if score >= best * min_ratio),
+                key=lambda index: -scores[index]
+            )
+            return [self._documents[index]["artifact"] for index in ranked[:max_documents]]
+
+    @staticmethod
+    def paginate(documents, page, per_page):
+        """Retourne (documents de la page, nombre de pages)"""
+        pages = max(1, -(-len(documents) // per_page))
+        page = min(max(page, 1), pages)
+        start = (page - 1) * per_page
+        return documents[start:start + per_page], pages
@@ -0,0 +1,118 @@
+"""Index local de déduplication des documents ingérés.
+
+Associe l'empreinte SHA-256 du contenu de chaque document à l'artefact créé
+dans la collection, pour éviter de ré-ingérer (et ré-embarquer côté serveur)
+un contenu déjà présent, quel que soit son nom ou l'utilisateur qui l'envoie.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+DATA_DIR = os.getenv("ZYLON_DATA_DIR", ".zylon")
+DEDUP_DB_PATH = os.getenv("DEDUP_DB_PATH", os.path.join(DATA_DIR, "dedup.sqlite3"))
+HASH_BLOCK_SIZE = 1024 * 1024  # 1MB
+
+
+def content_hash(source, block_size=HASH_BLOCK_SIZE):
+    """SHA-256 d'un fichier (chemin, tampon en mémoire ou objet binaire), calculé par blocs"""
+    digest = hashlib.sha256()
+    if isinstance(source, str):
+        with open(source, "rb") as file:
+            while block := file.read(block_size):
+                digest.update(block)
+    elif hasattr(source, "getbuffer"):
+        with source.getbuffer() as view:
+            for offset in range(0, view.nbytes, block_size):
+                digest.update(view[offset:offset + block_size])
+    else:
+        position = source.tell()
+        source.seek(0)
+        while block := source.read(block_size):
+            digest.update(block)
+        source.seek(position)
+    return digest.hexdigest()
+
+
+def text_hash(text):
+    """SHA-256 d'un texte ingéré via /v1/ingest/text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DedupIndex:
+    """Table SQLite (sha256, collection) -> artefact, partagée entre sessions et processus"""
+
+    def __init__(self, path=DEDUP_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " sha256 TEXT NOT NULL,"
+                " collection TEXT NOT NULL,"
+                " artifact TEXT NOT NULL,"
+                " size INTEGER,"
+                " created_at REAL,"
+                " PRIMARY KEY (sha256, collection))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS documents_artifact ON documents (collection, artifact)"
+            )
+
+    def lookup(self, sha256, collection="chat_documents"):
+        """Retourne l'artefact déjà ingéré pour ce contenu, ou None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT artifact FROM documents WHERE sha256 = ? AND collection = ?",
+                (sha256, collection)
+            ).fetchone()
+        return row[0] if row else None
+
+    def add(self, sha256, artifact, collection="chat_documents", size=None):
+        with self._lock, self._conn:
+            # Le serveur remplace le document d'un artefact ré-ingéré : l'ancienne empreinte
+            # ne désigne plus rien (et ferait ignorer à tort un nouvel envoi de l'ancien contenu)
+            self._conn.execute(
+                "DELETE FROM documents WHERE artifact = ? AND collection = ?",
+                (artifact, collection)
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (sha256, collection, artifact, size, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (sha256, collection, artifact, size, time.time())
+            )
+
+    def remove_artifact(self, artifact, collection="chat_documents"):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM documents WHERE artifact = ? AND collection = ?",
+                (artifact, collection)
+            )
+
+    def reconcile(self, artifacts, collection="chat_documents"):
+        """Supprime les entrées dont l'artefact n'existe plus dans la collection"""
+        artifacts = set(artifacts)
+        with self._lock, self._conn:
+            known = {
+                row[0] for row in self._conn.execute(
+                    "SELECT DISTINCT artifact FROM documents WHERE collection = ?", (collection,)
+                )
+            }
+            stale = known - artifacts
+            self._conn.executemany(
+                "DELETE FROM documents WHERE artifact = ? AND collection = ?",
+                [(artifact, collection) for artifact in stale]
+            )
+        return len(stale)
+
+    def count(self, collection="chat_documents"):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM documents WHERE collection = ?", (collection,)
+            ).fetchone()[0]
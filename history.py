@@ -0,0 +1,115 @@
+"""Compactage de l'historique de conversation envoyé à /v1/chat/completions.
+
+Seuls les derniers messages tenant dans un budget de tokens sont renvoyés tels
+quels (sans balises de citation) ; les plus anciens sont remplacés par un
+résumé calculé en tâche de fond via /v1/summarize et mis en cache.
+"""
+import hashlib
+import json
+import os
+
+from rerank import estimate_tokens
+from streaming import strip_citations
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+SUMMARY_MIN_MESSAGES = int(os.getenv("HISTORY_SUMMARY_MIN_MESSAGES", "4"))
+SUMMARY_INSTRUCTIONS = (
+    "Résume de façon concise cet échange entre un utilisateur et un assistant, "
+    "en conservant les faits, chiffres et décisions utiles pour la suite de la conversation."
+)
+SUMMARY_PREFIX = "Résumé de la conversation précédente :\n"
+
+
+def _fingerprint(messages):
+    payload = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def clean_message(message):
+    """Message prêt à être renvoyé au modèle (citations retirées des réponses)"""
+    content = message["content"]
+    if message["role"] == "assistant":
+        content = strip_citations(content)
+    return {"role": message["role"], "content": content}
+
+
+class HistoryManager:
+    """Fenêtre glissante sur l'historique d'une session, complétée par un résumé"""
+
+    def __init__(self, client, token_budget=HISTORY_TOKEN_BUDGET, min_summary_messages=SUMMARY_MIN_MESSAGES):
+        self.client = client
+        self.token_budget = token_budget
+        self.min_summary_messages = min_summary_messages
+        self._summaries = {}  # nombre de messages résumés -> (empreinte, résumé)
+        self._pending = None
+        self._clean_cache = {}  # index du message -> (message brut, message nettoyé)
+
+    def _clean(self, messages):
+        cleaned = []
+        for index, message in enumerate(messages):
+            cached = self._clean_cache.get(index)
+            if cached is None or cached[0] != message:
+                cached = (dict(message), clean_message(message))
+                self._clean_cache[index] = cached
+            cleaned.append(cached[1])
+        return cleaned
+
+    def _split(self, cleaned):
+        """Sépare les messages anciens de la fenêtre récente tenant dans le budget"""
+        used = 0
+        start = len(cleaned)
+        while start > 0:
+            tokens = estimate_tokens(cleaned[start - 1]["content"])
+            # Le dernier message est toujours conservé, même s'il dépasse le budget
+            if used + tokens > self.token_budget and start < len(cleaned):
+                break
+            used += tokens
+            start -= 1
+        return cleaned[:start], cleaned[start:]
+
+    def _best_summary(self, older):
+        """Résumé disponible couvrant le plus long préfixe des messages anciens"""
+        for count in sorted(self._summaries, reverse=True):
+            fingerprint, summary = self._summaries[count]
+            if count <= len(older) and _fingerprint(older[:count]) == fingerprint:
+                return count, summary
+        return 0, None
+
+    async def _summarize(self, older, base_count, base_summary):
+        lines = []
+        if base_summary:
+            lines.append(SUMMARY_PREFIX + base_summary)
+        lines.extend(f"{message['role']}: {message['content']}" for message in older[base_count:])
+        response = await self.client.arequest(
+            "POST",
+            "/v1/summarize",
+            endpoint="summarize",
+            json={
+                "text": "\n\n".join(lines),
+                "use_context": False,
+                "instructions": SUMMARY_INSTRUCTIONS,
+                "stream": False
+            }
+        )
+        self._summaries[len(older)] = (_fingerprint(older), response.json()["summary"])
+        # Seuls les deux résumés les plus récents sont conservés
+        for count in sorted(self._summaries)[:-2]:
+            del self._summaries[count]
+
+    def _schedule_summary(self, older, base_count, base_summary):
+        if self._pending is not None and not self._pending.done():
+            return
+        if len(older) - base_count < self.min_summary_messages:
+            return
+        self._pending = self.client.submit(self._summarize(older, base_count, base_summary))
+
+    def build(self, messages):
+        """Messages à envoyer : résumé éventuel des anciens échanges puis fenêtre récente"""
+        older, window = self._split(self._clean(messages))
+        if not older:
+            return window
+        count, summary = self._best_summary(older)
+        self._schedule_summary(older, count, summary)
+        if summary is None:
+            return window
+        return [{"role": "system", "content": SUMMARY_PREFIX + summary}] + window
@@ -0,0 +1,253 @@
+"""Moteur d'ingestion par lots.
+
+Les fichiers sont envoyés en parallèle (nombre de workers borné) sur la boucle
+asyncio du client partagé, directement depuis leur tampon d'upload, avec
+nouvelles tentatives et backoff exponentiel. Les documents accessibles par URI
+passent par /v1/async/ingest/uri et le suivi de /v1/ingest/tasks/{task_id}.
+Sur demande, le texte des fichiers est extrait localement (preprocess.py) et
+envoyé à /v1/ingest/text à la place du fichier brut.
+"""
+import asyncio
+import os
+import random
+
+import httpx
+
+from limiter import Overloaded
+from preprocess import PREPROCESS_WORKERS, create_pool, extract_text, spill_to_file
+from upload_stream import MultipartFileStream
+
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "3"))
+INGEST_BACKOFF_BASE = float(os.getenv("INGEST_BACKOFF_BASE", "2.0"))
+INGEST_BACKOFF_MAX = float(os.getenv("INGEST_BACKOFF_MAX", "60.0"))
+LARGE_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+TASK_POLL_INTERVAL = float(os.getenv("TASK_POLL_INTERVAL", "2.0"))
+TASK_POLL_MAX_INTERVAL = float(os.getenv("TASK_POLL_MAX_INTERVAL", "30.0"))
+
+# Codes HTTP pour lesquels une nouvelle tentative a un sens
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class TaskFailed(Exception):
+    """Une tâche asynchrone côté serveur s'est terminée en erreur"""
+
+
+class IngestJob:
+    """Un document à ingérer : fichier (objet binaire) ou URI"""
+
+    def __init__(self, name, source=None, size=0, uri=None, collection="chat_documents", content_hash=None,
+                 preprocess=False):
+        self.name = name
+        self.source = source
+        self.size = size
+        self.uri = uri
+        self.collection = collection
+        self.content_hash = content_hash
+        self.status = "pending"  # pending | extracting | uploading | processing | retrying | done | failed
+        self.attempts = 0
+        self.error = None
+        self.task_id = None
+        self.body = None  # corps multipart de la tentative en cours
+        # Extraction locale : None (pas encore tentée), True (texte prêt) ou False (envoi du fichier brut)
+        self.preprocess = preprocess
+        self.extracted = None
+        self.text = None
+        self.metadata = None
+        self.text_size = 0
+        self.fallback_reason = None
+
+    @classmethod
+    def from_path(cls, path, name=None, collection="chat_documents"):
+        return cls(name or os.path.basename(path), source=path,
+                   size=os.path.getsize(path), collection=collection)
+
+    @property
+    def is_large(self):
+        return self.size > LARGE_FILE_SIZE
+
+    @property
+    def transfer(self):
+        """Suivi des octets envoyés pour la tentative en cours (None pour une URI)"""
+        return self.body.progress if self.body is not None else None
+
+    @property
+    def progress(self):
+        if self.status == "done":
+            return 1.0
+        transfer = self.transfer
+        return transfer.fraction if transfer is not None else 0.0
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+
+def _is_retryable(error):
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS
+    return isinstance(error, (httpx.TransportError, TaskFailed, Overloaded))
+
+
+def task_state(status):
+    """Normalise le champ task_status d'une réponse /tasks/{task_id} : pending, running, completed ou failed"""
+    task_status = str(status.get("task_status", "")).lower()
+    if task_status in ("completed", "success"):
+        return "completed"
+    if task_status in ("failed", "failure", "error"):
+        return "failed"
+    if task_status in ("running", "started", "progress"):
+        return "running"
+    return "pending"
+
+
+async def poll_task(client, path, interval=TASK_POLL_INTERVAL, max_interval=TASK_POLL_MAX_INTERVAL):
+    """Interroge un endpoint /tasks/{task_id} jusqu'à la fin de la tâche et retourne son résultat"""
+    while True:
+        response = await client.arequest("GET", path, endpoint="tasks")
+        status = response.json()
+        state = task_state(status)
+        if state == "completed":
+            return status.get("task_result")
+        if state == "failed":
+            raise TaskFailed(f"Tâche {status.get('task_id')} en échec : {status.get('task_result')}")
+        await asyncio.sleep(interval)
+        interval = min(interval * 1.5, max_interval)
+
+
+async def upload_file(client, job):
+    """Envoie un fichier sur /v1/ingest/file par blocs, sans copie intermédiaire"""
+    endpoint = "upload_large" if job.is_large else "upload"
+    params = {"artifact": job.name, "collection": job.collection}
+    job.body = MultipartFileStream(job.source, job.name)
+    await client.arequest(
+        "POST",
+        "/v1/ingest/file",
+        endpoint=endpoint,
+        content=job.body.aiter_blocks(),
+        headers=job.body.headers,
+        params=params
+    )
+
+
+async def extract_job_text(job, executor):
+    """Extrait le texte dans le pool de processus ; en cas d'échec, le fichier brut sera envoyé"""
+    job.status = "extracting"
+    path, temporary = await asyncio.to_thread(spill_to_file, job.source, job.name)
+    try:
+        loop = asyncio.get_running_loop()
+        job.text, job.metadata = await loop.run_in_executor(executor, extract_text, path, job.name)
+        job.text_size = len(job.text.encode("utf-8"))
+        job.extracted = True
+    except Exception as e:
+        job.fallback_reason = str(e)
+        job.extracted = False
+    finally:
+        if temporary:
+            os.remove(path)
+
+
+async def ingest_preprocessed(client, job, executor):
+    """Envoie le texte extrait localement à /v1/ingest/text (repli sur /v1/ingest/file)"""
+    if job.extracted is None:
+        await extract_job_text(job, executor)
+    job.status = "uploading"
+    if not job.extracted:
+        return await upload_file(client, job)
+    await client.arequest(
+        "POST",
+        "/v1/ingest/text",
+        endpoint="ingest_text",
+        # L'indexation côté serveur reste proportionnelle au volume de texte
+        timeout=client.timeout("upload_large" if job.is_large else "upload"),
+        json={
+            "artifact": job.name,
+            "collection": job.collection,
+            "text": job.text,
+            "metadata": job.metadata,
+        }
+    )
+    job.text = None
+
+
+async def ingest_uri(client, job):
+    """Crée une tâche d'ingestion asynchrone pour une URI et attend sa fin"""
+    response = await client.arequest(
+        "POST",
+        "/v1/async/ingest/uri",
+        endpoint="ingest_async",
+        json={
+            "ingest_body": {
+                "uri": job.uri,
+                "artifact": job.name,
+                "collection": job.collection
+            }
+        }
+    )
+    job.task_id = response.json()["task_id"]
+    job.status = "processing"
+    return await poll_task(client, f"/v1/ingest/tasks/{job.task_id}")
+
+
+async def run_job(client, job, semaphore, max_retries=INGEST_MAX_RETRIES, executor=None):
+    """Exécute un job avec nouvelles tentatives et backoff exponentiel"""
+    async with semaphore:
+        while job.attempts < max_retries:
+            job.attempts += 1
+            job.status = "uploading"
+            try:
+                if job.uri:
+                    await ingest_uri(client, job)
+                elif job.preprocess and executor is not None:
+                    await ingest_preprocessed(client, job, executor)
+                else:
+                    await upload_file(client, job)
+                job.status = "done"
+                job.error = None
+                return job
+            except Exception as e:
+                job.error = e
+                if not _is_retryable(e) or job.attempts >= max_retries:
+                    break
+                job.status = "retrying"
+                delay = min(INGEST_BACKOFF_BASE ** job.attempts, INGEST_BACKOFF_MAX)
+                # Disjoncteur ouvert : pas de nouvelle tentative avant la fin du refroidissement
+                retry_after = getattr(e, "retry_after", None) or 0
+                await asyncio.sleep(max(delay * random.uniform(0.5, 1.0), retry_after))
+        job.status = "failed"
+        return job
+
+
+class IngestionEngine:
+    """Exécute un lot de jobs avec un nombre de workers borné"""
+
+    def __init__(self, client, concurrency=INGEST_CONCURRENCY, max_retries=INGEST_MAX_RETRIES,
+                 preprocess_workers=PREPROCESS_WORKERS):
+        self.client = client
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.preprocess_workers = preprocess_workers
+        self._preprocess_pool = None
+
+    @property
+    def preprocess_pool(self):
+        """Pool de processus d'extraction, créé au premier document à prétraiter"""
+        if self._preprocess_pool is None:
+            self._preprocess_pool = create_pool(self.preprocess_workers)
+        return self._preprocess_pool
+
+    async def run(self, jobs):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # Les jobs déjà terminés avec succès ne sont pas relancés (reprise d'un lot interrompu)
+        pending = [job for job in jobs if job.status != "done"]
+        for job in pending:
+            job.status, job.attempts, job.error = "pending", 0, None
+        executor = self.preprocess_pool if any(job.preprocess for job in pending) else None
+        await asyncio.gather(*(
+            run_job(self.client, job, semaphore, self.max_retries, executor) for job in pending
+        ))
+        return jobs
+
+    def start(self, jobs):
+        """Lance le lot sur la boucle du client ; retourne un concurrent.futures.Future"""
+        return self.client.submit(self.run(jobs))
@@ -0,0 +1,263 @@
+"""Tâches longues exécutées côté serveur via les endpoints /v1/async/*.
+
+Résumés, rapports et ingestions par URI sont créés de façon
+asynchrone (le serveur répond immédiatement avec un task_id) puis suivis en
+tâche de fond : une seule coroutine interroge en parallèle toutes les tâches
+actives, chacune avec son propre intervalle adaptatif. L'état est conservé
+dans SQLite, ce qui le rend visible après un rerun ou un redémarrage. Chaque
+tâche est rattachée à la session qui l'a créée : ses résultats et ses
+notifications ne sont montrés qu'à cette session.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import httpx
+
+from dedup_index import DATA_DIR
+from ingestion import TASK_POLL_INTERVAL, TASK_POLL_MAX_INTERVAL, task_state
+from limiter import Overloaded
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(DATA_DIR, "jobs.sqlite3"))
+JOBS_POLL_CONCURRENCY = int(os.getenv("JOBS_POLL_CONCURRENCY", "16"))
+
+# type de tâche -> (endpoint de création, clé du corps, endpoint de statut)
+TASK_TYPES = {
+    "summarize": ("/v1/async/summarize", "summarize_body", "/v1/summarize/tasks/{task_id}"),
+    "report": ("/v1/async/report", "report_body", "/v1/report/tasks/{task_id}"),
+    "ingest_uri": ("/v1/async/ingest/uri", "ingest_body", "/v1/ingest/tasks/{task_id}"),
+}
+
+
+class TaskJob:
+    """Une tâche serveur suivie par le client"""
+
+    def __init__(self, kind, label, task_id, status="pending", result=None, error=None,
+                 meta=None, created_at=None, updated_at=None, job_id=None, session_id=None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.session_id = session_id
+        self.kind = kind
+        self.label = label
+        self.task_id = task_id
+        self.status = status  # pending | running | completed | failed
+        self.result = result
+        self.error = error
+        self.meta = meta or {}
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+        # Suivi en mémoire uniquement
+        self.interval = TASK_POLL_INTERVAL
+        self.next_poll_at = 0.0
+
+    @property
+    def finished(self):
+        return self.status in ("completed", "failed")
+
+    @property
+    def content(self):
+        """Texte du résultat (résumé, rapport ou message renvoyé tel quel), ou None"""
+        if isinstance(self.result, str):
+            return self.result or None
+        if isinstance(self.result, dict):
+            return self.result.get("summary") or self.result.get("report")
+        return None
+
+    @property
+    def elapsed(self):
+        end = self.updated_at if self.finished else time.time()
+        return end - self.created_at
+
+
+class JobStore:
+    """Table SQLite des tâches, partagée entre sessions et processus"""
+
+    COLUMNS = ("job_id", "session_id", "kind", "label", "task_id", "status", "result", "error", "meta",
+               "created_at", "updated_at")
+
+    def __init__(self, path=JOBS_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY,"
+                " session_id TEXT,"
+                " kind TEXT NOT NULL,"
+                " label TEXT,"
+                " task_id TEXT,"
+                " status TEXT NOT NULL,"
+                " result TEXT,"
+                " error TEXT,"
+                " meta TEXT,"
+                " created_at REAL,"
+                " updated_at REAL)"
+            )
+            # Base créée avant le rattachement des tâches aux sessions
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "session_id" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN session_id TEXT")
+
+    def save(self, job):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                (job.job_id, job.session_id, job.kind, job.label, job.task_id, job.status,
+                 json.dumps(job.result, ensure_ascii=False), job.error,
+                 json.dumps(job.meta, ensure_ascii=False), job.created_at, job.updated_at)
+            )
+
+    def load(self):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs ORDER BY created_at"
+            ).fetchall()
+        jobs = []
+        for row in rows:
+            values = dict(zip(self.COLUMNS, row))
+            values["result"] = json.loads(values["result"]) if values["result"] else None
+            values["meta"] = json.loads(values["meta"]) if values["meta"] else {}
+            jobs.append(TaskJob(**values))
+        return jobs
+
+    def delete(self, job_ids):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+
+
+class JobManager:
+    """Crée les tâches asynchrones et suit leur avancement sur la boucle du client"""
+
+    def __init__(self, client, store=None, on_complete=None,
+                 interval=TASK_POLL_INTERVAL, max_interval=TASK_POLL_MAX_INTERVAL,
+                 concurrency=JOBS_POLL_CONCURRENCY):
+        self.client = client
+        self.store = store or JobStore()
+        self.on_complete = on_complete
+        self.interval = interval
+        self.max_interval = max_interval
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self._jobs = {job.job_id: job for job in self.store.load()}
+        self._poller = None
+        self._wakeup = None
+        # Reprise du suivi des tâches encore actives (ex. après un redémarrage)
+        if any(not job.finished for job in self._jobs.values()):
+            self._ensure_poller()
+
+    def submit(self, kind, body, label, meta=None, session_id=None):
+        """Crée la tâche côté serveur et retourne le TaskJob (sans attendre sa fin)"""
+        path, key, _ = TASK_TYPES[kind]
+        response = self.client.request("POST", path, endpoint="async", json={key: body})
+        job = TaskJob(kind, label, response.json()["task_id"], meta=meta, session_id=session_id)
+        job.interval = self.interval
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self.store.save(job)
+        self._ensure_poller()
+        return job
+
+    def jobs(self, session_id):
+        """Tâches de la session, les plus récentes en premier"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.session_id == session_id]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def active(self, session_id):
+        return [job for job in self.jobs(session_id) if not job.finished]
+
+    def clear_finished(self, session_id):
+        with self._lock:
+            finished = [
+                job_id for job_id, job in self._jobs.items() if job.finished and job.session_id == session_id
+            ]
+            for job_id in finished:
+                del self._jobs[job_id]
+        self.store.delete(finished)
+        return len(finished)
+
+    def _ensure_poller(self):
+        with self._lock:
+            if self._poller is not None and not self._poller.done():
+                if self._wakeup is not None:
+                    self.client._ensure_loop().call_soon_threadsafe(self._wakeup.set)
+                return
+            self._poller = self.client.submit(self._poll_loop())
+
+    async def _poll_one(self, job, semaphore):
+        _, _, status_path = TASK_TYPES[job.kind]
+        async with semaphore:
+            try:
+                response = await self.client.arequest("GET", status_path.format(task_id=job.task_id), endpoint="tasks")
+                status = response.json()
+                if not isinstance(status, dict):
+                    raise ValueError(f"objet JSON attendu, reçu {type(status).__name__}")
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 404:
+                    # Tâche inconnue du serveur (ex. redémarré depuis sa création)
+                    status = {"task_status": "failed", "task_result": "Tâche introuvable sur le serveur"}
+                else:
+                    job.error = str(e)
+                    status = None
+            except (httpx.TransportError, Overloaded) as e:
+                # Erreur transitoire : nouvelle tentative au prochain intervalle
+                job.error = str(e)
+                status = None
+            except Exception as e:
+                # Réponse inexploitable (JSON invalide...) : seule cette tâche échoue, le suivi continue
+                status = {"task_status": "failed", "task_result": f"Réponse de suivi invalide : {e}"}
+        now = time.time()
+        state = task_state(status) if status is not None else None
+        if state == "completed":
+            job.status, job.result, job.error = "completed", status.get("task_result"), None
+        elif state == "failed":
+            job.status, job.error = "failed", str(status.get("task_result") or "Tâche en échec")
+        elif state == "running" or state == "pending":
+            job.status = state
+        job.updated_at = now
+        job.interval = min(job.interval * 1.5, self.max_interval)
+        job.next_poll_at = time.monotonic() + job.interval
+        self.store.save(job)
+        if job.finished and self.on_complete:
+            try:
+                self.on_complete(job)
+            except Exception:
+                logging.exception("Erreur dans le rappel de fin de la tâche %s", job.job_id)
+
+    async def _poll_loop(self):
+        self._wakeup = asyncio.Event()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            with self._lock:
+                active = [job for job in self._jobs.values() if not job.finished]
+                if not active:
+                    # Sous le verrou : une tâche soumise ensuite relancera un nouveau suivi
+                    self._poller = None
+                    break
+            now = time.monotonic()
+            due = [job for job in active if job.next_poll_at <= now]
+            if due:
+                # Une erreur sur une tâche ne doit pas interrompre le suivi des autres
+                results = await asyncio.gather(*(self._poll_one(job, semaphore) for job in due),
+                                               return_exceptions=True)
+                for job, result in zip(due, results):
+                    if isinstance(result, Exception):
+                        logging.error("Suivi de la tâche %s en échec : %s", job.job_id, result)
+                        job.status, job.error, job.updated_at = "failed", str(result), time.time()
+                continue
+            # Attente jusqu'à la prochaine échéance, interrompue par une nouvelle tâche
+            delay = min(job.next_poll_at for job in active) - now
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,350 @@
+"""Limitation adaptative de la concurrence vers l'API Zylon.
+
+Un limiteur par classe d'endpoint (chat, embeddings, ingestion), partagé par
+toutes les sessions du processus via le client mutualisé. La limite de requêtes
+simultanées suit un schéma AIMD : +1/limite à chaque succès, réduction
+multiplicative sur 5xx, 429 ou timeout. Les requêtes en surplus attendent dans
+une file FIFO avec échéance, et un disjoncteur refuse les appels pendant un
+temps de refroidissement après des échecs consécutifs.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+import httpx
+
+LIMITER_ENABLED = os.getenv("ZYLON_LIMITER", "1") != "0"
+LIMITER_BACKOFF = float(os.getenv("ZYLON_LIMIT_BACKOFF", "0.7"))
+BREAKER_FAILURES = int(os.getenv("ZYLON_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("ZYLON_BREAKER_COOLDOWN", "15.0"))
+
+# Classe de limitation de chaque type d'endpoint ; les autres (liste, statut des tâches...) ne sont pas limités
+ENDPOINT_CLASSES = {
+    "chat": "chat",
+    "summarize": "chat",
+    "bulk_rag": "chat",
+    "embeddings": "embeddings",
+    "chunks": "embeddings",
+    "upload": "ingestion",
+    "upload_large": "ingestion",
+    "ingest_text": "ingestion",
+    "ingest_async": "ingestion",
+}
+
+# classe -> (limite initiale, minimale, maximale, attente maximale dans la file en secondes)
+DEFAULT_LIMITS = {
+    "chat": (8, 1, 64, 60.0),
+    "embeddings": (16, 2, 128, 20.0),
+    "ingestion": (4, 1, 16, 600.0),
+}
+
+# Réponses signalant un backend saturé
+OVERLOAD_STATUS = {429, 500, 502, 503, 504}
+
+OK = "ok"
+ERROR = "error"  # erreur sans rapport avec la charge (4xx...) : limite inchangée
+OVERLOAD = "overload"
+
+
+class Overloaded(Exception):
+    """Requête refusée côté client pour protéger le backend"""
+
+    retry_after = None
+
+
+class QueueTimeout(Overloaded):
+    """L'échéance est passée avant qu'une place se libère"""
+
+
+class CircuitOpen(Overloaded):
+    """Disjoncteur ouvert après des échecs répétés"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def outcome_of(error):
+    """Classe le résultat d'une requête : ok, erreur ordinaire ou surcharge du backend"""
+    if error is None:
+        return OK
+    if isinstance(error, httpx.HTTPStatusError):
+        return OVERLOAD if error.response.status_code in OVERLOAD_STATUS else ERROR
+    if isinstance(error, httpx.TransportError):
+        return OVERLOAD
+    return ERROR
+
+
+class _Waiter:
+    __slots__ = ("granted", "error", "event", "loop", "future")
+
+    def __init__(self, loop=None):
+        self.granted = False
+        self.error = None
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def notify(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AdaptiveLimiter:
+    """Limite AIMD, file d'attente et disjoncteur d'une classe d'endpoints"""
+
+    def __init__(self, name, initial, min_limit, max_limit, queue_timeout,
+                 backoff=LIMITER_BACKOFF, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        # Disjoncteur : closed | open | half_open (une seule requête d'essai)
+        self.state = "closed"
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._probe = None  # waiter porteur de la requête d'essai en half_open
+        # Compteurs
+        self.rejected = 0
+        self.timeouts = 0
+        self.queued = 0
+
+    # --- Sous verrou --------------------------------------------------------
+
+    def _check_breaker(self, waiter):
+        if self.state == "open":
+            remaining = self._open_until - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpen(
+                    f"API saturée ({self.name}) : nouvelles requêtes suspendues pendant {remaining:.0f} s",
+                    remaining
+                )
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probe is not None:
+                self.rejected += 1
+                raise CircuitOpen(f"API saturée ({self.name}) : requête d'essai en cours", 1.0)
+            self._probe = waiter
+
+    def _has_room(self):
+        return self.in_flight < max(int(self.limit), self.min_limit)
+
+    def _grant_waiters(self):
+        while self._queue and self._has_room():
+            waiter = self._queue.popleft()
+            waiter.granted = True
+            self.in_flight += 1
+            waiter.notify()
+
+    def _open_circuit(self):
+        self.state = "open"
+        self._open_until = time.monotonic() + self.cooldown
+        # Une nouvelle requête d'essai sera admise à la fin du délai
+        self._probe = None
+        # Les requêtes en attente échouent immédiatement au lieu d'attendre leur échéance
+        error = CircuitOpen(f"API saturée ({self.name}) : requêtes suspendues", self.cooldown)
+        while self._queue:
+            waiter = self._queue.popleft()
+            waiter.error = error
+            waiter.notify()
+
+    def _enqueue(self, waiter):
+        self._check_breaker(waiter)
+        if not self._queue and self._has_room():
+            self.in_flight += 1
+            waiter.granted = True
+        else:
+            self.queued += 1
+            self._queue.append(waiter)
+
+    def _abandon(self, waiter):
+        """Retire un waiter dont l'échéance est passée ; retourne True s'il a obtenu sa place entre-temps"""
+        if waiter.granted:
+            return True
+        if waiter in self._queue:
+            self._queue.remove(waiter)
+        # Seul l'abandon de la requête d'essai elle-même en autorise une autre
+        if self._probe is waiter:
+            self._probe = None
+        return False
+
+    # --- Acquisition / libération -------------------------------------------
+
+    def position(self, waiter):
+        with self._lock:
+            try:
+                return self._queue.index(waiter) + 1
+            except ValueError:
+                return 0
+
+    def acquire(self, timeout=None, on_wait=None):
+        """Attend une place (thread appelant bloqué) ; on_wait(position) est appelé pendant l'attente"""
+        waiter = _Waiter()
+        deadline = time.monotonic() + (timeout if timeout is not None else self.queue_timeout)
+        with self._lock:
+            self._enqueue(waiter)
+        last_position = None
+        while not waiter.granted and waiter.error is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._lock:
+                    if self._abandon(waiter):
+                        break
+                    self.timeouts += 1
+                raise QueueTimeout(f"API saturée ({self.name}) : aucune place libérée à temps")
+            if on_wait is not None:
+                position = self.position(waiter)
+                if position and position != last_position:
+                    on_wait(position)
+                    last_position = position
+            waiter.event.wait(min(remaining, 0.5))
+        if waiter.error is not None:
+            raise waiter.error
+
+    async def aacquire(self, timeout=None):
+        """Équivalent asynchrone de acquire(), à appeler depuis une boucle asyncio"""
+        waiter = _Waiter(asyncio.get_running_loop())
+        with self._lock:
+            self._enqueue(waiter)
+        if not waiter.granted:
+            try:
+                await asyncio.wait_for(waiter.future, timeout if timeout is not None else self.queue_timeout)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    if not self._abandon(waiter):
+                        self.timeouts += 1
+                        raise QueueTimeout(f"API saturée ({self.name}) : aucune place libérée à temps")
+            except asyncio.CancelledError:
+                with self._lock:
+                    if self._abandon(waiter):
+                        self._release_slot(waiter)
+                raise
+        if waiter.error is not None:
+            raise waiter.error
+
+    def _release_slot(self, waiter):
+        """Place obtenue mais inutilisée (annulation)"""
+        if self._probe is waiter:
+            self._probe = None
+        self.in_flight -= 1
+        self._grant_waiters()
+
+    def release(self, started_at, outcome):
+        with self._lock:
+            self.in_flight -= 1
+            if outcome == OVERLOAD:
+                # Une seule réduction par vague d'échecs : seules comptent les requêtes
+                # parties après la réduction précédente
+                if started_at >= self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = time.monotonic()
+                self._consecutive_failures += 1
+                if self.state == "half_open" or self._consecutive_failures >= self.failures:
+                    self._open_circuit()
+            else:
+                if outcome == OK:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self._consecutive_failures = 0
+                if self.state == "half_open":
+                    self.state = "closed"
+            # La requête d'essai éventuelle est terminée : circuit refermé ou rouvert
+            self._probe = None
+            self._grant_waiters()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queue": len(self._queue),
+                "state": self.state,
+                "queued": self.queued,
+                "queue_timeouts": self.timeouts,
+                "rejected": self.rejected,
+            }
+
+
+def load_limiters():
+    """Construit les limiteurs par classe en tenant compte des variables d'environnement"""
+    limiters = {}
+    for name, (initial, min_limit, max_limit, queue_timeout) in DEFAULT_LIMITS.items():
+        prefix = f"ZYLON_LIMIT_{name.upper()}"
+        limiters[name] = AdaptiveLimiter(
+            name,
+            initial=float(os.getenv(f"{prefix}_INITIAL", initial)),
+            min_limit=int(os.getenv(f"{prefix}_MIN", min_limit)),
+            max_limit=int(os.getenv(f"{prefix}_MAX", max_limit)),
+            queue_timeout=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT", queue_timeout)),
+        )
+    return limiters
+
+
+class ConcurrencyLimiter:
+    """Ensemble des limiteurs du client, sélectionnés par type d'endpoint"""
+
+    def __init__(self, limiters=None):
+        self.limiters = limiters if limiters is not None else load_limiters()
+
+    def for_endpoint(self, endpoint):
+        return self.limiters.get(ENDPOINT_CLASSES.get(endpoint))
+
+    @contextmanager
+    def slot(self, endpoint, on_wait=None):
+        """Occupe une place pendant la requête (flux compris) et ajuste la limite selon son issue
+
+        Produit le temps passé dans la file (None si l'endpoint n'est pas limité).
+        """
+        limiter = self.for_endpoint(endpoint)
+        if limiter is None:
+            yield None
+            return
+        queued_at = time.monotonic()
+        limiter.acquire(on_wait=on_wait)
+        started_at = time.monotonic()
+        error = None
+        try:
+            yield started_at - queued_at
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            limiter.release(started_at, outcome_of(error))
+
+    @asynccontextmanager
+    async def aslot(self, endpoint):
+        limiter = self.for_endpoint(endpoint)
+        if limiter is None:
+            yield None
+            return
+        queued_at = time.monotonic()
+        await limiter.aacquire()
+        started_at = time.monotonic()
+        error = None
+        try:
+            yield started_at - queued_at
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            limiter.release(started_at, outcome_of(error))
+
+    def snapshot(self):
+        return {name: limiter.snapshot() for name, limiter in self.limiters.items()}
@@ -0,0 +1,138 @@
+"""Conditions d'arrêt des tests de charge et relevé du point de saturation.
+
+Sur le processus qui agrège les mesures (master en mode distribué, ou
+processus unique), un greenlet évalue à intervalle régulier le p95 du TTFT et
+le taux d'erreur sur la dernière fenêtre (et non depuis le début du test) ;
+chaque relevé est conservé dans une chronologie exportée avec le rapport, et
+le test est arrêté dès qu'un seuil est dépassé.
+"""
+import logging
+import time
+
+import gevent
+
+from streaming_metrics import LatencyHistogram
+
+# Code de sortie d'un test arrêté par une condition (distinct des erreurs Locust)
+STOP_CONDITION_EXIT_CODE = 3
+# Entrées de statistiques qui ne sont pas des requêtes HTTP : mesures des flux (TTFT, ITL)
+# et arrivées abandonnées par le générateur
+STREAM_REQUEST_TYPE = "STREAM"
+NON_HTTP_REQUEST_TYPES = {STREAM_REQUEST_TYPE, "WORKLOAD"}
+
+
+def http_totals(stats):
+    """Nombre cumulé de requêtes HTTP et d'échecs"""
+    requests = failures = 0
+    for (_, method), entry in stats.entries.items():
+        if method not in NON_HTTP_REQUEST_TYPES:
+            requests += entry.num_requests
+            failures += entry.num_failures
+    return requests, failures
+
+
+def window_histogram(current, previous):
+    """Histogramme des valeurs enregistrées entre deux sérialisations (to_dict) cumulatives"""
+    previous_counts = dict(map(tuple, previous["counts"])) if previous else {}
+    histogram = LatencyHistogram()
+    for bucket, count in current["counts"]:
+        count -= previous_counts.get(bucket, 0)
+        if count > 0:
+            histogram.counts[bucket] = count
+            histogram.total += count
+            histogram.max = max(histogram.max, bucket)
+    return histogram
+
+
+class SaturationMonitor:
+    """Relevés périodiques (utilisateurs, débit, p95 TTFT, erreurs) et arrêt sur seuil"""
+
+    def __init__(self, environment, streaming_metrics, max_p95_ttft_ms=0.0, max_error_rate=0.0,
+                 min_requests=20, interval=10.0):
+        self.environment = environment
+        self.streaming_metrics = streaming_metrics
+        self.max_p95_ttft_ms = max_p95_ttft_ms
+        self.max_error_rate = max_error_rate
+        self.min_requests = min_requests
+        self.interval = interval
+        self.timeline = []
+        self.stop_condition = None
+        self._previous_metrics = None
+        self._previous_requests = 0
+        self._previous_failures = 0
+        self._greenlet = None
+
+    @property
+    def enabled(self):
+        return bool(self.max_p95_ttft_ms or self.max_error_rate)
+
+    def start(self):
+        self.timeline, self.stop_condition = [], None
+        self._previous_metrics = None
+        self._previous_requests = self._previous_failures = 0
+        if self._greenlet is None or self._greenlet.dead:
+            self._greenlet = gevent.spawn(self._run)
+
+    def stop(self):
+        if self._greenlet is not None and self._greenlet is not gevent.getcurrent():
+            self._greenlet.kill(block=False)
+        self._greenlet = None
+
+    def _run(self):
+        while True:
+            gevent.sleep(self.interval)
+            reason = self.check()
+            if reason:
+                self._trip(reason)
+                return
+
+    def check(self):
+        """Ajoute un relevé à la chronologie ; retourne la condition dépassée, le cas échéant"""
+        runner = self.environment.runner
+        total_requests, total_failures = http_totals(runner.stats)
+        requests = total_requests - self._previous_requests
+        failures = total_failures - self._previous_failures
+        self._previous_requests, self._previous_failures = total_requests, total_failures
+
+        metrics = self.streaming_metrics.to_dict()
+        ttft = window_histogram(metrics["histograms"]["ttft_ms"],
+                                self._previous_metrics["histograms"]["ttft_ms"] if self._previous_metrics else None)
+        self._previous_metrics = metrics
+
+        point = {
+            "time": time.time(),
+            "users": runner.user_count,
+            "requests": requests,
+            "rps": requests / self.interval,
+            "error_rate": failures / requests if requests else 0.0,
+            "streams": ttft.total,
+            "ttft_p95_ms": ttft.percentile(95),
+        }
+        self.timeline.append(point)
+        logging.info(
+            "Fenêtre : %s utilisateurs, %.1f req/s, erreurs %.1f%%, TTFT p95=%s ms",
+            point["users"], point["rps"], point["error_rate"] * 100, point["ttft_p95_ms"]
+        )
+
+        if self.max_error_rate and requests >= self.min_requests and point["error_rate"] > self.max_error_rate:
+            return f"taux d'erreur {point['error_rate']:.1%} > {self.max_error_rate:.1%}"
+        if (self.max_p95_ttft_ms and ttft.total >= self.min_requests
+                and point["ttft_p95_ms"] > self.max_p95_ttft_ms):
+            return f"TTFT p95 {point['ttft_p95_ms']:.0f} ms > {self.max_p95_ttft_ms:.0f} ms"
+        return None
+
+    def _trip(self, reason):
+        self.stop_condition = {"reason": reason, **self.timeline[-1]}
+        logging.warning(
+            "Condition d'arrêt atteinte avec %s utilisateurs : %s", self.timeline[-1]["users"], reason
+        )
+        self.environment.process_exit_code = STOP_CONDITION_EXIT_CODE
+        options = self.environment.parsed_options
+        if options is not None and options.headless:
+            self.environment.runner.quit()
+        else:
+            self.environment.runner.stop()
+
+    def report(self):
+        """Éléments ajoutés au rapport JSON des métriques de streaming"""
+        return {"stop_condition": self.stop_condition, "timeline": self.timeline}
@@ -1,10 +1,17 @@
-from locust import HttpUser, task, between
-import json
-import random
+from locust import HttpUser, task, between, constant, events
+from locust.exception import StopUser
+from locust.runners import WorkerRunner
+from gevent.pool import Pool
+from requests.exceptions import RequestException
 import os
+import uuid
 from dotenv import load_dotenv
 import time
 import logging
+from streaming_metrics import StreamingMetrics, StreamTimer
+from load_control import SaturationMonitor, STREAM_REQUEST_TYPE
+from workload import ArrivalSchedule, workload_from_env
+import sse
 
 # Chargement des variables d'environnement
 load_dotenv()
@@ -14,16 +21,143 @@ API_URL = os.getenv("URL")
 if not API_URL: 
     raise ValueError("L'URL de l'API n'est pas définie dans le fichier .env")
 
+# Répertoire des rapports (absent d'un dépôt fraîchement cloné) : créé dès l'import du locustfile,
+# car Locust ouvre les fichiers --csv avant de déclencher l'événement init
+RESULTS_DIR = "results"
+os.makedirs(RESULTS_DIR, exist_ok=True)
+
+# Préfixe des fichiers d'export des métriques de streaming (<prefix>.json / <prefix>.csv)
+STREAMING_METRICS_OUTPUT = os.getenv("STREAMING_METRICS_OUTPUT", os.path.join(RESULTS_DIR, "streaming_metrics"))
+
+# Mode de génération de charge : "closed" (utilisateurs avec temps d'attente),
+# "poisson" (arrivées de Poisson au débit WORKLOAD_RATE req/s) ou "trace" (horodatages de la trace)
+WORKLOAD_MODE = os.getenv("WORKLOAD_MODE", "closed")
+WORKLOAD_RATE = float(os.getenv("WORKLOAD_RATE", "1.0"))
+WORKLOAD_SPEEDUP = float(os.getenv("WORKLOAD_SPEEDUP", "1.0"))
+WORKLOAD_MAX_IN_FLIGHT = int(os.getenv("WORKLOAD_MAX_IN_FLIGHT", "200"))
+WORKLOAD_WAIT_MIN = float(os.getenv("WORKLOAD_WAIT_MIN", "45"))
+WORKLOAD_WAIT_MAX = float(os.getenv("WORKLOAD_WAIT_MAX", "180"))
+LOAD_TEST_COLLECTION = os.getenv("LOAD_TEST_COLLECTION", "chat_documents")
+
 logging.basicConfig(level=logging.INFO)
 
-class ChatUser(HttpUser):
+# Source des scénarios (trace JSONL lue au fil de l'eau ou mélange pondéré) et instants d'arrivée
+workload = workload_from_env()
+arrival_schedule = ArrivalSchedule(workload, mode=WORKLOAD_MODE, rate=WORKLOAD_RATE, speedup=WORKLOAD_SPEEDUP)
+
+# Métriques de streaming agrégées sur toutes les requêtes du processus
+# (en mode distribué, celles des workers sont fusionnées sur le master)
+streaming_metrics = StreamingMetrics()
+
+# Relevés par fenêtre et conditions d'arrêt, évalués par le master (ou le processus unique)
+saturation_monitor = None
+
+
+@events.init_command_line_parser.add_listener
+def on_command_line_parser(parser):
+    """Options des exécutions sans interface, utilisables aussi dans un fichier --config"""
+    group = parser.add_argument_group("Conditions d'arrêt")
+    group.add_argument("--max-p95-ttft", type=float, default=0, env_var="LOCUST_MAX_P95_TTFT",
+                       help="Arrête le test si le p95 du TTFT d'une fenêtre dépasse cette valeur (ms, 0 : désactivé)")
+    group.add_argument("--max-error-rate", type=float, default=0, env_var="LOCUST_MAX_ERROR_RATE",
+                       help="Arrête le test si le taux d'erreur d'une fenêtre dépasse cette valeur (0.05 = 5%%)")
+    group.add_argument("--stop-check-interval", type=float, default=10, env_var="LOCUST_STOP_CHECK_INTERVAL",
+                       help="Durée d'une fenêtre de relevé (s)")
+    group.add_argument("--stop-min-requests", type=int, default=20, env_var="LOCUST_STOP_MIN_REQUESTS",
+                       help="Nombre minimal de requêtes HTTP (ou de flux pour le TTFT) dans la fenêtre pour évaluer les seuils")
+
+
+def is_worker(environment):
+    return isinstance(environment.runner, WorkerRunner)
+
+
+def export_streaming_metrics():
+    extra = saturation_monitor.report() if saturation_monitor is not None else None
+    return streaming_metrics.export(STREAMING_METRICS_OUTPUT, extra)
+
+
+@events.test_start.add_listener
+def on_test_start(environment, **kwargs):
+    """Remise à zéro des métriques au début de chaque test"""
+    streaming_metrics.reset()
+    if saturation_monitor is not None and not is_worker(environment):
+        saturation_monitor.start()
+
+
+@events.reset_stats.add_listener
+def on_reset_stats(**kwargs):
+    streaming_metrics.reset()
+
+
+@events.report_to_master.add_listener
+def on_report_to_master(client_id, data):
+    """Worker : envoi des mesures accumulées depuis le rapport précédent"""
+    data["streaming_metrics"] = streaming_metrics.drain()
+
+
+@events.worker_report.add_listener
+def on_worker_report(client_id, data):
+    """Master : fusion des mesures reçues des workers"""
+    if "streaming_metrics" in data:
+        streaming_metrics.merge(data["streaming_metrics"])
+
+
+@events.quitting.add_listener
+def on_quitting(environment, **kwargs):
+    """Master : nouvel export incluant les derniers rapports reçus des workers après l'arrêt"""
+    if environment.parsed_options and environment.parsed_options.master:
+        export_streaming_metrics()
+
+
+@events.test_stop.add_listener
+def on_test_stop(environment, **kwargs):
+    """Export des métriques de streaming en fin de test"""
+    if is_worker(environment):
+        return
+    if saturation_monitor is not None:
+        saturation_monitor.stop()
+    summary = export_streaming_metrics()
+    logging.info(
+        "Streaming : %s requêtes, TTFT p50=%s ms p95=%s ms, ITL p95=%s ms, débit p50=%s tokens/s",
+        summary["requests"],
+        summary["ttft_ms"]["p50"],
+        summary["ttft_ms"]["p95"],
+        summary["itl_ms"]["p95"],
+        summary["tokens_per_s"]["p50"],
+    )
+
+
+@events.init.add_listener
+def on_init(environment, **kwargs):
+    """Suivi des conditions d'arrêt et exposition des métriques de streaming dans l'interface web"""
+    global saturation_monitor
+    options = environment.parsed_options
+    # Répertoire du rapport HTML, écrit en fin de test
+    if options is not None and options.html_file and os.path.dirname(options.html_file):
+        os.makedirs(os.path.dirname(options.html_file), exist_ok=True)
+    if options is not None and not options.worker:
+        saturation_monitor = SaturationMonitor(
+            environment,
+            streaming_metrics,
+            max_p95_ttft_ms=options.max_p95_ttft,
+            max_error_rate=options.max_error_rate,
+            min_requests=options.stop_min_requests,
+            interval=options.stop_check_interval,
+        )
+        # Chronologie relevée dans les exécutions sans interface ou lorsqu'un seuil est défini
+        if not (options.headless or saturation_monitor.enabled):
+            saturation_monitor = None
+    if environment.web_ui:
+        @environment.web_ui.app.route("/streaming-metrics")
+        def streaming_metrics_route():
+            return streaming_metrics.summary()
+
+
+class ZylonUser(HttpUser):
+    """Actions élémentaires sur l'API Zylon, communes aux différents modes de charge"""
+    abstract = True
     host = os.getenv("URL") # URL de l'API
-    wait_time = between(45, 180)  # Temps d'attente entre les requêtes
-    total_tokens = 0  # Variable pour suivre le nombre total de tokens
-    start_time = time.time()  # Temps de début pour le calcul des tokens par seconde
-    first_token_time = None  # Temps pour le premier token
-    last_token_time = None  # Temps du dernier token
-    
+
     def on_start(self):
         """Initialisation de l'utilisateur"""
         if not self.host:
@@ -34,31 +168,67 @@ class ChatUser(HttpUser):
         }
         if not self.client:
             raise ValueError("Le client HTTP n'a pas été initialisé.")
-        
-    @task(3)
-    def send_chat_message(self):
-        """Simulation d'envoi de message"""
+        # Artefacts créés par cet utilisateur, supprimés par les scénarios "delete"
+        self.artifacts = []
+
+    def run_scenario(self, scenario):
+        """Exécute un scénario issu de la trace ou du mélange synthétique"""
+        scenario_type = scenario["type"]
+        if scenario_type == "chat":
+            self.send_chat_message(scenario.get("messages") or scenario.get("prompt"))
+        elif scenario_type == "conversation":
+            self.run_conversation(scenario["turns"], scenario.get("think_time", 0))
+        elif scenario_type == "chunks":
+            self.search_chunks(scenario["text"])
+        elif scenario_type == "embeddings":
+            self.generate_embeddings(scenario["input"])
+        elif scenario_type == "ingest_text":
+            self.ingest_text(scenario["text"], scenario.get("artifact"))
+        elif scenario_type == "delete":
+            self.delete_document(scenario.get("artifact"))
+        elif scenario_type == "bulk_rag":
+            self.bulk_rag(scenario["queries"], scenario.get("prompt"))
+        else:
+            self.list_documents()
+
+    def run_conversation(self, turns, think_time=0):
+        """Conversation multi-tours : chaque réponse est ajoutée à l'historique du tour suivant"""
+        history = []
+        for turn in turns:
+            history.append({"role": "user", "content": turn})
+            answer = self.send_chat_message(history)
+            if answer is None:
+                return
+            history.append({"role": "assistant", "content": answer})
+            if think_time:
+                time.sleep(think_time)
+
+    def send_chat_message(self, prompt="Bonjour, comment allez-vous?"):
+        """Simulation d'envoi de message ; retourne le texte de la réponse (None en cas d'échec)"""
         logging.info("Envoi d'un message de chat...")
         messages = [
             {
                 "role": "system",
                 "content": "You are a helpful assistant."
-            },
-            {
-                "role": "user",
-                "content": "Bonjour, comment allez-vous?"
             }
         ]
+        if isinstance(prompt, list):
+            messages.extend(prompt)
+        else:
+            messages.append({"role": "user", "content": prompt})
         
         data = {
             "messages": messages,
             "use_context": True,
             "context_filter": {
-                "collection": "chat_documents"
+                "collection": LOAD_TEST_COLLECTION
             },
             "stream": True
         }
         
+        timer = StreamTimer()
+        failed = True
+        answer = []
         with self.client.post(
             "/v1/chat/completions",
             json=data,
@@ -69,56 +239,62 @@ class ChatUser(HttpUser):
         ) as response:
             logging.info(f"Réponse reçue : {response.status_code}")
             if response.status_code == 200:
+                decoder = sse.SSEDecoder()
+                error = None
+                # Blocs bruts tels que reçus : le décodage se fait sur les octets, sans passer par des lignes str
                 try:
-                    for line in response.iter_lines():
-                        if line:
-                            # Traitez chaque ligne comme un événement
-                            line_data = line.decode('utf-8')
-                            if line_data.startswith('data: '):
-                                json_data = json.loads(line_data[6:])  # Ignorez le préfixe 'data: '
-                                # Traitez les données JSON ici
-                                if 'usage' in json_data:
-                                    input_tokens = json_data['usage'].get('input_tokens', 0)
-                                    output_tokens = json_data['usage'].get('output_tokens', 0)
-                                    self.total_tokens += (input_tokens + output_tokens)
-
-                                    # Enregistrez le temps du premier token
-                                    if self.first_token_time is None:
-                                        self.first_token_time = time.time()
-
-                                    # Enregistrez le temps du dernier token
-                                    self.last_token_time = time.time()
-
-                                    self.log_tokens_per_second()
-                                # Vous pouvez également gérer d'autres types d'événements ici
+                    for event in decoder.iter_events(response.iter_content(chunk_size=None)):
+                        if event.kind == sse.TEXT:
+                            timer.on_token()
+                            answer.append(event.text)
+                        elif event.kind == sse.USAGE:
+                            timer.on_usage(event.usage)
+                        elif event.kind == sse.ERROR:
+                            error = event.error
+                except RequestException as e:
+                    error = f"flux interrompu ({e})"
+                if error is not None:
+                    response.failure(f"Erreur signalée dans le flux : {error}")
+                elif decoder.malformed:
+                    response.failure(f"{decoder.malformed} trame(s) SSE illisible(s) sur {decoder.events + decoder.malformed}")
+                else:
                     response.success()
-                except json.JSONDecodeError:
-                    response.failure(f"Erreur de décodage JSON : {response.text}")
+                    failed = False
             else:
                 response.failure(f"Échec avec le code {response.status_code}. Contenu : {response.text}")
-    
-    def log_tokens_per_second(self):
-        """Affiche le nombre de tokens par seconde et d'autres métriques"""
-        elapsed_time = time.time() - self.start_time
-        if elapsed_time > 0:
-            tokens_per_second = self.total_tokens / elapsed_time
-            print(f"Tokens par seconde : {tokens_per_second:.2f}")
-
-            # Calculer le temps pour le premier token
-            if self.first_token_time:
-                ttft = self.first_token_time - self.start_time
-                print(f"Temps pour le premier token (TTFT) : {ttft:.2f} secondes")
-
-            # Calculer la latence entre les tokens
-            if self.last_token_time and self.first_token_time:
-                itl = self.last_token_time - self.first_token_time
-                print(f"Latence entre les tokens (ITL) : {itl:.2f} secondes")
-
-    @task(1)
+
+        # TTFT / ITL / débit : histogrammes dédiés ; TTFT et ITL aussi dans les statistiques Locust
+        streaming_metrics.record(timer, failed=failed)
+        if not failed:
+            self.report_stream_metrics(timer)
+        return None if failed else "".join(answer)
+
+    def report_stream_metrics(self, timer):
+        """Publie TTFT et ITL moyenne (ms) comme entrées STREAM des statistiques Locust (percentiles,
+        CSV, rapport HTML) ; le débit en tokens/s n'étant pas une durée, il reste dans streaming_metrics"""
+        if timer.ttft is not None:
+            events.request.fire(
+                request_type=STREAM_REQUEST_TYPE,
+                name="TTFT",
+                response_time=timer.ttft * 1000,
+                response_length=0,
+                exception=None,
+                context={},
+            )
+        if timer.inter_token:
+            events.request.fire(
+                request_type=STREAM_REQUEST_TYPE,
+                name="ITL (moyenne par requête)",
+                response_time=sum(timer.inter_token) / len(timer.inter_token) * 1000,
+                response_length=0,
+                exception=None,
+                context={},
+            )
+
     def list_documents(self):
         """Simulation de liste des documents"""
         params = {
-            "collection": "chat_documents",
+            "collection": LOAD_TEST_COLLECTION,
             "page": 1,
             "per_page": 20
         }
@@ -133,4 +309,123 @@ class ChatUser(HttpUser):
             if response.status_code == 200:
                 response.success()
             else:
-                response.failure(f"Échec avec le code {response.status_code}") 
\ No newline at end of file
+                response.failure(f"Échec avec le code {response.status_code}")
+
+    def post_json(self, path, data, name):
+        """POST JSON avec marquage succès / échec ; retourne la réponse décodée ou None"""
+        with self.client.post(
+            path,
+            json=data,
+            headers=self.headers,
+            name=name,
+            catch_response=True
+        ) as response:
+            if response.status_code == 200:
+                response.success()
+                try:
+                    return response.json()
+                except ValueError:
+                    return None
+            response.failure(f"Échec avec le code {response.status_code}. Contenu : {response.text}")
+            return None
+
+    def search_chunks(self, text):
+        """Simulation de recherche de chunks"""
+        return self.post_json(
+            "/v1/chunks",
+            {"text": text, "context_filter": {"collection": LOAD_TEST_COLLECTION}, "limit": 5},
+            "Chunks"
+        )
+
+    def generate_embeddings(self, text):
+        """Simulation de calcul d'embeddings (texte ou liste de textes)"""
+        return self.post_json("/v1/embeddings", {"input": text}, "Embeddings")
+
+    def ingest_text(self, text, artifact=None):
+        """Simulation d'ingestion de texte ; l'artefact est mémorisé pour une suppression ultérieure"""
+        artifact = artifact or f"locust-{uuid.uuid4().hex}"
+        result = self.post_json(
+            "/v1/ingest/text",
+            {"text": text, "artifact": artifact, "collection": LOAD_TEST_COLLECTION},
+            "Ingest Text"
+        )
+        if result is not None:
+            self.artifacts.append(artifact)
+        return result
+
+    def delete_document(self, artifact=None):
+        """Simulation de suppression (par défaut, du dernier artefact créé par cet utilisateur)"""
+        if artifact is None:
+            if not self.artifacts:
+                return None
+            artifact = self.artifacts.pop()
+        return self.post_json(
+            "/v1/delete",
+            {"collection": LOAD_TEST_COLLECTION, "artifact": artifact},
+            "Delete"
+        )
+
+    def bulk_rag(self, queries, prompt=None):
+        """Simulation d'un lot de questions RAG"""
+        return self.post_json(
+            "/v1/qa/bulk-rag",
+            [{
+                "prompt": prompt or "Réponds aux questions à partir du contexte fourni.",
+                "queries": queries,
+                "artifact_input": {"type": "ingest", "value": {"collection": LOAD_TEST_COLLECTION}},
+                "top_k": 5,
+                "correlation_id": uuid.uuid4().hex
+            }],
+            "Bulk RAG"
+        )
+
+
+class ChatUser(ZylonUser):
+    """Utilisateur en boucle fermée : un scénario, puis un temps d'attente"""
+    abstract = WORKLOAD_MODE != "closed"
+    wait_time = between(WORKLOAD_WAIT_MIN, WORKLOAD_WAIT_MAX)  # Temps d'attente entre les requêtes
+
+    @task
+    def replay(self):
+        try:
+            scenario = next(workload)
+        except StopIteration:
+            raise StopUser()
+        self.run_scenario(scenario)
+
+
+class OpenLoopUser(ZylonUser):
+    """Générateur en boucle ouverte : les scénarios partent à leur instant d'arrivée,
+    sans attendre la fin des précédents (dans la limite de WORKLOAD_MAX_IN_FLIGHT)"""
+    abstract = WORKLOAD_MODE == "closed"
+    wait_time = constant(0)
+
+    def on_start(self):
+        super().on_start()
+        self.in_flight = Pool(WORKLOAD_MAX_IN_FLIGHT)
+
+    def on_stop(self):
+        self.in_flight.kill()
+
+    @task
+    def dispatch(self):
+        try:
+            scenario, arrival = arrival_schedule.next()
+        except StopIteration:
+            self.in_flight.join()
+            raise StopUser()
+        delay = arrival - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if self.in_flight.full():
+            # Arrivée perdue : le générateur est saturé, la mesure ne serait plus en boucle ouverte
+            events.request.fire(
+                request_type="WORKLOAD",
+                name="Arrivée abandonnée",
+                response_time=0,
+                response_length=0,
+                exception=RuntimeError("Trop de requêtes en cours"),
+                context={},
+            )
+            return
+        self.in_flight.spawn(self.run_scenario, scenario)
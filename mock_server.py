@@ -0,0 +1,547 @@
+"""Serveur factice de l'API Zylon, construit à partir de openapi.json.
+
+Permet de lancer streamlit_chat.py, locustfile.py et benchmarks.py sans
+backend GPU : les réponses de chat sont émises en SSE (content_block_delta
+text_delta / source_delta) avec un TTFT, un débit de tokens et une gigue
+configurables, et des erreurs peuvent être injectées. Les routes sans
+comportement dédié renvoient un exemple généré depuis le schéma de réponse.
+
+    python mock_server.py --port 8001 --token-rate 40 --ttft 0.5
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+OPENAPI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "openapi.json")
+
+WORDS = (
+    "le contrat prévoit une échéance trimestrielle et le budget alloué couvre la maintenance "
+    "des équipements ainsi que la formation des équipes selon le rapport annuel du comité"
+).split()
+
+
+class MockSettings:
+    """Comportement du serveur factice (valeurs lues dans l'environnement par défaut)"""
+
+    def __init__(self, **overrides):
+        self.token_rate = float(os.getenv("MOCK_TOKEN_RATE", "40"))  # tokens/s, 0 = sans délai
+        self.ttft = float(os.getenv("MOCK_TTFT", "0.5"))  # secondes
+        self.jitter = float(os.getenv("MOCK_JITTER", "0.2"))  # variation relative des délais
+        self.latency = float(os.getenv("MOCK_LATENCY", "0.02"))  # délai des réponses JSON
+        self.response_tokens = int(os.getenv("MOCK_RESPONSE_TOKENS", "120"))
+        self.error_rate = float(os.getenv("MOCK_ERROR_RATE", "0"))
+        self.error_status = int(os.getenv("MOCK_ERROR_STATUS", "503"))
+        self.abort_rate = float(os.getenv("MOCK_STREAM_ABORT_RATE", "0"))  # flux coupés en cours
+        self.task_duration = float(os.getenv("MOCK_TASK_DURATION", "2.0"))
+        self.embedding_dim = int(os.getenv("MOCK_EMBEDDING_DIM", "384"))
+        for name, value in overrides.items():
+            if not hasattr(self, name):
+                raise ValueError(f"Paramètre inconnu : {name}")
+            setattr(self, name, value)
+
+
+class SchemaFaker:
+    """Génère une valeur d'exemple conforme à un schéma de openapi.json"""
+
+    def __init__(self, spec):
+        self.schemas = spec.get("components", {}).get("schemas", {})
+
+    def example(self, schema, depth=0):
+        if "$ref" in schema:
+            schema = self.schemas[schema["$ref"].rsplit("/", 1)[-1]]
+        if depth > 6:
+            return None
+        if "examples" in schema:
+            return schema["examples"][0]
+        if "const" in schema:
+            return schema["const"]
+        if "default" in schema:
+            return schema["default"]
+        if "enum" in schema:
+            return schema["enum"][0]
+        if "anyOf" in schema:
+            options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+            return self.example(options[0], depth + 1) if options else None
+        kind = schema.get("type")
+        if kind == "object" or "properties" in schema:
+            return {
+                name: self.example(prop, depth + 1)
+                for name, prop in schema.get("properties", {}).items()
+            }
+        if kind == "array":
+            return [self.example(schema.get("items", {}), depth + 1)]
+        return {"string": "string", "integer": 0, "number": 0.0, "boolean": False}.get(kind)
+
+
+def _compile_routes(spec):
+    """[(méthode, regex du chemin, chemin OpenAPI, schéma de réponse 200)]"""
+    routes = []
+    for path, operations in spec.get("paths", {}).items():
+        pattern = re.compile("^" + re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", path) + "$")
+        for method, operation in operations.items():
+            content = operation.get("responses", {}).get("200", {}).get("content", {})
+            schema = content.get("application/json", {}).get("schema", {})
+            routes.append((method.upper(), pattern, path, schema))
+    return routes
+
+
+def fake_embedding(text, dim):
+    """Vecteur normé déterministe (même texte -> même vecteur)"""
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dim)]
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class MockZylonState:
+    """Documents ingérés et tâches asynchrones, conservés en mémoire"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.documents = {}  # collection -> {artefact: métadonnées}
+        self.tasks = {}  # task_id -> (créée à, résultat)
+
+    def ingest(self, collection, artifact, metadata):
+        with self.lock:
+            self.documents.setdefault(collection, {})[artifact] = metadata
+        return {"object": "ingest.document", "artifact": artifact, "doc_metadata": metadata}
+
+    def list(self, collection):
+        with self.lock:
+            documents = dict(self.documents.get(collection, {}))
+        return [
+            {"object": "ingest.document", "artifact": artifact, "doc_metadata": metadata}
+            for artifact, metadata in documents.items()
+        ]
+
+    def delete(self, collection, artifact):
+        with self.lock:
+            self.documents.get(collection, {}).pop(artifact, None)
+
+    def create_task(self, result):
+        task_id = uuid.uuid4().hex
+        with self.lock:
+            self.tasks[task_id] = (time.monotonic(), result)
+        return {"task_id": task_id}
+
+    def task_status(self, task_id):
+        with self.lock:
+            task = self.tasks.get(task_id)
+        if task is None:
+            return None
+        created_at, result = task
+        elapsed = time.monotonic() - created_at
+        if elapsed < self.settings.task_duration / 2:
+            return {"task_id": task_id, "task_status": "pending", "task_result": None}
+        if elapsed < self.settings.task_duration:
+            return {"task_id": task_id, "task_status": "running", "task_result": None}
+        if callable(result):
+            # L'effet de la tâche (ingestion, suppression) n'est appliqué qu'une fois
+            result = result()
+            with self.lock:
+                self.tasks[task_id] = (created_at, result)
+        return {"task_id": task_id, "task_status": "completed", "task_result": result}
+
+
+class MockZylonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockZylon/1.0"
+    # En-têtes et corps sont écrits séparément : sans TCP_NODELAY, chaque réponse
+    # subirait le délai d'acquittement retardé (~40 ms)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+    # --- utilitaires -----------------------------------------------------
+
+    @property
+    def settings(self):
+        return self.server.settings
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _delay(self, seconds):
+        if seconds > 0:
+            jitter = self.settings.jitter
+            time.sleep(max(0.0, seconds * random.uniform(1 - jitter, 1 + jitter)))
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b"".join(parts)
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _json_body(self, raw):
+        try:
+            return json.loads(raw or b"{}")
+        except json.JSONDecodeError:
+            return {}
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_event(self, payload):
+        # Un événement par bloc "chunked", comme les serveurs ASGI en streaming
+        event = f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(event), event))
+        self.wfile.flush()
+
+    def _collection(self, body, query=None):
+        if query and query.get("collection"):
+            return query["collection"][0]
+        context_filter = body.get("context_filter") or {}
+        return body.get("collection") or context_filter.get("collection") or "default"
+
+    # --- dispatch --------------------------------------------------------
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        raw = self._read_body() if method == "POST" else b""
+        allowed = False
+        for route_method, pattern, path, schema in self.server.routes:
+            match = pattern.match(url.path)
+            if not match:
+                continue
+            allowed = True
+            if route_method != method:
+                continue
+            if random.random() < self.settings.error_rate:
+                self._send_json({"detail": "Erreur injectée par le serveur factice"}, self.settings.error_status)
+                return
+            handler = self.server.handlers.get((method, path))
+            if handler is None:
+                self._delay(self.settings.latency)
+                self._send_json(self.server.faker.example(schema))
+                return
+            handler(self, raw=raw, query=parse_qs(url.query), **match.groupdict())
+            return
+        self._send_json({"detail": "Not Found" if not allowed else "Method Not Allowed"}, 404 if not allowed else 405)
+
+    # --- génération ------------------------------------------------------
+
+    def _tokens(self, prompt):
+        rng = random.Random(prompt)
+        tokens = [rng.choice(WORDS) + " " for _ in range(self.settings.response_tokens)]
+        # Balise de citation coupée en plusieurs fragments, comme celles du vrai serveur
+        if len(tokens) > 10:
+            tokens[10:10] = ['<citation index="1" ', 'artifact="doc-1">', "[1]", "</citation> "]
+        return tokens
+
+    def _chunks(self, text, collection, limit):
+        rng = random.Random(text)
+        chunks = []
+        for index in range(limit):
+            artifact = f"doc-{index + 1}"
+            chunks.append({
+                "object": "context.chunk",
+                "id": f"{artifact}-chunk-{index}",
+                "score": round(0.95 - index * 0.05, 3),
+                "document": {
+                    "object": "ingest.document",
+                    "artifact": artifact,
+                    "doc_metadata": {"file_name": f"{artifact}.pdf", "collection": collection},
+                },
+                "text": " ".join(rng.choice(WORDS) for _ in range(60)),
+                "content_type": "text/plain",
+                "previous_texts": None,
+                "next_texts": None,
+            })
+        return chunks
+
+    def chat(self, raw, **kwargs):
+        body = self._json_body(raw)
+        messages = body.get("messages") or [{"role": "user", "content": body.get("prompt", "")}]
+        prompt = str(messages[-1].get("content", ""))
+        tokens = self._tokens(prompt)
+        sources = self._chunks(prompt, self._collection(body), 3) if body.get("use_context") else []
+        if not body.get("stream"):
+            self._delay(self.settings.ttft + len(tokens) / (self.settings.token_rate or math.inf))
+            content = [{"type": "text", "text": "".join(tokens), "citations": []}]
+            if sources:
+                content.append({"type": "source", "sources": sources})
+            self._send_json({
+                "id": f"msg_{uuid.uuid4().hex}",
+                "type": "message",
+                "role": "assistant",
+                "content": content,
+                "model": "private-gpt",
+                "stop_reason": "end_turn",
+                "usage": {"input_tokens": len(prompt.split()), "output_tokens": len(tokens)},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        abort_at = len(tokens) // 2 if random.random() < self.settings.abort_rate else None
+        try:
+            self._send_event({"type": "message_start", "message": {"id": f"msg_{uuid.uuid4().hex}", "role": "assistant"}})
+            self._delay(self.settings.ttft)
+            self._send_event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+            interval = 1 / self.settings.token_rate if self.settings.token_rate > 0 else 0
+            for position, token in enumerate(tokens):
+                if position == abort_at:
+                    # Flux coupé sans bloc final : le client voit une réponse incomplète
+                    self.close_connection = True
+                    return
+                if position:
+                    self._delay(interval)
+                self._send_event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}})
+            self._send_event({"type": "content_block_stop", "index": 0})
+            if sources:
+                self._send_event({"type": "content_block_start", "index": 1, "content_block": {"type": "source", "sources": []}})
+                self._send_event({"type": "content_block_delta", "index": 1, "delta": {"type": "source_delta", "sources": sources}})
+                self._send_event({"type": "content_block_stop", "index": 1})
+            self._send_event({
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn"},
+                "usage": {"input_tokens": len(prompt.split()), "output_tokens": len(tokens)},
+            })
+            self._send_event({"type": "message_stop"})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Le client a interrompu la lecture du flux
+            self.close_connection = True
+
+    def chunks(self, raw, **kwargs):
+        body = self._json_body(raw)
+        self._delay(self.settings.latency)
+        limit = int(body.get("limit") or 10)
+        data = self._chunks(body.get("text", ""), self._collection(body), limit)
+        self._send_json({"object": "list", "model": "private-gpt", "data": data})
+
+    def embeddings(self, raw, **kwargs):
+        body = self._json_body(raw)
+        self._delay(self.settings.latency)
+        inputs = body.get("input", "")
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        data = [
+            {"index": index, "object": "embedding", "embedding": fake_embedding(str(text), self.settings.embedding_dim)}
+            for index, text in enumerate(inputs)
+        ]
+        self._send_json({"object": "list", "model": "private-gpt", "data": data})
+
+    def ingest_text(self, raw, **kwargs):
+        body = self._json_body(raw)
+        self._delay(self.settings.latency)
+        metadata = dict(body.get("metadata") or {})
+        metadata.setdefault("file_name", body.get("artifact"))
+        document = self.state.ingest(self._collection(body), body.get("artifact") or uuid.uuid4().hex, metadata)
+        self._send_json({"object": "list", "model": "private-gpt", "data": [document]})
+
+    def ingest_file(self, raw, query, **kwargs):
+        match = re.search(rb'filename="([^"]*)"', raw[:4096])
+        file_name = match.group(1).decode("utf-8", "replace") if match else "document"
+        self._delay(self.settings.latency)
+        collection = query.get("collection", ["default"])[0]
+        artifact = query.get("artifact", [file_name])[0]
+        document = self.state.ingest(collection, artifact, {"file_name": file_name, "size": len(raw)})
+        self._send_json({"object": "list", "model": "private-gpt", "data": [document]})
+
+    def ingest_uri(self, raw, **kwargs):
+        body = self._json_body(raw)
+        artifact = body.get("artifact") or body.get("uri") or uuid.uuid4().hex
+        document = self.state.ingest(self._collection(body), artifact, {"file_name": body.get("uri")})
+        self._delay(self.settings.latency)
+        self._send_json({"object": "list", "model": "private-gpt", "data": [document]})
+
+    def async_ingest_uri(self, raw, **kwargs):
+        body = self._json_body(raw)
+        body = body.get("ingest_body", body)
+        collection = self._collection(body)
+        artifact = body.get("artifact") or body.get("uri") or uuid.uuid4().hex
+
+        def result():
+            document = self.state.ingest(collection, artifact, {"file_name": body.get("uri")})
+            return {"object": "list", "model": "private-gpt", "data": [document]}
+
+        self._send_json(self.state.create_task(result))
+
+    def ingest_list(self, query, **kwargs):
+        self._delay(self.settings.latency)
+        data = self.state.list(query.get("collection", ["default"])[0])
+        self._send_json({"object": "list", "model": "private-gpt", "data": data})
+
+    def delete(self, raw, **kwargs):
+        body = self._json_body(raw)
+        self._delay(self.settings.latency)
+        self.state.delete(self._collection(body), body.get("artifact"))
+        self._send_json({})
+
+    def async_delete(self, raw, **kwargs):
+        body = self._json_body(raw)
+        body = body.get("delete_body", body)
+        collection, artifact = self._collection(body), body.get("artifact")
+
+        def result():
+            self.state.delete(collection, artifact)
+            return None
+
+        self._send_json(self.state.create_task(result))
+
+    def summarize(self, raw, **kwargs):
+        body = self._json_body(raw)
+        self._delay(self.settings.ttft)
+        words = str(body.get("text", "")).split()
+        self._send_json({"config": {}, "summary": " ".join(words[:50])})
+
+    def async_summarize(self, raw, **kwargs):
+        body = self._json_body(raw)
+        body = body.get("summarize_body", body)
+        words = str(body.get("text", "")).split()
+        self._send_json(self.state.create_task({"config": {}, "summary": " ".join(words[:50])}))
+
+    def _report(self, body):
+        instructions = str(body.get("instructions", ""))
+        paragraphs = ["".join(self._tokens(f"{instructions}-{index}")[:40]).strip() for index in range(3)]
+        return {"config": {"title": instructions[:60] or None}, "report": "\n\n".join(f"## Partie {index + 1}\n\n{text}" for index, text in enumerate(paragraphs))}
+
+    def report(self, raw, **kwargs):
+        self._delay(self.settings.ttft)
+        self._send_json(self._report(self._json_body(raw)))
+
+    def async_report(self, raw, **kwargs):
+        body = self._json_body(raw)
+        self._send_json(self.state.create_task(self._report(body.get("report_body", body))))
+
+    def bulk_rag(self, raw, **kwargs):
+        items = self._json_body(raw)
+        items = items if isinstance(items, list) else [items]
+        results = []
+        for item in items:
+            for query in item.get("queries") or []:
+                self._delay(self.settings.ttft)
+                results.append({
+                    "query": query,
+                    "response": "".join(self._tokens(query)[:30]).strip(),
+                    "sources": self._chunks(query, "default", item.get("top_k") or 3),
+                    "correlation_id": item.get("correlation_id"),
+                })
+        self._send_json(results)
+
+    def task_status(self, task_id, **kwargs):
+        status = self.state.task_status(task_id)
+        if status is None:
+            self._send_json({"detail": "Tâche inconnue"}, 404)
+        else:
+            self._send_json(status)
+
+
+HANDLERS = {
+    ("POST", "/v1/chat/completions"): MockZylonHandler.chat,
+    ("POST", "/v1/completions"): MockZylonHandler.chat,
+    ("POST", "/v1/chunks"): MockZylonHandler.chunks,
+    ("POST", "/v1/embeddings"): MockZylonHandler.embeddings,
+    ("POST", "/v1/ingest/text"): MockZylonHandler.ingest_text,
+    ("POST", "/v1/ingest/file"): MockZylonHandler.ingest_file,
+    ("POST", "/v1/ingest/uri"): MockZylonHandler.ingest_uri,
+    ("POST", "/v1/async/ingest/uri"): MockZylonHandler.async_ingest_uri,
+    ("GET", "/v1/ingest/list"): MockZylonHandler.ingest_list,
+    ("POST", "/v1/delete"): MockZylonHandler.delete,
+    ("POST", "/v1/async/delete"): MockZylonHandler.async_delete,
+    ("POST", "/v1/summarize"): MockZylonHandler.summarize,
+    ("POST", "/v1/async/summarize"): MockZylonHandler.async_summarize,
+    ("POST", "/v1/report"): MockZylonHandler.report,
+    ("POST", "/v1/async/report"): MockZylonHandler.async_report,
+    ("POST", "/v1/qa/bulk-rag"): MockZylonHandler.bulk_rag,
+    ("GET", "/v1/ingest/tasks/{task_id}"): MockZylonHandler.task_status,
+    ("GET", "/v1/delete/tasks/{task_id}"): MockZylonHandler.task_status,
+    ("GET", "/v1/summarize/tasks/{task_id}"): MockZylonHandler.task_status,
+    ("GET", "/v1/report/tasks/{task_id}"): MockZylonHandler.task_status,
+}
+
+
+class MockZylonServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, settings=None, spec_path=OPENAPI_PATH):
+        with open(spec_path, encoding="utf-8") as file:
+            spec = json.load(file)
+        self.settings = settings or MockSettings()
+        self.state = MockZylonState(self.settings)
+        self.faker = SchemaFaker(spec)
+        self.routes = _compile_routes(spec)
+        self.handlers = HANDLERS
+        super().__init__(address, MockZylonHandler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_mock_server(settings=None, host="127.0.0.1", port=0):
+    """Démarre le serveur dans un thread (port 0 : port libre) et le retourne"""
+    server = MockZylonServer((host, port), settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur factice de l'API Zylon")
+    parser.add_argument("--host", default=os.getenv("MOCK_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOCK_PORT", "8001")))
+    parser.add_argument("--token-rate", type=float, help="tokens par seconde (0 : sans délai)")
+    parser.add_argument("--ttft", type=float, help="délai avant le premier token (s)")
+    parser.add_argument("--jitter", type=float, help="variation relative des délais")
+    parser.add_argument("--error-rate", type=float, help="proportion de requêtes en erreur")
+    parser.add_argument("--abort-rate", type=float, help="proportion de flux interrompus")
+    args = parser.parse_args()
+
+    overrides = {
+        name: value for name, value in {
+            "token_rate": args.token_rate,
+            "ttft": args.ttft,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "abort_rate": args.abort_rate,
+        }.items() if value is not None
+    }
+    logging.basicConfig(level=logging.INFO)
+    server = MockZylonServer((args.host, args.port), MockSettings(**overrides))
+    logging.info(f"Serveur factice Zylon sur {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
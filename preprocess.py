@@ -0,0 +1,153 @@
+"""Extraction locale du texte des documents avant ingestion.
+
+Les PDF, DOCX et fichiers texte sont analysés dans un pool de processus, page
+par page (ou paragraphe par paragraphe) pour garder une mémoire bornée ; le
+texte est normalisé (Unicode, césures de fin de ligne, espaces) puis envoyé
+à /v1/ingest/text avec les métadonnées du fichier d'origine, au lieu du
+fichier brut à /v1/ingest/file. Les documents sans couche texte exploitable
+(PDF scannés) ou dont le format n'est pas pris en charge restent envoyés tels
+quels pour être traités par le serveur.
+"""
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import unicodedata
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+
+try:
+    from pypdf import PdfReader
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+# En dessous de ce nombre moyen de caractères par page, le PDF est supposé scanné
+PREPROCESS_MIN_CHARS_PER_PAGE = int(os.getenv("PREPROCESS_MIN_CHARS_PER_PAGE", "50"))
+
+SUPPORTED_EXTENSIONS = {".txt", ".docx"} | ({".pdf"} if PDF_AVAILABLE else set())
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+CONTROL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\u00ad\u200b\ufeff]")
+HYPHENATED_BREAK = re.compile(r"(\w)-\n(\w)")
+SPACES = re.compile(r"[ \t\u00a0]+")
+
+
+class NotExtractable(Exception):
+    """Le document doit être envoyé tel quel au serveur"""
+
+
+def supports(file_name):
+    return os.path.splitext(file_name)[1].lower() in SUPPORTED_EXTENSIONS
+
+
+def normalize(text):
+    """Paragraphes d'un bloc de texte : NFKC, césures recollées, lignes d'un même paragraphe jointes"""
+    text = unicodedata.normalize("NFKC", text).replace("\r\n", "\n").replace("\r", "\n")
+    text = HYPHENATED_BREAK.sub(r"\1\2", CONTROL_CHARS.sub("", text))
+    paragraphs, lines = [], []
+    for line in text.split("\n"):
+        line = SPACES.sub(" ", line).strip()
+        if line:
+            lines.append(line)
+        elif lines:
+            paragraphs.append(" ".join(lines))
+            lines = []
+    if lines:
+        paragraphs.append(" ".join(lines))
+    return paragraphs
+
+
+def _pdf_pages(path):
+    reader = PdfReader(path)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def _docx_paragraphs(path):
+    """Paragraphes de word/document.xml lus au fil de l'eau (iterparse)"""
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as document:
+        parts = []
+        for _, element in ElementTree.iterparse(document, events=("end",)):
+            tag = element.tag
+            if tag == WORD_NAMESPACE + "t":
+                parts.append(element.text or "")
+            elif tag == WORD_NAMESPACE + "tab":
+                parts.append("\t")
+            elif tag in (WORD_NAMESPACE + "br", WORD_NAMESPACE + "cr"):
+                parts.append("\n")
+            elif tag == WORD_NAMESPACE + "p":
+                yield "".join(parts)
+                parts = []
+                element.clear()
+
+
+def _text_lines(path, block_lines=2000):
+    """Blocs de lignes d'un fichier texte (UTF-8, repli en cp1252)"""
+    for encoding in ("utf-8-sig", "cp1252"):
+        try:
+            with open(path, encoding=encoding) as file:
+                block = []
+                for line in file:
+                    block.append(line)
+                    if len(block) >= block_lines:
+                        yield "".join(block)
+                        block = []
+                if block:
+                    yield "".join(block)
+            return
+        except UnicodeDecodeError:
+            continue
+    raise NotExtractable("Encodage du fichier texte non reconnu")
+
+
+def extract_text(path, file_name):
+    """Exécuté dans un processus du pool : retourne le texte normalisé et des métadonnées"""
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == ".pdf":
+        if not PDF_AVAILABLE:
+            raise NotExtractable("Le paquet pypdf n'est pas installé")
+        blocks = _pdf_pages(path)
+    elif extension == ".docx":
+        blocks = _docx_paragraphs(path)
+    elif extension == ".txt":
+        blocks = _text_lines(path)
+    else:
+        raise NotExtractable(f"Format non pris en charge : {extension}")
+
+    paragraphs, count, characters = [], 0, 0
+    for block in blocks:
+        count += 1
+        for paragraph in normalize(block):
+            paragraphs.append(paragraph)
+            characters += len(paragraph)
+    if extension == ".pdf" and characters < PREPROCESS_MIN_CHARS_PER_PAGE * max(count, 1):
+        raise NotExtractable("Peu ou pas de texte extractible (document scanné ?)")
+    if not characters:
+        raise NotExtractable("Aucun texte extrait")
+    metadata = {"file_name": file_name, "source_format": extension.lstrip("."), "preprocessed": "client"}
+    if extension == ".pdf":
+        metadata["pages"] = count
+    return "\n\n".join(paragraphs), metadata
+
+
+def spill_to_file(source, file_name):
+    """Chemin lisible par un autre processus ; retourne (chemin, temporaire)"""
+    if isinstance(source, str):
+        return source, False
+    suffix = os.path.splitext(file_name)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as file:
+        if hasattr(source, "getbuffer"):
+            file.write(source.getbuffer())
+        else:
+            source.seek(0)
+            shutil.copyfileobj(source, file)
+    return file.name, True
+
+
+def create_pool(workers=PREPROCESS_WORKERS):
+    # spawn : le processus Streamlit est multi-thread, un fork pourrait hériter de verrous tenus
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
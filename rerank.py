@@ -0,0 +1,136 @@
+"""Re-classement local des chunks récupérés.
+
+Les candidats renvoyés par /v1/chunks sont embarqués en un seul appel à
+/v1/embeddings (forme tableau), notés par un produit matriciel avec l'embedding
+de la question, puis diversifiés par Maximal Marginal Relevance (MMR) dans la
+limite d'un budget de tokens.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from retrieval import headers
+
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "10"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "3"))
+RERANK_LAMBDA = float(os.getenv("RERANK_LAMBDA", "0.7"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+
+def estimate_tokens(text):
+    """Estimation grossière du nombre de tokens (~4 caractères par token)"""
+    return max(1, len(text) // 4)
+
+
+def chunk_key(chunk):
+    """Identifiant stable d'un chunk : son id, ou à défaut un hash de son texte"""
+    if chunk.get("id"):
+        return chunk["id"]
+    return hashlib.sha1(chunk.get("text", "").encode("utf-8")).hexdigest()
+
+
+class ChunkEmbeddingCache:
+    """Cache LRU des embeddings normalisés des chunks, partagé entre threads"""
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._vectors = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+            return vector
+
+    def put(self, key, vector):
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.capacity:
+                self._vectors.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._vectors.clear()
+
+    def __len__(self):
+        return len(self._vectors)
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+async def embed_chunks(client, chunks, cache):
+    """Retourne la matrice des embeddings normalisés des chunks (un seul appel pour les absents)"""
+    keys = [chunk_key(chunk) for chunk in chunks]
+    vectors = [cache.get(key) for key in keys]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        response = await client.arequest(
+            "POST",
+            "/v1/embeddings",
+            endpoint="embeddings",
+            json={"input": [chunks[i].get("text", "") for i in missing]},
+            headers=headers
+        )
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        embedded = _normalize_rows(np.asarray([item["embedding"] for item in data], dtype=np.float32))
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+            cache.put(keys[i], vector)
+    return np.vstack(vectors)
+
+
+def mmr_order(query_vector, doc_matrix, lambda_=RERANK_LAMBDA):
+    """Ordre MMR des documents : pertinence pondérée moins redondance avec les déjà choisis"""
+    relevance = doc_matrix @ query_vector
+    similarity = doc_matrix @ doc_matrix.T
+    selected = []
+    remaining = np.ones(len(relevance), dtype=bool)
+    # Redondance maximale de chaque candidat avec la sélection courante
+    redundancy = np.full(len(relevance), -np.inf)
+    while remaining.any():
+        if selected:
+            scores = lambda_ * relevance - (1 - lambda_) * redundancy
+        else:
+            scores = relevance.copy()
+        scores[~remaining] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        remaining[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected, relevance
+
+
+async def rerank_chunks(client, query_embedding, chunks, cache, top_k=RERANK_TOP_K,
+                        lambda_=RERANK_LAMBDA, token_budget=CONTEXT_TOKEN_BUDGET):
+    """Sélectionne jusqu'à top_k chunks pertinents et diversifiés tenant dans le budget de tokens"""
+    chunks = [chunk for chunk in chunks if chunk.get("text")]
+    if not chunks:
+        return []
+    doc_matrix = await embed_chunks(client, chunks, cache)
+    query_vector = np.asarray(query_embedding, dtype=np.float32)
+    query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+
+    order, relevance = mmr_order(query_vector, doc_matrix, lambda_)
+    selected = []
+    used_tokens = 0
+    for index in order:
+        tokens = estimate_tokens(chunks[index]["text"])
+        if used_tokens + tokens > token_budget:
+            continue
+        chunk = dict(chunks[index])
+        chunk["similarity_score"] = float(relevance[index])
+        selected.append(chunk)
+        used_tokens += tokens
+        if len(selected) >= top_k:
+            break
+    return selected
@@ -0,0 +1,90 @@
+"""Étape de récupération exécutée avant (ou pendant) la génération de la réponse.
+
+Les appels indépendants (/v1/embeddings, /v1/chunks) sont lancés en parallèle
+sur la boucle asyncio du client partagé ; ceux dont le résultat n'est pas
+utilisé ne sont pas émis.
+"""
+import asyncio
+
+headers = {
+    "accept": "application/json",
+    "Content-Type": "application/json"
+}
+
+
+class RetrievalResult:
+    """Résultat agrégé de l'étape de récupération"""
+
+    def __init__(self):
+        self.embedding = None
+        self.chunks = None
+        self.errors = {}
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+# Fonction pour générer des embeddings
+async def generate_embeddings(client, text):
+    response = await client.arequest(
+        "POST",
+        "/v1/embeddings",
+        endpoint="embeddings",
+        json={"input": text},
+        headers=headers
+    )
+    return response.json()
+
+
+def build_context_filter(collection="chat_documents", artifacts=None, metadata=None):
+    """ContextFilter restreint à des artefacts et/ou des valeurs de métadonnées (intersection)"""
+    context_filter = {"collection": collection}
+    if artifacts:
+        context_filter["artifacts"] = list(artifacts)
+    if metadata:
+        context_filter["metadata_filter"] = [
+            {"key": key, "operator": "==", "value": value} for key, value in metadata.items()
+        ]
+    return context_filter
+
+
+# Fonction pour rechercher des chunks pertinents
+async def search_chunks(client, query, collection="chat_documents", limit=5, context_filter=None):
+    response = await client.arequest(
+        "POST",
+        "/v1/chunks",
+        endpoint="chunks",
+        json={
+            "text": query,
+            "context_filter": context_filter or build_context_filter(collection),
+            "limit": limit
+        },
+        headers=headers
+    )
+    return response.json()
+
+
+async def retrieve(client, query, collection="chat_documents", limit=5, need_embedding=False, embedding=None,
+                   context_filter=None):
+    """Lance en parallèle les appels nécessaires et regroupe leurs résultats"""
+    calls = {"chunks": search_chunks(client, query, collection, limit, context_filter)}
+    # L'embedding de la requête n'est calculé que si un consommateur en a besoin
+    # et qu'il n'a pas déjà été obtenu (par exemple pour le cache sémantique)
+    if need_embedding and embedding is None:
+        calls["embedding"] = generate_embeddings(client, query)
+
+    responses = await asyncio.gather(*calls.values(), return_exceptions=True)
+
+    result = RetrievalResult()
+    result.embedding = embedding
+    for name, response in zip(calls, responses):
+        if isinstance(response, Exception):
+            result.errors[name] = response
+        elif not response or "data" not in response:
+            result.errors[name] = ValueError(f"Réponse invalide pour {name}")
+        elif name == "chunks":
+            result.chunks = response["data"]
+        else:
+            result.embedding = response["data"][0]["embedding"]
+    return result
@@ -0,0 +1,117 @@
+"""Cache sémantique des réponses, indexé par l'embedding de la question.
+
+Les embeddings normalisés sont stockés dans une matrice NumPy de taille fixe ;
+une recherche revient à un seul produit matriciel. Les entrées expirent (TTL),
+sont évincées par LRU et sont invalidées dès que la collection change.
+
+La réponse dépend aussi de l'historique envoyé au modèle : chaque entrée porte
+une empreinte de la conversation qui précède la question, et seules les
+entrées de même empreinte peuvent correspondre (une relance comme « Peux-tu
+détailler ? » ne reçoit jamais la réponse d'une autre conversation).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_CAPACITY = int(os.getenv("SEMANTIC_CACHE_CAPACITY", "512"))
+DEFAULT_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+DEFAULT_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+
+
+def history_key(messages):
+    """Empreinte (entier 64 bits) des messages précédant la question ; 0 pour une première question"""
+    if not messages:
+        return 0
+    encoded = json.dumps(
+        [(message.get("role"), message.get("content")) for message in messages], ensure_ascii=False
+    ).encode("utf-8")
+    return int.from_bytes(hashlib.sha256(encoded).digest()[:8], "big", signed=True) or 1
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Cache (embedding de la question, historique, version de la collection) -> (réponse, sources)"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, threshold=DEFAULT_THRESHOLD, ttl=DEFAULT_TTL):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._matrix = None  # alloué au premier ajout, quand la dimension est connue
+        self._entries = [None] * capacity
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._history = np.zeros(capacity, dtype=np.int64)
+        self._expires = np.zeros(capacity, dtype=np.float64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+
+    def lookup(self, embedding, history=0):
+        """Retourne (score, réponse, sources) pour la question la plus proche posée après le même
+        historique (empreinte history_key), ou None"""
+        query = _normalize(embedding)
+        with self._lock:
+            now = time.time()
+            self._valid &= self._expires > now
+            candidates = self._valid & (self._history == history)
+            if self._matrix is None or query.shape[0] != self._matrix.shape[1] or not candidates.any():
+                self.misses += 1
+                return None
+            scores = self._matrix @ query
+            scores[~candidates] = -np.inf
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._last_used[slot] = now
+            answer, sources = self._entries[slot]
+            return float(scores[slot]), answer, sources
+
+    def put(self, embedding, answer, sources, version, history=0):
+        """Ajoute une réponse calculée pour la version de collection et l'historique donnés"""
+        vector = _normalize(embedding)
+        with self._lock:
+            # La collection a changé pendant la génération : la réponse est déjà obsolète
+            if version != self.version:
+                return False
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+                self._valid[:] = False
+            free = np.flatnonzero(~self._valid)
+            slot = int(free[0]) if free.size else int(np.argmin(self._last_used))
+            now = time.time()
+            self._matrix[slot] = vector
+            self._entries[slot] = (answer, sources)
+            self._valid[slot] = True
+            self._history[slot] = history
+            self._expires[slot] = now + self.ttl
+            self._last_used[slot] = now
+            return True
+
+    def invalidate(self):
+        """Vide le cache après une modification de la collection"""
+        with self._lock:
+            self.version += 1
+            self._valid[:] = False
+            self._entries = [None] * self.capacity
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": int(self._valid.sum()),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "version": self.version,
+            }
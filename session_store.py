@@ -0,0 +1,232 @@
+"""Stockage des conversations hors du processus Streamlit.
+
+Les messages sont ajoutés un par un (jamais réécrits en bloc) dans SQLite par
+défaut, ou dans Redis lorsque SESSION_STORE_URL pointe vers un serveur
+compatible : plusieurs réplicas de l'application peuvent alors servir la même
+session, identifiée par le paramètre ``session`` de l'URL. L'export JSON de
+l'historique n'est construit qu'à la demande.
+
+Le paramètre d'URL est un jeton non devinable généré par le serveur ; lorsque
+l'application est derrière un proxy d'authentification, la clé de stockage
+est dérivée du jeton et de l'utilisateur authentifié, de sorte qu'un lien
+copié ne donne pas accès à la conversation d'un autre utilisateur.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+import uuid
+from datetime import datetime
+
+from dedup_index import DATA_DIR
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# sqlite (défaut) ou URL redis://... / rediss://...
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "sqlite")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(DATA_DIR, "sessions.sqlite3"))
+# Durée de conservation d'une session inactive (s, 0 : illimitée)
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(30 * 24 * 3600)))
+# En-tête posé par le proxy d'authentification (ex. X-Forwarded-Email) : les sessions sont liées à l'utilisateur
+SESSION_USER_HEADER = os.getenv("SESSION_USER_HEADER", "")
+EXPORT_VERSION = "1.0"
+
+SESSION_TOKEN_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def new_session_token():
+    return uuid.uuid4().hex
+
+
+def is_session_token(value):
+    """Seuls les jetons générés par new_session_token (128 bits aléatoires) sont acceptés"""
+    return bool(value) and SESSION_TOKEN_PATTERN.fullmatch(value) is not None
+
+
+def session_key(token, owner=None):
+    """Clé de stockage de la session : le jeton seul, ou lié à l'utilisateur authentifié"""
+    if not owner:
+        return token
+    return hashlib.sha256(f"{owner}\n{token}".encode("utf-8")).hexdigest()[:32]
+
+
+class SessionStore(ABC):
+    """Interface commune : messages en ajout seul et quelques valeurs par session"""
+
+    @abstractmethod
+    def append_message(self, session_id, message):
+        """Ajoute un message à la fin de la conversation"""
+
+    @abstractmethod
+    def load_messages(self, session_id):
+        """Messages de la conversation, dans l'ordre"""
+
+    @abstractmethod
+    def set_value(self, session_id, key, value):
+        """Enregistre une valeur sérialisable en JSON"""
+
+    @abstractmethod
+    def get_value(self, session_id, key, default=None):
+        """Valeur enregistrée, ou default"""
+
+    @abstractmethod
+    def clear(self, session_id):
+        """Supprime les messages et les valeurs de la session"""
+
+    def iter_messages(self, session_id):
+        return iter(self.load_messages(session_id))
+
+    def export(self, session_id):
+        """Historique au format du téléchargement (JSON indenté), construit message par message"""
+        parts = ['{\n  "messages": [']
+        for index, message in enumerate(self.iter_messages(session_id)):
+            parts.append(("," if index else "") + "\n    " + json.dumps(message, ensure_ascii=False))
+        parts.append(f'\n  ],\n  "timestamp": "{datetime.now().isoformat()}",\n  "version": "{EXPORT_VERSION}"\n}}')
+        return "".join(parts).encode("utf-8")
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions dans un fichier SQLite local (partageable par des réplicas sur le même volume)"""
+
+    def __init__(self, path=SESSION_DB_PATH, ttl=SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " session_id TEXT NOT NULL,"
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " message TEXT NOT NULL,"
+                " created_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, seq)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_values ("
+                " session_id TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT,"
+                " updated_at REAL,"
+                " PRIMARY KEY (session_id, key))"
+            )
+            if self.ttl:
+                self._expire(time.time() - self.ttl)
+
+    def _expire(self, before):
+        """Supprime les sessions sans activité (message ou valeur écrits) depuis la date donnée"""
+        expired = self._conn.execute(
+            "SELECT session_id FROM ("
+            " SELECT session_id, created_at AS written_at FROM messages"
+            " UNION ALL SELECT session_id, updated_at FROM session_values)"
+            " GROUP BY session_id HAVING MAX(written_at) < ?",
+            (before,)
+        ).fetchall()
+        self._conn.executemany("DELETE FROM messages WHERE session_id = ?", expired)
+        self._conn.executemany("DELETE FROM session_values WHERE session_id = ?", expired)
+
+    def append_message(self, session_id, message):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO messages (session_id, message, created_at) VALUES (?, ?, ?)",
+                (session_id, _dumps(message), time.time())
+            )
+
+    def iter_messages(self, session_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return (json.loads(row[0]) for row in rows)
+
+    def load_messages(self, session_id):
+        return list(self.iter_messages(session_id))
+
+    def set_value(self, session_id, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO session_values (session_id, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, key, _dumps(value), time.time())
+            )
+
+    def get_value(self, session_id, key, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM session_values WHERE session_id = ? AND key = ?", (session_id, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def clear(self, session_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM session_values WHERE session_id = ?", (session_id,))
+
+
+class RedisSessionStore(SessionStore):
+    """Sessions dans Redis (ou un serveur compatible) : une liste de messages et un hash par session"""
+
+    def __init__(self, url, ttl=SESSION_TTL, prefix="zylon:session"):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("Le paquet redis est requis pour SESSION_STORE_URL=redis://...")
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _keys(self, session_id):
+        return f"{self.prefix}:{session_id}:messages", f"{self.prefix}:{session_id}:values"
+
+    def _touch(self, pipeline, session_id):
+        if self.ttl:
+            for key in self._keys(session_id):
+                pipeline.expire(key, self.ttl)
+
+    def append_message(self, session_id, message):
+        messages_key, _ = self._keys(session_id)
+        with self._redis.pipeline() as pipeline:
+            pipeline.rpush(messages_key, _dumps(message))
+            self._touch(pipeline, session_id)
+            pipeline.execute()
+
+    def load_messages(self, session_id):
+        messages_key, _ = self._keys(session_id)
+        return [json.loads(item) for item in self._redis.lrange(messages_key, 0, -1)]
+
+    def set_value(self, session_id, key, value):
+        _, values_key = self._keys(session_id)
+        with self._redis.pipeline() as pipeline:
+            pipeline.hset(values_key, key, _dumps(value))
+            self._touch(pipeline, session_id)
+            pipeline.execute()
+
+    def get_value(self, session_id, key, default=None):
+        _, values_key = self._keys(session_id)
+        value = self._redis.hget(values_key, key)
+        return json.loads(value) if value is not None else default
+
+    def clear(self, session_id):
+        self._redis.delete(*self._keys(session_id))
+
+
+def open_session_store(url=SESSION_STORE_URL):
+    """Instancie le stockage configuré par SESSION_STORE_URL"""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionStore(url[len("sqlite:///"):])
+    return SQLiteSessionStore()
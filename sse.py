@@ -0,0 +1,196 @@
+"""Décodage des flux Server-Sent Events de /v1/chat/completions.
+
+Le décodeur travaille directement sur les blocs d'octets reçus (iter_bytes /
+iter_content), sans décodage en str ligne par ligne : les champs
+``data:`` sur plusieurs lignes, ``event:`` et ``id:`` sont gérés, et le JSON
+est décodé avec orjson lorsqu'il est installé. Les trames illisibles sont
+comptées au lieu d'être ignorées silencieusement. Un serveur qui n'envoie pas
+de ligne vide entre les événements est détecté dès sa deuxième ligne ``data:``
+et chaque ligne est alors décodée à son arrivée.
+"""
+import json
+import logging
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson est optionnel
+    orjson = None
+    _loads = json.loads
+
+# Types d'événements produits par le décodeur
+TEXT = "text"
+SOURCES = "sources"
+USAGE = "usage"
+ERROR = "error"
+OTHER = "other"
+
+DONE_MARKER = b"[DONE]"
+
+
+class SSEEvent:
+    """Événement décodé : type, charge JSON et champs SSE associés"""
+
+    __slots__ = ("kind", "payload", "event", "id", "text", "sources", "usage", "error")
+
+    def __init__(self, kind, payload, event=None, id=None, text=None, sources=None, usage=None, error=None):
+        self.kind = kind
+        self.payload = payload
+        self.event = event
+        self.id = id
+        self.text = text
+        self.sources = sources
+        self.usage = usage
+        self.error = error
+
+    def __repr__(self):
+        return f"SSEEvent(kind={self.kind!r}, event={self.event!r}, payload={self.payload!r})"
+
+
+def classify(payload, event=None, id=None):
+    """Construit l'événement typé correspondant à une charge JSON décodée"""
+    if not isinstance(payload, dict):
+        return SSEEvent(OTHER, payload, event, id)
+    payload_type = payload.get("type")
+    if payload_type == "content_block_delta":
+        delta = payload.get("delta") or {}
+        delta_type = delta.get("type")
+        if delta_type == "text_delta":
+            return SSEEvent(TEXT, payload, event, id, text=delta.get("text", ""))
+        if delta_type == "source_delta":
+            return SSEEvent(SOURCES, payload, event, id, sources=delta.get("sources") or [])
+    if payload_type == "error" or event == "error":
+        error = payload.get("error") or {}
+        message = error.get("message") if isinstance(error, dict) else str(error)
+        return SSEEvent(ERROR, payload, event, id, error=message or payload.get("detail") or "Erreur inconnue")
+    if payload.get("usage"):
+        return SSEEvent(USAGE, payload, event, id, usage=payload["usage"])
+    return SSEEvent(OTHER, payload, event, id)
+
+
+class SSEDecoder:
+    """Décodeur SSE incrémental alimenté par des blocs d'octets"""
+
+    def __init__(self):
+        self._pending = b""  # début de ligne incomplète
+        self._data = []
+        self._event = None
+        self._id = None
+        # Serveur sans ligne vide entre les événements : une ligne data: = un événement
+        self._unframed = False
+        self.last_event_id = None
+        self.events = 0
+        self.malformed = 0
+
+    def _decode(self, data):
+        try:
+            return [_loads(data)]
+        except ValueError:
+            pass
+        if len(self._data) < 2:
+            self.malformed += 1
+            logging.debug("Trame SSE illisible : %r", data[:200])
+            return []
+        # Lignes data: accumulées sans ligne vide derrière une première trame illisible :
+        # chacune est traitée comme un document JSON à part entière
+        payloads = []
+        for line in self._data:
+            try:
+                payloads.append(_loads(line))
+            except ValueError:
+                self.malformed += 1
+                logging.debug("Trame SSE illisible : %r", line[:200])
+        return payloads
+
+    def _emit(self, payloads, events):
+        self.events += len(payloads)
+        for payload in payloads:
+            events.append(classify(payload, self._event, self._id))
+        self._event = None
+
+    def _data_line(self, value, events):
+        """Ligne data: complète, décodée aussitôt si le flux n'est pas découpé en événements"""
+        data = self._data
+        if not data and not self._unframed:
+            data.append(value)
+            return
+        if not self._unframed and len(data) == 1:
+            # Deuxième ligne data: sans ligne vide : la première est-elle un document à elle seule ?
+            try:
+                payload = _loads(data[0])
+            except ValueError:
+                data.append(value)  # champ data: sur plusieurs lignes
+                return
+            self._unframed = True
+            data.clear()
+            self._emit([payload], events)
+        if not self._unframed:
+            data.append(value)
+        elif value != DONE_MARKER:
+            try:
+                self._emit([_loads(value)], events)
+            except ValueError:
+                self.malformed += 1
+                logging.debug("Trame SSE illisible : %r", value[:200])
+
+    def _dispatch(self, events):
+        data = self._data
+        if not data:
+            self._event = None
+            return
+        joined = data[0] if len(data) == 1 else b"\n".join(data)
+        if joined != DONE_MARKER:
+            self._emit(self._decode(joined), events)
+        self._data = []
+        self._event = None
+
+    def _field(self, line, events):
+        if line[:1] == b":":  # commentaire / keep-alive
+            return
+        field, sep, value = line.partition(b":")
+        if sep and value[:1] == b" ":
+            value = value[1:]
+        if field == b"data":
+            self._data_line(value, events)
+        elif field == b"event":
+            self._event = value.decode("utf-8", "replace")
+        elif field == b"id":
+            self._id = self.last_event_id = value.decode("utf-8", "replace")
+
+    def _lines(self, lines, events):
+        for line in lines:
+            if line[-1:] == b"\r":
+                line = line[:-1]
+            if not line:
+                self._dispatch(events)
+            elif line[:6] == b"data: ":
+                # Cas courant traité sans découpage du champ
+                self._data_line(line[6:], events)
+            else:
+                self._field(line, events)
+
+    def feed(self, chunk):
+        """Ajoute un bloc d'octets et retourne les événements complets"""
+        if self._pending:
+            chunk = self._pending + chunk
+        lines = chunk.split(b"\n")
+        self._pending = lines.pop()
+        events = []
+        self._lines(lines, events)
+        return events
+
+    def finish(self):
+        """Traite la fin de flux (dernière ligne sans retour à la ligne)"""
+        events = []
+        if self._pending:
+            self._lines([self._pending], events)
+            self._pending = b""
+        self._dispatch(events)
+        return events
+
+    def iter_events(self, chunks):
+        """Décode un itérable de blocs d'octets"""
+        for chunk in chunks:
+            if chunk:
+                yield from self.feed(chunk)
+        yield from self.finish()
@@ -0,0 +1,156 @@
+"""Affichage incrémental des réponses en streaming.
+
+Les fragments de texte sont accumulés dans une liste et envoyés à l'interface
+par lots (budget de temps / de taille), les balises ``<citation>`` étant
+retirées au fil de l'eau.
+"""
+import json
+import re
+import time
+from collections import deque
+
+CITATION_PATTERN = re.compile(r'<citation.*?>.*?<\/citation>', flags=re.DOTALL)
+
+CITATION_OPEN = "<citation"
+CITATION_CLOSE = "</citation>"
+
+# Budget de rafraîchissement de l'interface
+FLUSH_INTERVAL = 0.05  # secondes
+FLUSH_TOKENS = 20  # nombre de fragments
+DEBUG_MAX_EVENTS = 50
+
+
+def strip_citations(text):
+    """Retire les balises <citation> d'un texte complet"""
+    return CITATION_PATTERN.sub('', text)
+
+
+def _partial_suffix(text, marker):
+    """Longueur du plus long suffixe de text qui est un préfixe de marker"""
+    for size in range(min(len(marker) - 1, len(text)), 0, -1):
+        if marker.startswith(text[-size:]):
+            return size
+    return 0
+
+
+class CitationStripper:
+    """Retire les balises <citation ...>...</citation> d'un flux de fragments.
+
+    Seule la fin du texte pouvant encore appartenir à une balise est conservée
+    en attente ; le reste est émis immédiatement.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._state = "text"  # text | open | body
+        self._body_start = 0
+
+    def feed(self, fragment):
+        """Ajoute un fragment et retourne le texte visible pouvant être affiché"""
+        buffer = self._pending + fragment
+        visible = []
+        while buffer:
+            if self._state == "text":
+                index = buffer.find(CITATION_OPEN)
+                if index == -1:
+                    keep = _partial_suffix(buffer, CITATION_OPEN)
+                    visible.append(buffer[:len(buffer) - keep])
+                    buffer = buffer[len(buffer) - keep:]
+                    break
+                visible.append(buffer[:index])
+                buffer = buffer[index:]
+                self._state = "open"
+            if self._state == "open":
+                index = buffer.find(">", len(CITATION_OPEN))
+                if index == -1:
+                    break
+                self._state = "body"
+                self._body_start = index + 1
+            index = buffer.find(CITATION_CLOSE, self._body_start)
+            if index == -1:
+                break
+            buffer = buffer[index + len(CITATION_CLOSE):]
+            self._state = "text"
+        self._pending = buffer
+        return "".join(visible)
+
+    def finish(self):
+        """Retourne le texte restant ; une balise non fermée est conservée telle quelle"""
+        remaining, self._pending, self._state = self._pending, "", "text"
+        return remaining
+
+
+class StreamRenderer:
+    """Accumule les fragments et rafraîchit le placeholder par lots"""
+
+    def __init__(self, placeholder, flush_interval=FLUSH_INTERVAL, flush_tokens=FLUSH_TOKENS,
+                 debug_container=None, debug_max_events=DEBUG_MAX_EVENTS):
+        self.placeholder = placeholder
+        self.flush_interval = flush_interval
+        self.flush_tokens = flush_tokens
+        self._raw = []
+        self._visible = []
+        self._stripper = CitationStripper()
+        self._pending_tokens = 0
+        self._last_flush = time.monotonic()
+        self.first_token_at = None
+        self.fragments = 0
+        self.render_time = 0.0  # temps cumulé passé à rafraîchir l'affichage
+        # Mode debug : seuls les derniers événements sont conservés
+        self.debug_container = debug_container
+        self._debug_events = deque(maxlen=debug_max_events)
+        self._debug_dirty = False
+
+    @property
+    def text(self):
+        """Réponse brute complète (avec citations)"""
+        return "".join(self._raw)
+
+    def add(self, fragment):
+        if not fragment:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self._raw.append(fragment)
+        self._visible.append(self._stripper.feed(fragment))
+        self.fragments += 1
+        self._pending_tokens += 1
+        self._maybe_flush()
+
+    def add_debug_event(self, event):
+        if self.debug_container is None:
+            return
+        self._debug_events.append(json.dumps(event, indent=2, ensure_ascii=False))
+        self._debug_dirty = True
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        now = time.monotonic()
+        if self._pending_tokens >= self.flush_tokens or now - self._last_flush >= self.flush_interval:
+            self.flush(cursor=True)
+
+    def flush(self, cursor=False):
+        started_at = time.perf_counter()
+        if self._pending_tokens:
+            visible = "".join(self._visible)
+            self._visible = [visible]
+            self.placeholder.markdown(visible + ("▌" if cursor else ""))
+            self._pending_tokens = 0
+        if self._debug_dirty:
+            self.debug_container.code("\n".join(self._debug_events), language="json")
+            self._debug_dirty = False
+        self._last_flush = time.monotonic()
+        self.render_time += time.perf_counter() - started_at
+
+    def finish(self):
+        """Affiche la réponse finale sans curseur et retourne le texte visible"""
+        self._visible.append(self._stripper.finish())
+        visible = "".join(self._visible)
+        self._visible = [visible]
+        if visible:
+            started_at = time.perf_counter()
+            self.placeholder.markdown(visible)
+            self.render_time += time.perf_counter() - started_at
+        if self._debug_dirty:
+            self.flush()
+        return visible
@@ -0,0 +1,220 @@
+"""Mesures de streaming par requête pour les tests de charge.
+
+Chaque réponse SSE est chronométrée individuellement (TTFT, latences entre
+tokens, débit de sortie) ; les valeurs sont agrégées dans des histogrammes à
+précision relative fixe (façon HDR), fusionnables entre processus et
+exportables en CSV / JSON.
+"""
+import csv
+import json
+import math
+import os
+import threading
+import time
+
+# Nombre de chiffres significatifs conservés par les histogrammes
+SIGNIFICANT_FIGURES = 3
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+class LatencyHistogram:
+    """Histogramme à buckets logarithmiques conservant SIGNIFICANT_FIGURES chiffres significatifs"""
+
+    def __init__(self, significant_figures=SIGNIFICANT_FIGURES):
+        self.significant_figures = significant_figures
+        self.counts = {}
+        self.total = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def _bucket(self, value):
+        if value <= 0:
+            return 0.0
+        magnitude = math.floor(math.log10(value)) - self.significant_figures + 1
+        return round(round(value / 10 ** magnitude) * 10 ** magnitude, 12)
+
+    def record(self, value):
+        bucket = self._bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        if not self.total:
+            return None
+        rank = math.ceil(self.total * percent / 100)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return bucket
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum / self.total if self.total else None
+
+    def summary(self):
+        result = {
+            "count": self.total,
+            "mean": self.mean,
+            "min": self.min if self.total else None,
+            "max": self.max if self.total else None,
+        }
+        for percent in PERCENTILES:
+            result[f"p{percent:g}"] = self.percentile(percent)
+        return result
+
+    def to_dict(self):
+        return {
+            "counts": [[bucket, count] for bucket, count in self.counts.items()],
+            "total": self.total,
+            "sum": self.sum,
+            "min": self.min if self.total else None,
+            "max": self.max,
+        }
+
+    def merge(self, data):
+        """Ajoute un histogramme sérialisé par to_dict() (ex. reçu d'un worker)"""
+        for bucket, count in data["counts"]:
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.total += data["total"]
+        self.sum += data["sum"]
+        if data["min"] is not None:
+            self.min = min(self.min, data["min"])
+        self.max = max(self.max, data["max"])
+
+
+class StreamTimer:
+    """Chronomètre d'une réponse en streaming"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self.last_token_at = None
+        self.inter_token = []
+        self.tokens = 0
+        self.reported_output_tokens = None
+
+    def on_token(self):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        else:
+            self.inter_token.append(now - self.last_token_at)
+        self.last_token_at = now
+        self.tokens += 1
+
+    def on_usage(self, usage):
+        if usage.get("output_tokens"):
+            self.reported_output_tokens = usage["output_tokens"]
+
+    @property
+    def output_tokens(self):
+        return self.reported_output_tokens or self.tokens
+
+    @property
+    def ttft(self):
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def tokens_per_second(self):
+        """Débit de génération, hors temps d'attente du premier token"""
+        if self.first_token_at is None or self.last_token_at == self.first_token_at:
+            return None
+        return (self.output_tokens - 1) / (self.last_token_at - self.first_token_at)
+
+
+class StreamingMetrics:
+    """Agrégat thread-safe des mesures de toutes les requêtes en streaming"""
+
+    METRICS = ("ttft_ms", "itl_ms", "tokens_per_s", "duration_ms")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+            self.started_at = time.time()
+
+    def _clear(self):
+        self.histograms = {name: LatencyHistogram() for name in self.METRICS}
+        self.requests = 0
+        self.failures = 0
+        self.output_tokens = 0
+
+    def record(self, timer, failed=False):
+        duration = time.perf_counter() - timer.started_at
+        with self._lock:
+            self.requests += 1
+            if failed:
+                self.failures += 1
+            self.output_tokens += timer.output_tokens
+            self.histograms["duration_ms"].record(duration * 1000)
+            if timer.ttft is not None:
+                self.histograms["ttft_ms"].record(timer.ttft * 1000)
+            for gap in timer.inter_token:
+                self.histograms["itl_ms"].record(gap * 1000)
+            if timer.tokens_per_second is not None:
+                self.histograms["tokens_per_s"].record(timer.tokens_per_second)
+
+    def _to_dict(self):
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "output_tokens": self.output_tokens,
+            "histograms": {name: hist.to_dict() for name, hist in self.histograms.items()},
+        }
+
+    def to_dict(self):
+        with self._lock:
+            return self._to_dict()
+
+    def drain(self):
+        """Retourne les mesures accumulées depuis le dernier appel et les remet à zéro (rapports d'un worker)"""
+        with self._lock:
+            data = self._to_dict()
+            self._clear()
+            return data
+
+    def merge(self, data):
+        with self._lock:
+            self.requests += data["requests"]
+            self.failures += data["failures"]
+            self.output_tokens += data["output_tokens"]
+            for name, hist in data["histograms"].items():
+                self.histograms[name].merge(hist)
+
+    def summary(self):
+        with self._lock:
+            elapsed = time.time() - self.started_at
+            return {
+                "requests": self.requests,
+                "failures": self.failures,
+                "output_tokens": self.output_tokens,
+                "output_tokens_per_s_total": self.output_tokens / elapsed if elapsed > 0 else None,
+                **{name: hist.summary() for name, hist in self.histograms.items()},
+            }
+
+    def export(self, prefix, extra=None):
+        """Écrit le résumé dans <prefix>.json (complété par extra) et <prefix>.csv"""
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        summary = self.summary()
+        with open(f"{prefix}.json", "w", encoding="utf-8") as file:
+            json.dump({**summary, **(extra or {})}, file, indent=2, ensure_ascii=False)
+        columns = ["metric", "count", "mean", "min", "max"] + [f"p{percent:g}" for percent in PERCENTILES]
+        with open(f"{prefix}.csv", "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=columns)
+            writer.writeheader()
+            for name in self.METRICS:
+                writer.writerow({"metric": name, **summary[name]})
+        return summary
@@ -1,13 +1,31 @@
 import streamlit as st
 from dotenv import load_dotenv
 import os
-import tempfile
-import httpx
-import json
+import time
 from datetime import datetime
 import pandas as pd
-import re
-import numpy as np
+from zylon_client import ZylonClient
+from limiter import Overloaded
+from telemetry import Telemetry, PhaseRecorder
+from retrieval import retrieve, generate_embeddings, build_context_filter
+from semantic_cache import SemanticCache, history_key
+from rerank import ChunkEmbeddingCache, rerank_chunks, RERANK_CANDIDATES
+from ingestion import IngestionEngine, IngestJob
+from preprocess import supports as can_preprocess
+from dedup_index import DedupIndex, content_hash, text_hash
+from catalogue import DocumentCatalogue
+from history import HistoryManager
+from session_store import (
+    open_session_store, new_session_token, is_session_token, session_key, SESSION_USER_HEADER
+)
+from jobs import JobManager
+from bulk_rag import BulkRagRun, load_queries, DEFAULT_PROMPT as BULK_RAG_PROMPT
+from streaming import StreamRenderer, strip_citations
+import sse
+
+# Configuration de la page Streamlit : première commande Streamlit, avant les ressources en cache
+# (le spinner affiché lors de leur création compte comme un élément de la page)
+st.set_page_config(page_title="MonChatZylon", page_icon="🤖")
 
 # Chargement des variables d'environnement
 load_dotenv()
@@ -18,41 +36,176 @@ if not API_URL:
     st.error("L'URL de l'API n'est pas définie dans le fichier .env")
     st.stop()
 
-# Configuration des timeouts et limites
-UPLOAD_TIMEOUT = 1800  # 30 minutes pour les gros fichiers
-
-
 headers = {
     "accept": "application/json",
     "Content-Type": "application/json"
 }
 
-# Configuration de la page Streamlit
-st.set_page_config(page_title="MonChatZylon", page_icon="🤖")
+# Mesures (spans OpenTelemetry, endpoint Prometheus) partagées par les sessions
+@st.cache_resource
+def get_telemetry():
+    return Telemetry()
+
+telemetry = get_telemetry()
+
+# Client HTTP partagé entre les reruns et les sessions (pool de connexions unique)
+@st.cache_resource
+def get_api_client():
+    return ZylonClient(API_URL, telemetry=telemetry)
+
+api_client = get_api_client()
+
+# Cache sémantique des réponses, partagé entre les sessions
+@st.cache_resource
+def get_semantic_cache():
+    return SemanticCache()
+
+semantic_cache = get_semantic_cache()
+
+# Embeddings des chunks, réutilisés d'une question à l'autre (clé : id du chunk)
+@st.cache_resource
+def get_chunk_embedding_cache():
+    return ChunkEmbeddingCache()
+
+chunk_embedding_cache = get_chunk_embedding_cache()
+
+# Moteur d'ingestion par lots (workers bornés, partagé entre les sessions)
+@st.cache_resource
+def get_ingestion_engine():
+    return IngestionEngine(api_client)
+
+ingestion_engine = get_ingestion_engine()
+
+# Index persistant des contenus déjà ingérés (empreinte SHA-256 -> artefact)
+@st.cache_resource
+def get_dedup_index():
+    return DedupIndex()
+
+dedup_index = get_dedup_index()
+
+# Catalogue des documents mis en cache (TTL) et indexé pour la recherche
+@st.cache_resource
+def get_document_catalogue():
+    # Oubli des empreintes dont l'artefact a disparu de la collection
+    return DocumentCatalogue(
+        api_client,
+        on_refresh=lambda documents: dedup_index.reconcile(doc["artifact"] for doc in documents)
+    )
+
+document_catalogue = get_document_catalogue()
+
+# Fonction appelée après toute modification de la collection chat_documents
+def on_collection_changed():
+    semantic_cache.invalidate()
+    document_catalogue.invalidate()
+
+# Fonction appelée par le suivi des tâches asynchrones (thread de la boucle du client)
+def on_task_finished(job):
+    if job.status != "completed":
+        return
+    if job.kind == "ingest_uri":
+        on_collection_changed()
+
+# Tâches longues (résumés, rapports, ingestions par URI) suivies en tâche de fond
+@st.cache_resource
+def get_job_manager():
+    return JobManager(api_client, on_complete=on_task_finished)
+
+job_manager = get_job_manager()
+
+# Conversations stockées hors du processus (SQLite local ou Redis) pour servir plusieurs réplicas
+@st.cache_resource
+def get_session_store():
+    return open_session_store()
+
+session_store = get_session_store()
+
 st.title("Chat avec Mistral Small 3")
 
 # Ajout du mode debug
 debug_mode = st.sidebar.checkbox("Mode Debug", value=False)
 
-# Initialisation des variables de session
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-if "uploaded_files" not in st.session_state:
-    st.session_state.uploaded_files = []
+# Démarrage de la génération pendant la recherche des sources
+speculative_mode = st.sidebar.checkbox(
+    "Réponse anticipée",
+    value=False,
+    help="Lance la génération sans attendre la recherche des sources (effectuée par le serveur, sans "
+         "re-classement local) ; les sources récupérées en parallèle s'affichent dès qu'elles arrivent"
+)
+
+# Réutilisation des réponses à des questions sémantiquement proches
+use_semantic_cache = st.sidebar.checkbox(
+    "Cache sémantique",
+    value=False,
+    help="Réutilise la réponse d'une question très proche déjà posée (invalidé à chaque modification des documents)"
+)
+
+# Re-classement local des chunks (similarité + diversité MMR, budget de tokens)
+use_rerank = st.sidebar.checkbox(
+    "Re-classement local (MMR)",
+    value=False,
+    help="Re-classe localement les extraits récupérés et les transmet au modèle comme contexte (plus pertinent et moins redondant)"
+)
+
+# Utilisateur authentifié transmis par le proxy (SESSION_USER_HEADER), auquel les sessions sont liées
+def get_session_owner():
+    if not SESSION_USER_HEADER:
+        return None
+    from streamlit.web.server.websocket_headers import _get_websocket_headers
+    headers = {name.lower(): value for name, value in (_get_websocket_headers() or {}).items()}
+    return headers.get(SESSION_USER_HEADER.lower())
+
+session_owner = get_session_owner()
+if SESSION_USER_HEADER and not session_owner:
+    st.error(f"Utilisateur non authentifié (en-tête {SESSION_USER_HEADER} absent)")
+    st.stop()
+
+# Jeton de session porté par l'URL : la conversation est retrouvée sur n'importe quel réplica.
+# Un jeton absent ou non généré par le serveur (devinable) est remplacé par un nouveau.
+session_token = st.query_params.get("session")
+if not is_session_token(session_token):
+    session_token = new_session_token()
+    st.query_params["session"] = session_token
+session_id = session_key(session_token, session_owner)
+
+# Initialisation des variables de session (rechargées depuis le stockage si la session change)
+if st.session_state.get("session_id") != session_id:
+    st.session_state.session_id = session_id
+    st.session_state.messages = session_store.load_messages(session_id)
+    st.session_state.uploaded_files = session_store.get_value(session_id, "uploaded_files", [])
 if "upload_progress" not in st.session_state:
     st.session_state.upload_progress = {}
+if "ingest_jobs" not in st.session_state:
+    st.session_state.ingest_jobs = []
+if "history_manager" not in st.session_state:
+    st.session_state.history_manager = HistoryManager(api_client)
+if "phase_timings" not in st.session_state:
+    st.session_state.phase_timings = PhaseRecorder()
+# Les mesures de ce rerun (et des coroutines qu'il lance) alimentent le panneau de la session
+telemetry.bind(st.session_state.phase_timings)
+if "notified_jobs" not in st.session_state:
+    # Les tâches déjà terminées à l'ouverture de la session ne sont pas notifiées
+    st.session_state.notified_jobs = {job.job_id for job in job_manager.jobs(session_id) if job.finished}
+
+# Ajout d'un message à la conversation (mémoire de la session et stockage partagé)
+def add_message(role, content):
+    message = {"role": role, "content": content}
+    st.session_state.messages.append(message)
+    session_store.append_message(session_id, message)
+
+# Notification des tâches de la session terminées depuis le dernier rerun
+for job in job_manager.jobs(session_id):
+    if job.finished and job.job_id not in st.session_state.notified_jobs:
+        st.session_state.notified_jobs.add(job.job_id)
+        if job.status == "completed":
+            st.toast(f"Tâche terminée : {job.label}", icon="✅")
+        else:
+            st.toast(f"Tâche en échec : {job.label}", icon="❌")
 
-# Fonction pour lister les documents ingérés avec pagination et recherche
-def list_ingested_documents():
+# Fonction pour lister les documents ingérés (catalogue en cache) avec recherche
+def list_ingested_documents(query=""):
     try:
-        with httpx.Client(timeout=30.0) as client:
-            response = client.get(
-                f"{API_URL}/v1/ingest/list",
-                params={"collection": "chat_documents"},
-                headers={"accept": "application/json"}
-            )
-            response.raise_for_status()
-            return response.json()
+        return document_catalogue.search(query)
     except Exception as e:
         st.error(f"Erreur lors de la récupération des documents: {str(e)}")
         return None
@@ -60,143 +213,176 @@ def list_ingested_documents():
 # Fonction pour supprimer un document
 def delete_document(artifact_name):
     try:
-        with httpx.Client(timeout=30.0) as client:
-            response = client.post(
-                f"{API_URL}/v1/delete",
-                json={
-                    "collection": "chat_documents",
-                    "artifact": artifact_name
-                },
-                headers={"accept": "application/json"}
-            )
-            response.raise_for_status()
-            return True
+        api_client.request(
+            "POST",
+            "/v1/delete",
+            endpoint="delete",
+            json={
+                "collection": "chat_documents",
+                "artifact": artifact_name
+            },
+            headers={"accept": "application/json"}
+        )
+        dedup_index.remove_artifact(artifact_name)
+        on_collection_changed()
+        return True
     except Exception as e:
         st.error(f"Erreur lors de la suppression du document: {str(e)}")
         return False
 
 
-def upload_file_with_progress(file_path, file_name, progress_bar):
-    try:
-        file_size = os.path.getsize(file_path)
-        uploaded_size = 0
-        
-        # Configuration spéciale pour les gros fichiers PDF
-        is_large_pdf = file_name.lower().endswith('.pdf') and file_size > 50 * 1024 * 1024  # > 50MB
-        
-        with open(file_path, 'rb') as file:
-            files = {'file': (file_name, file)}
-            params = {
-                'artifact': file_name,
-                'collection': 'chat_documents'
-            }
-            
-            # Configuration du client avec timeout adapté
-            timeout = UPLOAD_TIMEOUT if is_large_pdf else 300  # 30 minutes pour gros PDF, 5 minutes pour autres
-            client = httpx.Client(timeout=timeout)
-            
-            try:
-                # Utilisation de httpx.stream pour suivre la progression de l'upload
-                with client.stream(
-                    "POST",
-                    f"{API_URL}/v1/ingest/file",
-                    headers={"accept": "application/json"},
-                    files=files,
-                    params=params
-                ) as response:
-                    response.raise_for_status()
-                    
-                    # Mise à jour de la barre de progression basée sur la réponse
-                    for chunk in response.iter_bytes():
-                        if response.status_code == 200:
-                            progress_bar.progress(1.0)  # Upload terminé avec succès
-                        else:
-                            progress_bar.progress(0.0)  # Erreur lors de l'upload
-                    
-                    return True
-            except httpx.TimeoutException:
-                if is_large_pdf:
-                    st.warning(f"Le fichier {file_name} est très volumineux. Tentative avec un timeout plus long...")
-                    # Nouvelle tentative avec un timeout encore plus long
-                    with httpx.Client(timeout=3600) as retry_client:  # 1 heure
-                        with retry_client.stream(
-                            "POST",
-                            f"{API_URL}/v1/ingest/file",
-                            headers={"accept": "application/json"},
-                            files=files,
-                            params=params
-                        ) as retry_response:
-                            retry_response.raise_for_status()
-                            progress_bar.progress(1.0)  # Upload terminé avec succès
-                            return True
-                raise
-    except Exception as e:
-        progress_bar.progress(0.0)  # Erreur lors de l'upload
-        raise e
-    finally:
-        client.close()
+DOCUMENTS_PER_PAGE = 20
 
-# Fonction pour générer des embeddings
-def generate_embeddings(text):
-    try:
-        with httpx.Client(timeout=30.0) as client:
-            response = client.post(
-                f"{API_URL}/v1/embeddings",
-                json={"input": text},
-                headers=headers
-            )
-            response.raise_for_status()
-            return response.json()
-    except Exception as e:
-        st.error(f"Erreur lors de la génération des embeddings: {str(e)}")
-        return None
+INGEST_STATUS_LABELS = {
+    "pending": "En attente",
+    "extracting": "Extraction locale du texte",
+    "uploading": "Envoi",
+    "processing": "Traitement serveur",
+    "retrying": "Nouvelle tentative",
+    "done": "Terminé",
+    "failed": "Échec",
+}
 
-# Fonction pour filtrer les chunks par similarité
-def filter_chunks_by_similarity(query_embedding, chunks, threshold=0.7):
-    filtered_chunks = []
-    for chunk in chunks:
-        if "score" in chunk:
-            if chunk["score"] > threshold:
-                chunk["similarity_score"] = chunk["score"]
-                filtered_chunks.append(chunk)
-    return sorted(filtered_chunks, key=lambda x: x["similarity_score"], reverse=True)
-
-# Fonction pour rechercher des chunks pertinents
-def search_chunks(query, collection="chat_documents", limit=5):
-    try:
-        with httpx.Client(timeout=30.0) as client:
-            response = client.post(
-                f"{API_URL}/v1/chunks",
-                json={
-                    "text": query,
-                    "context_filter": {
-                        "collection": collection
-                    },
-                    "limit": limit
-                },
-                headers=headers
+TASK_STATUS_ICONS = {
+    "pending": "🕓",
+    "running": "⚙️",
+    "completed": "✅",
+    "failed": "❌",
+}
+
+# Fonction pour ingérer un lot de documents en parallèle avec suivi de la progression
+def run_ingestion_with_progress(jobs):
+    if not jobs:
+        return
+    st.session_state.ingest_jobs = jobs
+    progress_bars = {}
+    for job in jobs:
+        size_mb = job.size / (1024 * 1024)
+        label = f"{job.name} ({size_mb:.1f} MB)" if job.size else job.name
+        progress_bars[job.name] = (st.progress(0.0, text=f"En attente : {label}"), label)
+
+    future = ingestion_engine.start(jobs)
+    while True:
+        for job in jobs:
+            progress_bar, label = progress_bars[job.name]
+            status = INGEST_STATUS_LABELS.get(job.status, job.status)
+            transfer = job.transfer
+            # Tous les octets sont partis : le serveur analyse le document
+            if job.status == "uploading" and transfer is not None and transfer.fraction >= 1.0:
+                status = INGEST_STATUS_LABELS["processing"]
+            if job.attempts > 1:
+                status += f" (tentative {job.attempts})"
+            text = f"{status} : {label}"
+            if transfer is not None and job.status != "done":
+                text += f" — {transfer.describe()}"
+            progress_bar.progress(job.progress, text=text)
+        if future.done():
+            break
+        time.sleep(0.25)
+    future.result()
+
+    for job in jobs:
+        if job.status == "done":
+            if job.name not in st.session_state.uploaded_files:
+                st.session_state.uploaded_files.append(job.name)
+                session_store.set_value(session_id, "uploaded_files", st.session_state.uploaded_files)
+            if job.content_hash:
+                dedup_index.add(job.content_hash, job.name, job.collection, job.size)
+            transfer = job.transfer
+            if job.fallback_reason:
+                st.info(f"{job.name} envoyé tel quel : {job.fallback_reason}")
+            if job.extracted:
+                st.success(
+                    f"Texte de {job.name} extrait localement et ingéré! "
+                    f"({job.text_size / 1024:.0f} Ko envoyés au lieu de {job.size / (1024 * 1024):.1f} MB)"
+                )
+            elif transfer is not None and transfer.throughput:
+                st.success(
+                    f"Fichier {job.name} téléchargé avec succès! "
+                    f"({transfer.throughput / (1024 * 1024):.1f} MB/s en {transfer.elapsed:.1f}s)"
+                )
+            else:
+                st.success(f"Fichier {job.name} téléchargé avec succès!")
+        else:
+            st.error(f"Erreur lors du téléchargement de {job.name}: {str(job.error)}")
+    if any(job.status == "done" for job in jobs):
+        on_collection_changed()
+
+# Fonction pour exécuter un lot de questions avec affichage progressif des résultats
+def run_bulk_rag_with_progress(run):
+    st.session_state.bulk_rag_run = run
+    total = len(run.queries)
+    progress_bar = st.progress(0.0, text="Envoi des questions...")
+    table = st.empty()
+    future = run.start(api_client)
+    while True:
+        progress_bar.progress(
+            run.done / total if total else 1.0,
+            text=f"{run.done}/{total} question(s) — {run.throughput:.1f} question(s)/s"
+        )
+        table.dataframe(run.dataframe(), use_container_width=True)
+        if future.done():
+            break
+        time.sleep(0.5)
+    future.result()
+    progress_bar.empty()
+    table.empty()
+
+# Fonction pour récupérer (et éventuellement re-classer) les chunks de la question
+async def prepare_retrieval(query, query_embedding=None, context_filter=None, rerank=True):
+    with telemetry.span("retrieval", rerank=rerank, scoped=bool(context_filter and len(context_filter) > 1)):
+        if not rerank:
+            return await retrieve(api_client, query, embedding=query_embedding, context_filter=context_filter)
+        retrieval = await retrieve(
+            api_client, query, limit=RERANK_CANDIDATES, need_embedding=True, embedding=query_embedding,
+            context_filter=context_filter
+        )
+        if retrieval.ok:
+            retrieval.chunks = await rerank_chunks(
+                api_client, retrieval.embedding, retrieval.chunks, chunk_embedding_cache
             )
-            response.raise_for_status()
-            return response.json()
-    except Exception as e:
-        st.error(f"Erreur lors de la recherche des chunks: {str(e)}")
-        return None
+        return retrieval
+
+# Fonction pour construire le message de contexte à partir des chunks re-classés
+def build_context_message(retrieval):
+    # Les chunks re-classés respectent déjà le nombre maximal et le budget de tokens
+    extracts = "\n\n".join(
+        f"[{chunk.get('document', {}).get('artifact', 'N/A')}]\n{chunk['text']}" for chunk in retrieval.chunks
+    )
+    return {"role": "system", "content": f"Contexte (extraits des documents) :\n\n{extracts}"}
+
+# Fonction pour afficher les sources pertinentes d'une réponse
+def render_sources(relevant_sources):
+    st.write("Sources pertinentes (score > 70%) :")
+    # Trier les sources par score décroissant
+    for source in sorted(relevant_sources, key=lambda x: x.get('score', 0), reverse=True):
+        with st.expander(f"📄 {source.get('document', {}).get('artifact', 'N/A')} (Score: {source.get('score', 0):.2f})"):
+            st.write(f"**Document:** {source.get('document', {}).get('artifact', 'N/A')}")
+            st.write(f"**Extrait:** {source.get('text', 'N/A')}")
+            st.write("---")
 
 # Fonction pour ingérer du texte
 def ingest_text(text, artifact_name):
+    sha256 = text_hash(text)
+    existing = dedup_index.lookup(sha256)
+    if existing:
+        st.info(f"Ce texte est déjà ingéré sous le nom « {existing} ».")
+        return False
     try:
-        with httpx.Client(timeout=30.0) as client:
-            response = client.post(
-                f"{API_URL}/v1/ingest/text",
-                json={
-                    "text": text,
-                    "artifact": artifact_name,
-                    "collection": "chat_documents"
-                },
-                headers=headers
-            )
-            response.raise_for_status()
-            return True
+        api_client.request(
+            "POST",
+            "/v1/ingest/text",
+            endpoint="ingest_text",
+            json={
+                "text": text,
+                "artifact": artifact_name,
+                "collection": "chat_documents"
+            },
+            headers=headers
+        )
+        dedup_index.add(sha256, artifact_name, size=len(text))
+        on_collection_changed()
+        return True
     except Exception as e:
         st.error(f"Erreur lors de l'ingestion du texte: {str(e)}")
         return False
@@ -204,23 +390,58 @@ def ingest_text(text, artifact_name):
 # Sidebar pour le téléchargement des fichiers
 with st.sidebar:
     st.header("📁 Gestion des fichiers")
+
+    # Compteurs d'utilisation du pool de connexions
+    if debug_mode:
+        with st.expander("🔌 Pool de connexions"):
+            st.json(api_client.pool_stats())
+        with st.expander("🧠 Cache sémantique"):
+            st.json(semantic_cache.stats())
+
+    # Durées par phase mesurées pendant cette session (ms, débits en tokens/s)
+    phase_rows = st.session_state.phase_timings.summary()
+    if phase_rows:
+        with st.expander("⏱️ Performances"):
+            st.dataframe(pd.DataFrame(phase_rows).set_index("phase").round(1), use_container_width=True)
+            st.caption(" · ".join(f"{name} : {value}" for name, value in telemetry.status().items()))
     
-    # Bouton pour télécharger l'historique du chat
+    # Export de l'historique du chat, construit uniquement à la demande
     if st.session_state.messages:
-        chat_history = {
-            "messages": st.session_state.messages,
-            "timestamp": datetime.now().isoformat(),
-            "version": "1.0"
-        }
-        st.download_button(
-            label="📥 Télécharger l'historique du chat",
-            data=json.dumps(chat_history, ensure_ascii=False, indent=2),
-            file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-            mime="application/json"
-        )
+        if st.button("📥 Exporter l'historique du chat"):
+            st.download_button(
+                label="💾 Télécharger l'historique",
+                data=session_store.export(session_id),
+                file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                mime="application/json"
+            )
     
+    # Périmètre de la recherche de contexte : documents et métadonnées choisis, ou déduits de la question
+    with st.expander("🎯 Périmètre de recherche"):
+        scope_mode = st.radio(
+            "Rechercher dans",
+            ["Toute la collection", "Sélection", "Automatique"],
+            key="scope_mode",
+            help="Automatique : la recherche est limitée aux documents dont le nom ou les métadonnées "
+                 "correspondent aux termes de la question"
+        )
+        scope_artifacts, scope_metadata = [], {}
+        if scope_mode == "Sélection":
+            scope_artifacts = st.multiselect(
+                "Documents",
+                [doc["artifact"] for doc in list_ingested_documents() or []],
+                key="scope_artifacts"
+            )
+            try:
+                facets = document_catalogue.facets()
+            except Exception:
+                facets = {}
+            for facet_key, facet_values in facets.items():
+                facet_value = st.selectbox(facet_key, ["(toutes)"] + facet_values, key=f"scope_facet_{facet_key}")
+                if facet_value != "(toutes)":
+                    scope_metadata[facet_key] = facet_value
+
     # Onglets pour choisir entre fichier et texte
-    tab1, tab2 = st.tabs(["📄 Fichiers", "📝 Texte"])
+    tab1, tab2, tab3 = st.tabs(["📄 Fichiers", "📝 Texte", "⏳ Tâches"])
     
     with tab1:
         st.subheader("Télécharger des fichiers")
@@ -237,43 +458,85 @@ with st.sidebar:
                 size_mb = file.size / (1024 * 1024)
                 st.write(f"- {file.name} ({size_mb:.1f} MB)")
             
+            preprocess_locally = st.checkbox(
+                "Extraire le texte localement",
+                value=False,
+                help="Analyse les PDF, DOCX et TXT sur cette machine et n'envoie que le texte ; "
+                     "les documents scannés sont envoyés tels quels"
+            )
+
             if st.button("Commencer l'upload", type="primary"):
+                jobs = []
+                batch_hashes = {}
                 for uploaded_file in uploaded_files:
-                    if uploaded_file.name not in st.session_state.uploaded_files:
-                        try:
-                            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-                                tmp_file.write(uploaded_file.getvalue())
-                                tmp_file_path = tmp_file.name
-
-                            progress_bar = st.progress(0)
-                            file_size = os.path.getsize(tmp_file_path)
-                            size_mb = file_size / (1024 * 1024)
-                            st.write(f"Upload de {uploaded_file.name} en cours... ({size_mb:.1f} MB)")
-
-                            if upload_file_with_progress(tmp_file_path, uploaded_file.name, progress_bar):
-                                st.session_state.uploaded_files.append(uploaded_file.name)
-                                st.success(f"Fichier {uploaded_file.name} téléchargé avec succès!")
-                            else:
-                                st.error(f"Échec du téléchargement de {uploaded_file.name}")
-
-                        except Exception as e:
-                            st.error(f"Erreur lors du téléchargement de {uploaded_file.name}: {str(e)}")
-                        finally:
-                            try:
-                                if os.path.exists(tmp_file_path):
-                                    os.unlink(tmp_file_path)
-                            except Exception as e:
-                                st.warning(f"Impossible de supprimer le fichier temporaire: {str(e)}")
-                    else:
-                        st.info(f"Le fichier {uploaded_file.name} a déjà été téléchargé dans cette session.")
+                    # Déduplication par contenu : un même fichier renommé n'est pas ré-ingéré
+                    sha256 = content_hash(uploaded_file)
+                    existing = dedup_index.lookup(sha256) or batch_hashes.get(sha256)
+                    if existing:
+                        st.info(f"Le contenu de {uploaded_file.name} est déjà ingéré sous le nom « {existing} ».")
+                        continue
+                    batch_hashes[sha256] = uploaded_file.name
+                    # Envoi direct depuis le tampon d'upload, sans fichier temporaire
+                    jobs.append(IngestJob(
+                        uploaded_file.name, source=uploaded_file, size=uploaded_file.size, content_hash=sha256,
+                        preprocess=preprocess_locally and can_preprocess(uploaded_file.name)
+                    ))
+                run_ingestion_with_progress(jobs)
+
+        # Reprise des documents en échec lors du dernier lot
+        failed_jobs = [job for job in st.session_state.ingest_jobs if job.status == "failed"]
+        if failed_jobs and st.button(f"Reprendre les {len(failed_jobs)} upload(s) en échec"):
+            run_ingestion_with_progress(st.session_state.ingest_jobs)
+
+        # Ingestion asynchrone côté serveur pour les documents accessibles par URI
+        with st.expander("🔗 Ingérer par URI"):
+            uris_input = st.text_area(
+                "Une URI par ligne",
+                help="Recommandé pour les gros fichiers : le serveur télécharge et traite le document en tâche de fond"
+            )
+            if st.button("Ingérer les URI"):
+                uris = [uri.strip() for uri in uris_input.splitlines() if uri.strip()]
+                # Tâches serveur suivies dans l'onglet « Tâches » : l'interface n'est pas bloquée
+                for uri in uris:
+                    artifact = uri.rstrip("/").rsplit("/", 1)[-1] or uri
+                    try:
+                        job_manager.submit(
+                            "ingest_uri",
+                            {"uri": uri, "artifact": artifact, "collection": "chat_documents"},
+                            label=f"Ingestion de {artifact}",
+                            meta={"artifact": artifact},
+                            session_id=session_id
+                        )
+                    except Exception as e:
+                        st.error(f"Erreur lors de la création de la tâche pour {uri}: {str(e)}")
+                if uris:
+                    st.success(f"{len(uris)} tâche(s) d'ingestion créée(s), suivies dans l'onglet « Tâches ».")
         
         st.divider()
         
         # Affichage des documents existants
-        documents = list_ingested_documents()
-        if documents and "data" in documents:
-            st.subheader("📚 Documents disponibles")
-            for doc in documents["data"]:
+        st.subheader("📚 Documents disponibles")
+        search_col, refresh_col = st.columns([4, 1])
+        with search_col:
+            document_query = st.text_input(
+                "Filtrer les documents",
+                placeholder="Nom ou métadonnée...",
+                label_visibility="collapsed",
+                key="document_query"
+            )
+        with refresh_col:
+            if st.button("🔄", help="Recharger la liste des documents"):
+                document_catalogue.invalidate()
+
+        documents = list_ingested_documents(document_query)
+        if documents:
+            page_documents, pages = DocumentCatalogue.paginate(
+                documents, st.session_state.get("document_page", 1), DOCUMENTS_PER_PAGE
+            )
+            # La page courante peut dépasser le nombre de pages après un filtrage
+            if st.session_state.get("document_page", 1) > pages:
+                st.session_state.document_page = pages
+            for doc in page_documents:
                 col1, col2 = st.columns([3, 1])
                 with col1:
                     st.write(f"📄 {doc['artifact']}")
@@ -282,6 +545,11 @@ with st.sidebar:
                         if delete_document(doc['artifact']):
                             st.success(f"Document {doc['artifact']} supprimé avec succès!")
                             st.rerun()
+            if pages > 1:
+                st.number_input("Page", min_value=1, max_value=pages, key="document_page")
+            st.caption(f"{len(documents)} document(s)")
+        elif document_query and documents is not None:
+            st.info("Aucun document ne correspond à la recherche")
         else:
             st.info("Aucun document disponible")
 
@@ -298,41 +566,185 @@ with st.sidebar:
             else:
                 st.warning("Veuillez entrer du texte et un nom de document")
 
+    with tab3:
+        st.subheader("Résumés et rapports")
+        task_kind = st.radio("Type de tâche", ["Résumé", "Rapport"], horizontal=True)
+        catalogue_documents = list_ingested_documents() or []
+        task_artifacts = st.multiselect(
+            "Documents concernés",
+            [doc["artifact"] for doc in catalogue_documents],
+            help="Aucun document sélectionné : toute la collection est utilisée"
+        )
+        task_instructions = st.text_area(
+            "Instructions",
+            placeholder="Ex. : Synthèse des points clés en 10 lignes" if task_kind == "Résumé"
+            else "Ex. : Analyse des risques du projet"
+        )
+        if st.button("Lancer la tâche", key="submit_task"):
+            context_filter = build_context_filter(artifacts=task_artifacts)
+            scope = ", ".join(task_artifacts) if task_artifacts else "collection"
+            try:
+                if task_kind == "Résumé":
+                    body = {"use_context": True, "context_filter": context_filter, "stream": False}
+                    if task_instructions:
+                        body["instructions"] = task_instructions
+                    job_manager.submit("summarize", body, label=f"Résumé ({scope})", session_id=session_id)
+                elif task_instructions:
+                    job_manager.submit(
+                        "report",
+                        {"instructions": task_instructions, "use_context": True, "context_filter": context_filter},
+                        label=f"Rapport ({scope})",
+                        session_id=session_id
+                    )
+                else:
+                    st.warning("Veuillez entrer les instructions du rapport")
+            except Exception as e:
+                st.error(f"Erreur lors de la création de la tâche: {str(e)}")
+
+        st.divider()
+        jobs_col, refresh_jobs_col = st.columns([4, 1])
+        with jobs_col:
+            st.subheader("Suivi")
+        with refresh_jobs_col:
+            st.button("🔄", key="refresh_jobs", help="Actualiser l'état des tâches")
+
+        task_jobs = job_manager.jobs(session_id)
+        for job in task_jobs:
+            title = f"{TASK_STATUS_ICONS.get(job.status, '')} {job.label} — {job.elapsed:.0f}s"
+            with st.expander(title, expanded=False):
+                if job.status == "completed":
+                    content = job.content
+                    if content:
+                        st.markdown(strip_citations(content))
+                        st.download_button(
+                            "📥 Télécharger",
+                            data=content,
+                            file_name=f"{job.kind}_{job.job_id[:8]}.md",
+                            mime="text/markdown",
+                            key=f"download_{job.job_id}"
+                        )
+                    else:
+                        st.write("Tâche terminée.")
+                elif job.status == "failed":
+                    st.error(job.error or "Tâche en échec")
+                else:
+                    st.caption(f"Tâche {job.task_id} en cours côté serveur")
+        if not task_jobs:
+            st.info("Aucune tâche")
+        elif any(job.finished for job in task_jobs) and st.button("Effacer les tâches terminées"):
+            job_manager.clear_finished(session_id)
+            st.rerun()
+
+# Questions en lot via /v1/qa/bulk-rag
+with st.expander("📊 Questions en lot"):
+    queries_file = st.file_uploader(
+        "Fichier de questions (CSV, tableau JSON, JSONL ou une question par ligne)",
+        type=["csv", "jsonl", "json", "txt"],
+        key="bulk_rag_file"
+    )
+    bulk_rag_prompt = st.text_area("Consigne", value=BULK_RAG_PROMPT, key="bulk_rag_prompt")
+    if queries_file is not None:
+        try:
+            bulk_queries = load_queries(queries_file.getvalue(), queries_file.name)
+        except Exception as e:
+            st.error(f"Fichier de questions illisible: {str(e)}")
+            bulk_queries = []
+        st.caption(f"{len(bulk_queries)} question(s)")
+        if bulk_queries and st.button("Lancer le lot", type="primary"):
+            run_bulk_rag_with_progress(BulkRagRun(bulk_queries, prompt=bulk_rag_prompt))
+
+    bulk_rag_run = st.session_state.get("bulk_rag_run")
+    if bulk_rag_run is not None:
+        failed_queries = bulk_rag_run.failed_queries()
+        st.caption(
+            f"{bulk_rag_run.done - len(failed_queries)}/{len(bulk_rag_run.queries)} réponse(s) "
+            f"en {bulk_rag_run.elapsed:.1f}s ({bulk_rag_run.throughput:.1f} question(s)/s, "
+            f"lots de {bulk_rag_run.batch_size})"
+        )
+        st.dataframe(bulk_rag_run.dataframe(), use_container_width=True)
+        csv_col, jsonl_col = st.columns(2)
+        with csv_col:
+            st.download_button(
+                "📥 CSV",
+                data=bulk_rag_run.to_csv(),
+                file_name=f"bulk_rag_{bulk_rag_run.run_id}.csv",
+                mime="text/csv"
+            )
+        with jsonl_col:
+            st.download_button(
+                "📥 JSONL",
+                data=bulk_rag_run.to_jsonl(),
+                file_name=f"bulk_rag_{bulk_rag_run.run_id}.jsonl",
+                mime="application/jsonl"
+            )
+        if failed_queries and st.button(f"Relancer les {len(failed_queries)} question(s) en échec"):
+            bulk_rag_run.retry_failed()
+            run_bulk_rag_with_progress(bulk_rag_run)
+            st.rerun()
+
 # Affichage de l'historique des messages
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         if message["role"] == "assistant":
-            clean_content = re.sub(r'<citation.*?>.*?<\/citation>', '', message["content"], flags=re.DOTALL)
-            st.markdown(clean_content)
+            st.markdown(strip_citations(message["content"]))
         else:
             st.markdown(message["content"])
 
 # Zone de saisie pour l'utilisateur
 if prompt := st.chat_input("Entrez votre message ici..."):
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    add_message("user", prompt)
     with st.chat_message("user"):
         st.markdown(prompt)
 
+    full_response = ""
+    renderer = None
+    turn_started_at = time.perf_counter()
     try:
-        # Générer l'embedding de la requête
-        query_embedding_response = generate_embeddings(prompt)
-        if not query_embedding_response or "data" not in query_embedding_response:
-            st.error("Impossible de générer l'embedding de la requête")
-            st.stop()
-
-        query_embedding = query_embedding_response["data"][0]["embedding"]
-
-        # Rechercher les chunks pertinents
-        chunks_response = search_chunks(prompt)
-        if not chunks_response or "data" not in chunks_response:
-            st.error("Impossible de récupérer les chunks")
-            st.stop()
-
-        # Filtrer les chunks par similarité
-        filtered_chunks = filter_chunks_by_similarity(query_embedding, chunks_response["data"])
-        
-        # Construire le contexte à partir des chunks filtrés
-        context = "\n".join([chunk["text"] for chunk in filtered_chunks[:3]])  # Prendre les 3 plus pertinents
+        # Périmètre de la recherche, appliqué à /v1/chunks et /v1/chat/completions
+        if scope_mode == "Automatique":
+            try:
+                scope_artifacts = document_catalogue.infer_scope(prompt)
+            except Exception:
+                scope_artifacts = []
+        context_filter = build_context_filter(artifacts=scope_artifacts, metadata=scope_metadata)
+        scoped = len(context_filter) > 1
+
+        # Consultation du cache sémantique avant toute génération (réservé aux questions portant
+        # sur toute la collection, et limité aux réponses obtenues après le même historique)
+        query_embedding = None
+        cache_version = semantic_cache.version
+        cache_history = history_key(st.session_state.messages[:-1])
+        if use_semantic_cache and not scoped:
+            embedding_response = api_client.run(generate_embeddings(api_client, prompt))
+            query_embedding = embedding_response["data"][0]["embedding"]
+            with telemetry.span("cache.lookup"):
+                cached = semantic_cache.lookup(query_embedding, cache_history)
+            if cached:
+                score, cached_answer, cached_sources = cached
+                with st.chat_message("assistant"):
+                    st.markdown(strip_citations(cached_answer))
+                    st.caption(f"Réponse issue du cache (similarité {score:.2f})")
+                    if cached_sources:
+                        render_sources(cached_sources)
+                add_message("assistant", cached_answer)
+                telemetry.record("chat.turn", time.perf_counter() - turn_started_at)
+                st.stop()
+
+        # Contexte re-classé localement et transmis au modèle, sauf en mode anticipé : la recherche
+        # est alors confiée au serveur (use_context) et les sources locales sont récupérées en
+        # parallèle de la génération sur la boucle du client partagé
+        retrieval = None
+        sources_future = None
+        if speculative_mode:
+            sources_future = api_client.submit(
+                prepare_retrieval(prompt, query_embedding, context_filter, rerank=use_rerank)
+            )
+        elif use_rerank:
+            retrieval = api_client.run(prepare_retrieval(prompt, query_embedding, context_filter))
+            if not retrieval.ok:
+                for name, error in retrieval.errors.items():
+                    st.error(f"Erreur lors de la récupération ({name}): {str(error)}")
+                st.stop()
 
         # Préparation de la requête avec contexte
         messages = [
@@ -342,90 +754,145 @@ if prompt := st.chat_input("Entrez votre message ici..."):
             }
         ]
         
-        # Ajouter l'historique des messages
-        for message in st.session_state.messages:
-            messages.append({
-                "role": message["role"],
-                "content": message["content"]
-            })
+        # Ajouter l'historique des messages (fenêtre récente + résumé des anciens échanges)
+        messages.extend(st.session_state.history_manager.build(st.session_state.messages))
 
         # Configuration du contexte
         data = {
             "messages": messages,
-            "use_context": True,
-            "context_filter": {
-                "collection": "chat_documents"
-            },
             "stream": True,
             "include_sources": True,
             "generate_citations": True,
             "use_default_prompt": False  # Désactivé car nous utilisons notre propre prompt système
         }
+        if retrieval is not None:
+            messages.insert(1, build_context_message(retrieval))
+        else:
+            data.update({"use_context": True, "context_filter": context_filter})
 
         # Création d'un conteneur pour le message de l'assistant
         assistant_message = st.chat_message("assistant")
+        if scope_mode == "Automatique" and scope_artifacts:
+            assistant_message.caption(f"🎯 Recherche limitée à : {', '.join(scope_artifacts)}")
         message_placeholder = assistant_message.empty()
-        full_response = ""
+        # Sources affichées sous la réponse, éventuellement avant la fin de la génération
+        sources_container = assistant_message.container()
+        early_sources = False
+        response_sources = []
+        # Sources du contexte local (le serveur n'en renvoie pas sans use_context)
+        if retrieval is not None:
+            response_sources = [chunk for chunk in retrieval.chunks if chunk.get("score", 0) > 0.70]
+            if response_sources:
+                with sources_container:
+                    render_sources(response_sources)
+
+        def show_early_sources(future):
+            """Sources récupérées en parallèle de la génération ; retourne True si elles ont été affichées"""
+            try:
+                early = future.result()
+                error = next(iter(early.errors.values()), None)
+            except Exception as e:
+                error = e
+            if error is not None:
+                if debug_mode:
+                    sources_container.warning(f"Sources anticipées indisponibles : {str(error)}")
+                return False
+            relevant = [chunk for chunk in early.chunks if chunk.get("score", 0) > 0.70]
+            if relevant:
+                with sources_container:
+                    render_sources(relevant)
+            return bool(relevant)
+
+        # Position dans la file d'attente du client lorsque le backend est saturé
+        queue_positions = []
+
+        def show_queue_position(position):
+            queue_positions.append(position)
+            message_placeholder.info(f"⏳ Serveur très sollicité : requête en attente (position {position})")
 
         # Envoi de la requête avec streaming
-        with httpx.Client(timeout=30.0) as client:
-            with client.stream("POST", f"{API_URL}/v1/chat/completions", json=data, headers=headers) as response:
-                response.raise_for_status()
-                
+        stream_started_at = time.monotonic()
+        with api_client.stream("POST", "/v1/chat/completions", endpoint="chat", json=data, headers=headers,
+                               on_queue=show_queue_position) as response:
+            # Connexion : jusqu'à la réception des en-têtes de la réponse (attente en file comprise)
+            telemetry.record("chat.connect", time.monotonic() - stream_started_at)
+            if queue_positions:
+                message_placeholder.empty()
+            debug_container = None
+            if debug_mode:
+                st.write("Réponse brute de l'API:")
+                debug_container = st.empty()
+
+            # Affichage incrémental des fragments par lots
+            renderer = StreamRenderer(message_placeholder, debug_container=debug_container)
+
+            decoder = sse.SSEDecoder()
+            for event in decoder.iter_events(response.iter_bytes()):
                 if debug_mode:
-                    st.write("Réponse brute de l'API:")
-                    debug_container = st.empty()
-                    raw_response = ""
-                
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            # La ligne est déjà en format string
-                            if line.startswith('data: '):
-                                json_data = json.loads(line[6:])
-                                
-                                if debug_mode:
-                                    raw_response += f"\n{json.dumps(json_data, indent=2, ensure_ascii=False)}"
-                                    debug_container.code(raw_response, language="json")
-                                
-                                # Gérer les différents types d'événements
-                                if json_data.get('type') == 'content_block_delta':
-                                    delta = json_data.get('delta', {})
-                                    if delta.get('type') == 'text_delta':
-                                        text = delta.get('text', '')
-                                        full_response += text
-
-                                    elif delta.get('type') == 'source_delta':
-                                        sources = delta.get('sources', [])
-                                        if sources:
-                                            # Filtrer les sources avec un score > 0.70
-                                            relevant_sources = [s for s in sources if s.get('score', 0) > 0.70]
-                                            
-                                            if relevant_sources:
-                                                st.write("Sources pertinentes (score > 70%) :")
-                                                # Trier les sources par score décroissant
-                                                for source in sorted(relevant_sources, key=lambda x: x.get('score', 0), reverse=True):
-                                                    with st.expander(f"📄 {source.get('document', {}).get('artifact', 'N/A')} (Score: {source.get('score', 0):.2f})"):
-                                                        st.write(f"**Document:** {source.get('document', {}).get('artifact', 'N/A')}")
-                                                        st.write(f"**Extrait:** {source.get('text', 'N/A')}")
-                                                        st.write("---")
-                                            else:
-                                                st.info("Aucune source avec un score supérieur à 70% n'a été trouvée.")
-                                
-                        except json.JSONDecodeError as e:
-                            continue
-                        except Exception as e:
-                            continue
+                    renderer.add_debug_event(event.payload)
+
+                # Sources anticipées arrivées pendant la génération
+                if sources_future is not None and sources_future.done():
+                    renderer.flush()
+                    early_sources = show_early_sources(sources_future)
+                    sources_future = None
+
+                # Gérer les différents types d'événements
+                if event.kind == sse.TEXT:
+                    renderer.add(event.text)
+
+                elif event.kind == sse.SOURCES:
+                    if event.sources:
+                        # Filtrer les sources avec un score > 0.70
+                        relevant_sources = [s for s in event.sources if s.get('score', 0) > 0.70]
+
+                        if relevant_sources:
+                            # Déjà affichées si la recherche anticipée a abouti avant la fin du flux
+                            if not early_sources:
+                                renderer.flush()
+                                render_sources(relevant_sources)
+                            response_sources.extend(relevant_sources)
+                        elif not early_sources:
+                            st.info("Aucune source avec un score supérieur à 70% n'a été trouvée.")
+
+                elif event.kind == sse.ERROR:
+                    st.error(f"Erreur signalée par l'API : {event.error}")
+
+            if decoder.malformed:
+                st.warning(f"{decoder.malformed} événement(s) illisible(s) ignoré(s) dans la réponse.")
+
+            full_response = renderer.text
+            renderer.finish()
+            stream_finished_at = time.monotonic()
+            # Recherche anticipée encore en cours : les sources renvoyées par le serveur suffisent
+            if sources_future is not None:
+                sources_future.cancel()
+
+        # Phases du flux : premier token, débit de génération et coût de l'affichage
+        if renderer.first_token_at is not None:
+            telemetry.record("chat.ttft", renderer.first_token_at - stream_started_at)
+            generation_time = stream_finished_at - renderer.first_token_at
+            if generation_time > 0 and renderer.fragments > 1:
+                telemetry.record("chat.tokens_per_s", (renderer.fragments - 1) / generation_time)
+        telemetry.record("chat.render", renderer.render_time)
 
         # Mise à jour finale du message
         if full_response:
-            clean_response = re.sub(r'<citation.*?>.*?<\/citation>', '', full_response, flags=re.DOTALL)
-            message_placeholder.markdown(clean_response)
-            st.session_state.messages.append({"role": "assistant", "content": full_response})
+            add_message("assistant", full_response)
+            if query_embedding is not None:
+                semantic_cache.put(query_embedding, full_response, response_sources, cache_version, cache_history)
         else:
             st.error("Aucune réponse n'a été reçue de l'API")
+        telemetry.record("chat.turn", time.perf_counter() - turn_started_at, failed=not full_response)
+
+    except Overloaded as e:
+        telemetry.record("chat.turn", time.perf_counter() - turn_started_at, failed=True)
+        st.warning(f"{e}. Veuillez réessayer dans quelques instants.")
 
     except Exception as e:
+        telemetry.record("chat.turn", time.perf_counter() - turn_started_at, failed=True)
         st.error(f"Erreur: {str(e)}")
+        if renderer is not None:
+            full_response = renderer.text
         # Afficher la réponse complète en cas d'erreur
         st.write("Réponse complète:", full_response if full_response else "Pas de réponse disponible")
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""Mesures côté client : durées des appels API et des phases d'un échange de chat.
+
+Chaque mesure est enregistrée dans un histogramme global et dans celui de la
+session Streamlit courante (panneau de la barre latérale), et exportée vers
+OpenTelemetry et Prometheus lorsque ces paquets optionnels sont installés et
+activés par l'environnement.
+"""
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from streaming_metrics import LatencyHistogram
+
+try:
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+
+try:
+    import prometheus_client
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+# Export des spans : "otlp" (collecteur local), "console", "file" ou "none"
+OTEL_TRACES_EXPORTER = os.getenv("OTEL_TRACES_EXPORTER", "none")
+OTEL_TRACES_FILE = os.getenv("OTEL_TRACES_FILE", "results/traces.jsonl")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "zylon-chat")
+# Port du endpoint /metrics Prometheus (vide : désactivé)
+PROMETHEUS_PORT = os.getenv("PROMETHEUS_PORT", "")
+
+# Phases mesurées en secondes ; les autres valeurs (débits) sont enregistrées telles quelles
+RATE_SUFFIX = "_per_s"
+
+# Enregistreur de la session courante, propagé aux coroutines par ZylonClient.submit()
+_session_recorder = contextvars.ContextVar("telemetry_session_recorder", default=None)
+
+
+class PhaseRecorder:
+    """Histogrammes par phase (durées en ms, débits en unités/s)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.errors = {}
+
+    def record(self, name, value, failed=False):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(value)
+            if failed:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self):
+        """Une ligne par phase : nombre, p50, p95, max et erreurs"""
+        with self._lock:
+            rows = []
+            for name in sorted(self.histograms):
+                histogram = self.histograms[name]
+                unit = "/s" if name.endswith(RATE_SUFFIX) else "ms"
+                rows.append({
+                    "phase": name,
+                    "unité": unit,
+                    "n": histogram.total,
+                    "p50": histogram.percentile(50),
+                    "p95": histogram.percentile(95),
+                    "max": histogram.max,
+                    "erreurs": self.errors.get(name, 0),
+                })
+            return rows
+
+
+class _NoopSpan:
+    def set_attribute(self, key, value):
+        pass
+
+
+def _file_exporter(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    output = open(path, "a", encoding="utf-8")
+    return ConsoleSpanExporter(out=output, formatter=lambda span: span.to_json(indent=None) + "\n")
+
+
+class Telemetry:
+    """Point d'entrée unique des mesures (partagé par toutes les sessions du processus)"""
+
+    def __init__(self, exporter=OTEL_TRACES_EXPORTER, prometheus_port=PROMETHEUS_PORT):
+        self.recorder = PhaseRecorder()
+        self.tracer = None
+        self.exporter = exporter if OTEL_AVAILABLE else "none"
+        if self.exporter != "none":
+            self.tracer = self._init_tracer(self.exporter)
+        self.prometheus_port = None
+        self._histogram = None
+        self._errors = None
+        if PROMETHEUS_AVAILABLE and prometheus_port:
+            self._init_prometheus(int(prometheus_port))
+
+    def _init_tracer(self, exporter):
+        if exporter == "otlp":
+            # Paquet opentelemetry-exporter-otlp ; cible OTEL_EXPORTER_OTLP_ENDPOINT
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            span_exporter = OTLPSpanExporter()
+        elif exporter == "file":
+            span_exporter = _file_exporter(OTEL_TRACES_FILE)
+        else:
+            span_exporter = ConsoleSpanExporter()
+        provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+        provider.add_span_processor(BatchSpanProcessor(span_exporter))
+        return provider.get_tracer(__name__)
+
+    def _init_prometheus(self, port):
+        self._histogram = prometheus_client.Histogram(
+            "zylon_client_phase_seconds",
+            "Durée des appels API et des phases de chat côté client",
+            ["phase"],
+            buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+        )
+        self._rates = prometheus_client.Histogram(
+            "zylon_client_rate",
+            "Débits mesurés côté client (tokens/s...)",
+            ["phase"],
+            buckets=(1, 5, 10, 20, 40, 60, 80, 120, 200, 400),
+        )
+        self._errors = prometheus_client.Counter(
+            "zylon_client_phase_errors_total", "Phases terminées en erreur", ["phase"]
+        )
+        prometheus_client.start_http_server(port)
+        self.prometheus_port = port
+
+    # --- Sessions --------------------------------------------------------
+
+    @staticmethod
+    def bind(recorder):
+        """Associe les mesures suivantes (thread ou coroutine courante) à l'enregistreur d'une session"""
+        _session_recorder.set(recorder)
+
+    # --- Enregistrement --------------------------------------------------
+
+    def record(self, name, value, failed=False):
+        """Enregistre une durée (secondes) ou un débit (nom se terminant par _per_s)"""
+        is_rate = name.endswith(RATE_SUFFIX)
+        shown = value if is_rate else value * 1000
+        self.recorder.record(name, shown, failed)
+        session = _session_recorder.get()
+        if session is not None:
+            session.record(name, shown, failed)
+        if self._histogram is not None:
+            (self._rates if is_rate else self._histogram).labels(name).observe(value)
+            if failed:
+                self._errors.labels(name).inc()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Mesure un bloc ; crée un span OpenTelemetry si l'export est activé"""
+        started_at = time.perf_counter()
+        failed = False
+        if self.tracer is None:
+            span_context = None
+            span = _NoopSpan()
+        else:
+            span_context = self.tracer.start_as_current_span(name, attributes=attributes)
+            span = span_context.__enter__()
+        try:
+            yield span
+        except BaseException as e:
+            failed = True
+            if span_context is not None:
+                span_context.__exit__(type(e), e, e.__traceback__)
+                span_context = None
+            raise
+        finally:
+            if span_context is not None:
+                span_context.__exit__(None, None, None)
+            self.record(name, time.perf_counter() - started_at, failed)
+
+    def status(self):
+        return {
+            "opentelemetry": self.exporter if self.tracer is not None else "désactivé",
+            "prometheus": f":{self.prometheus_port}/metrics" if self.prometheus_port else "désactivé",
+        }
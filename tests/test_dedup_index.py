@@ -0,0 +1,20 @@
+from dedup_index import DedupIndex
+
+
+def test_reingesting_an_artifact_forgets_its_previous_content(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup.sqlite3"))
+    index.add("hash-v1", "contrat.pdf")
+    index.add("hash-v2", "contrat.pdf")  # même nom, contenu modifié
+
+    assert index.lookup("hash-v1") is None
+    assert index.lookup("hash-v2") == "contrat.pdf"
+    assert index.count() == 1
+
+
+def test_reingestion_only_affects_its_collection(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup.sqlite3"))
+    index.add("hash-v1", "contrat.pdf")
+    index.add("hash-v2", "contrat.pdf", collection="archives")
+
+    assert index.lookup("hash-v1") == "contrat.pdf"
+    assert index.lookup("hash-v2", collection="archives") == "contrat.pdf"
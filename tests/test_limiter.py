@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from limiter import AdaptiveLimiter, CircuitOpen, QueueTimeout, OK, OVERLOAD
+
+
+def make_limiter(**kwargs):
+    options = dict(initial=4, min_limit=1, max_limit=8, queue_timeout=1.0, failures=2, cooldown=0.05)
+    options.update(kwargs)
+    return AdaptiveLimiter("test", **options)
+
+
+def open_circuit(limiter):
+    for _ in range(limiter.failures):
+        limiter.acquire()
+        limiter.release(time.monotonic(), OVERLOAD)
+    assert limiter.state == "open"
+
+
+def test_failed_probe_allows_a_new_probe_after_cooldown():
+    limiter = make_limiter()
+    open_circuit(limiter)
+    time.sleep(limiter.cooldown * 1.5)
+
+    limiter.acquire()  # requête d'essai
+    assert limiter.state == "half_open"
+    limiter.release(time.monotonic(), OVERLOAD)
+    assert limiter.state == "open"
+    with pytest.raises(CircuitOpen):
+        limiter.acquire()
+
+    time.sleep(limiter.cooldown * 1.5)
+    limiter.acquire()  # nouvelle requête d'essai admise
+    limiter.release(time.monotonic(), OK)
+    assert limiter.state == "closed"
+    limiter.acquire()
+    limiter.release(time.monotonic(), OK)
+
+
+def test_only_one_probe_in_half_open():
+    limiter = make_limiter()
+    open_circuit(limiter)
+    time.sleep(limiter.cooldown * 1.5)
+    limiter.acquire()
+    with pytest.raises(CircuitOpen):
+        limiter.acquire()
+    limiter.release(time.monotonic(), OK)
+    assert limiter.state == "closed"
+
+
+def open_with_slot_taken(limiter):
+    """Circuit ouvert alors qu'une requête partie auparavant occupe l'unique place"""
+    limiter.acquire()
+    limiter.acquire()
+    limiter.release(time.monotonic(), OVERLOAD)
+    assert limiter.state == "open" and int(limiter.limit) == 1
+    time.sleep(limiter.cooldown * 1.5)
+
+
+def test_abandoned_waiter_does_not_release_the_probe():
+    limiter = make_limiter(initial=2, failures=1)
+    open_with_slot_taken(limiter)
+    # La requête d'essai attend une place puis abandonne : une autre peut être tentée
+    with pytest.raises(QueueTimeout):
+        limiter.acquire(timeout=0.05)
+    # Nouvelle requête d'essai en file : aucune autre n'est admise tant qu'elle attend
+    probe = threading.Thread(target=limiter.acquire, kwargs={"timeout": 1.0})
+    probe.start()
+    time.sleep(0.05)
+    with pytest.raises(CircuitOpen):
+        limiter.acquire(timeout=0.05)
+    limiter.release(time.monotonic(), OK)  # la requête d'essai obtient la place libérée
+    probe.join()
+    limiter.release(time.monotonic(), OK)
+    assert limiter.state == "closed"
+
+
+def test_cancelled_probe_allows_a_new_probe():
+    limiter = make_limiter(initial=2, failures=1)
+    open_with_slot_taken(limiter)
+
+    async def cancelled_probe():
+        task = asyncio.ensure_future(limiter.aacquire(timeout=1.0))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancelled_probe())
+    # Nouvelle requête d'essai admise (elle attend une place au lieu d'être rejetée)
+    with pytest.raises(QueueTimeout):
+        limiter.acquire(timeout=0.05)
+    limiter.release(time.monotonic(), OK)  # la requête antérieure se termine et referme le circuit
+    assert limiter.state == "closed"
@@ -0,0 +1,29 @@
+import numpy as np
+
+from semantic_cache import SemanticCache, history_key
+
+
+def test_first_question_is_shared_between_conversations():
+    cache = SemanticCache(capacity=4, threshold=0.95)
+    cache.put([1.0, 0.0, 0.0], "réponse", [], cache.version, history_key([]))
+    assert cache.lookup([0.99, 0.01, 0.0], history_key([]))[1] == "réponse"
+
+
+def test_follow_up_does_not_match_another_conversation():
+    cache = SemanticCache(capacity=4, threshold=0.95)
+    follow_up = [0.0, 1.0, 0.0]  # « Peux-tu détailler ? », embarqué de la même façon partout
+    first = [{"role": "user", "content": "Quel est le loyer ?"}, {"role": "assistant", "content": "1200 €"}]
+    second = [{"role": "user", "content": "Quelle est la surface ?"}, {"role": "assistant", "content": "80 m²"}]
+    cache.put(follow_up, "détail du loyer", [], cache.version, history_key(first))
+
+    assert cache.lookup(follow_up, history_key(second)) is None
+    assert cache.lookup(follow_up, history_key([])) is None
+    assert cache.lookup(follow_up, history_key(list(first)))[1] == "détail du loyer"
+
+
+def test_best_match_is_chosen_among_same_history_only():
+    cache = SemanticCache(capacity=4, threshold=0.9)
+    history = [{"role": "user", "content": "Bonjour"}]
+    cache.put([1.0, 0.0], "autre conversation", [], cache.version, history_key([]))
+    cache.put(np.array([0.95, 0.31]), "même conversation", [], cache.version, history_key(history))
+    assert cache.lookup([1.0, 0.0], history_key(history))[1] == "même conversation"
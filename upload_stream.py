@@ -0,0 +1,160 @@
+"""Corps multipart/form-data produit par blocs pour les uploads de fichiers.
+
+Le fichier est lu par blocs de taille fixe (via mmap pour les gros fichiers sur
+disque, via le tampon existant pour les fichiers déjà en mémoire), ce qui garde
+la mémoire constante et permet de suivre les octets réellement envoyés. En
+asynchrone, les lectures sur disque sont faites dans un thread : la boucle du
+client partagé continue de servir les autres requêtes pendant un gros upload.
+"""
+import asyncio
+import mimetypes
+import mmap
+import os
+import secrets
+import time
+
+BLOCK_SIZE = int(os.getenv("UPLOAD_BLOCK_SIZE", str(1024 * 1024)))  # 1MB
+MMAP_THRESHOLD = 8 * 1024 * 1024  # 8MB
+
+
+class TransferProgress:
+    """Octets envoyés, débit et temps restant estimé d'un transfert"""
+
+    def __init__(self, total):
+        self.total = total
+        self.sent = 0
+        self.started_at = None
+        self.finished_at = None
+
+    def update(self, size):
+        now = time.monotonic()
+        if self.started_at is None:
+            self.started_at = now
+        self.sent += size
+        if self.sent >= self.total:
+            self.finished_at = now
+
+    @property
+    def fraction(self):
+        return min(self.sent / self.total, 1.0) if self.total else 1.0
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def throughput(self):
+        """Débit moyen en octets par seconde"""
+        elapsed = self.elapsed
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """Temps restant estimé en secondes (None tant que le débit est inconnu)"""
+        throughput = self.throughput
+        if not throughput:
+            return None
+        return max(self.total - self.sent, 0) / throughput
+
+    def describe(self):
+        """Résumé lisible : volume envoyé, débit et temps restant"""
+        text = f"{self.sent / (1024 * 1024):.1f}/{self.total / (1024 * 1024):.1f} MB"
+        if self.throughput:
+            text += f", {self.throughput / (1024 * 1024):.1f} MB/s"
+        eta = self.eta
+        if eta is not None and self.sent < self.total:
+            text += f", reste ~{eta:.0f}s"
+        return text
+
+
+def _source_size(source):
+    if isinstance(source, str):
+        return os.path.getsize(source)
+    if hasattr(source, "getbuffer"):
+        with source.getbuffer() as view:
+            return view.nbytes
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+
+class MultipartFileStream:
+    """Corps multipart contenant un seul fichier, lu bloc par bloc"""
+
+    def __init__(self, source, file_name, field="file", block_size=BLOCK_SIZE):
+        self.source = source
+        self.block_size = block_size
+        boundary = secrets.token_hex(16)
+        content_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+        quoted_name = file_name.replace("\\", "\\\\").replace('"', '\\"')
+        self._head = (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{quoted_name}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8")
+        self._tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self.size = _source_size(source)
+        self.content_length = len(self._head) + self.size + len(self._tail)
+        self.progress = TransferProgress(self.size)
+
+    @property
+    def headers(self):
+        return {
+            "Content-Type": self.content_type,
+            "Content-Length": str(self.content_length),
+        }
+
+    def _file_blocks(self):
+        if isinstance(self.source, str):
+            with open(self.source, "rb") as file:
+                if self.size >= MMAP_THRESHOLD:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        for offset in range(0, self.size, self.block_size):
+                            yield mapped[offset:offset + self.block_size]
+                else:
+                    while block := file.read(self.block_size):
+                        yield block
+        elif hasattr(self.source, "getbuffer"):
+            # Fichier déjà en mémoire (BytesIO / UploadedFile) : découpage sans copie globale
+            view = self.source.getbuffer()
+            try:
+                for offset in range(0, self.size, self.block_size):
+                    yield bytes(view[offset:offset + self.block_size])
+            finally:
+                view.release()
+        else:
+            self.source.seek(0)
+            while block := self.source.read(self.block_size):
+                yield block
+
+    def iter_blocks(self):
+        """Itérateur synchrone sur le corps de la requête"""
+        self.progress = TransferProgress(self.size)
+        yield self._head
+        for block in self._file_blocks():
+            yield block
+            # Le bloc est compté comme envoyé quand le bloc suivant est demandé
+            self.progress.update(len(block))
+        yield self._tail
+
+    async def aiter_blocks(self):
+        """Itérateur asynchrone sur le corps de la requête (pour httpx.AsyncClient)"""
+        if hasattr(self.source, "getbuffer"):
+            # Données déjà en mémoire : découpage sans entrée/sortie, sur la boucle
+            for block in self.iter_blocks():
+                yield block
+            return
+        blocks = self.iter_blocks()
+        try:
+            while (block := await asyncio.to_thread(next, blocks, None)) is not None:
+                yield block
+        finally:
+            try:
+                blocks.close()
+            except ValueError:
+                # Lecture encore en cours dans le thread (annulation) : fermé par le ramasse-miettes
+                pass
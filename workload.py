@@ -0,0 +1,175 @@
+"""Génération de charge réaliste pour les tests Locust.
+
+Les scénarios (messages, conversations multi-tours, recherches, ingestions,
+suppressions, bulk RAG) proviennent soit d'une trace JSONL lue au fil de l'eau,
+soit d'un mélange synthétique pondéré. Les arrivées peuvent suivre un
+processus de Poisson ou les horodatages de la trace (mode « boucle ouverte »).
+
+Format d'une ligne de trace (champs optionnels entre crochets) :
+    {"type": "chat", "prompt": "...", ["timestamp": 12.5]}
+    {"type": "conversation", "turns": ["...", "..."], ["think_time": 5]}
+    {"type": "chunks", "text": "..."}
+    {"type": "embeddings", "input": "..." | ["...", "..."]}
+    {"type": "ingest_text", "text": "...", ["artifact": "..."]}
+    {"type": "delete", ["artifact": "..."]}
+    {"type": "list"}
+    {"type": "bulk_rag", "queries": ["...", "..."], ["prompt": "..."]}
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+SCENARIO_TYPES = ("chat", "conversation", "chunks", "embeddings", "ingest_text", "delete", "list", "bulk_rag")
+
+DEFAULT_PROMPTS = [
+    "Bonjour, comment allez-vous?",
+]
+
+DEFAULT_WEIGHTS = "chat=3,list=1"
+
+
+def parse_weights(spec):
+    """Convertit "chat=3,list=1" en {"chat": 3, "list": 1}"""
+    weights = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in SCENARIO_TYPES:
+            raise ValueError(f"Type de scénario inconnu : {name}")
+        weights[name] = float(value or 1)
+    return weights
+
+
+class TraceReader:
+    """Lecture paresseuse et partagée d'une trace JSONL, rejouée en boucle si demandé"""
+
+    def __init__(self, path, loop=True):
+        self.path = path
+        self.loop = loop
+        self.malformed = 0
+        self.cycles = 0
+        self._lock = threading.Lock()
+        self._file = open(path, encoding="utf-8")
+        # Décalage des horodatages d'un cycle à l'autre lorsque la trace boucle
+        self._offset = 0.0
+        self._last_timestamp = 0.0
+        # Premier horodatage lu : les traces en temps absolu (epoch) sont ramenées à 0
+        self._origin = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._lock:
+            while True:
+                line = self._file.readline()
+                if not line:
+                    if not self.loop:
+                        raise StopIteration
+                    self._file.seek(0)
+                    self.cycles += 1
+                    self._offset = self._last_timestamp
+                    line = self._file.readline()
+                    if not line:
+                        raise StopIteration
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    scenario = json.loads(line)
+                except json.JSONDecodeError:
+                    self.malformed += 1
+                    continue
+                if scenario.get("type") not in SCENARIO_TYPES:
+                    self.malformed += 1
+                    continue
+                if "timestamp" in scenario:
+                    timestamp = float(scenario["timestamp"])
+                    if self._origin is None:
+                        self._origin = timestamp
+                    scenario["timestamp"] = timestamp - self._origin + self._offset
+                    self._last_timestamp = scenario["timestamp"]
+                return scenario
+
+    def close(self):
+        self._file.close()
+
+
+class SyntheticWorkload:
+    """Scénarios tirés selon des poids, avec des prompts pris au hasard"""
+
+    def __init__(self, weights, prompts=None):
+        self.types = list(weights)
+        self.weights = [weights[name] for name in self.types]
+        self.prompts = prompts or DEFAULT_PROMPTS
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        scenario_type = random.choices(self.types, weights=self.weights)[0]
+        prompt = random.choice(self.prompts)
+        if scenario_type == "conversation":
+            return {"type": "conversation", "turns": random.sample(self.prompts, min(3, len(self.prompts)))}
+        if scenario_type == "embeddings":
+            return {"type": "embeddings", "input": prompt}
+        if scenario_type == "bulk_rag":
+            return {"type": "bulk_rag", "queries": random.sample(self.prompts, min(5, len(self.prompts)))}
+        if scenario_type in ("chunks", "ingest_text"):
+            return {"type": scenario_type, "text": prompt}
+        if scenario_type == "chat":
+            return {"type": "chat", "prompt": prompt}
+        return {"type": scenario_type}
+
+
+class ArrivalSchedule:
+    """Instants d'arrivée partagés par tous les utilisateurs du processus (boucle ouverte)
+
+    - mode "poisson" : arrivées indépendantes au débit global `rate` (requêtes/s)
+    - mode "trace" : arrivées aux horodatages de la trace, accélérés par `speedup`
+    """
+
+    def __init__(self, source, mode="poisson", rate=1.0, speedup=1.0):
+        self.source = source
+        self.mode = mode
+        self.rate = rate
+        self.speedup = speedup
+        self._lock = threading.Lock()
+        self._started_at = None
+        self._next_at = None
+
+    def next(self):
+        """Retourne (scénario, instant d'arrivée en secondes time.monotonic())"""
+        with self._lock:
+            scenario = next(self.source)
+            now = time.monotonic()
+            if self._started_at is None:
+                self._started_at = self._next_at = now
+            if self.mode == "trace" and "timestamp" in scenario:
+                return scenario, self._started_at + scenario["timestamp"] / self.speedup
+            self._next_at = max(self._next_at, now - 1.0) + random.expovariate(self.rate)
+            return scenario, self._next_at
+
+
+def load_prompts(path):
+    """Charge une liste de prompts (un par ligne) ; retourne la liste par défaut si absent"""
+    if not path:
+        return DEFAULT_PROMPTS
+    with open(path, encoding="utf-8") as file:
+        prompts = [line.strip() for line in file if line.strip()]
+    return prompts or DEFAULT_PROMPTS
+
+
+def workload_from_env():
+    """Construit la source de scénarios à partir des variables d'environnement"""
+    trace_path = os.getenv("WORKLOAD_TRACE")
+    if trace_path:
+        logging.info(f"Rejeu de la trace {trace_path}")
+        return TraceReader(trace_path, loop=os.getenv("WORKLOAD_TRACE_LOOP", "1") != "0")
+    weights = parse_weights(os.getenv("WORKLOAD_WEIGHTS", DEFAULT_WEIGHTS))
+    return SyntheticWorkload(weights, load_prompts(os.getenv("WORKLOAD_PROMPTS")))
@@ -0,0 +1,274 @@
+"""Client HTTP mutualisé pour l'API Zylon.
+
+Un seul pool de connexions (keep-alive, HTTP/2 si le paquet ``h2`` est installé)
+est partagé par toutes les sessions Streamlit du processus, au lieu d'ouvrir un
+``httpx.Client`` par appel.
+"""
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import httpx
+
+from limiter import ENDPOINT_CLASSES, LIMITER_ENABLED, ConcurrencyLimiter
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+# Timeouts par type d'endpoint (en secondes), surchargeables via ZYLON_TIMEOUT_<NOM>
+DEFAULT_TIMEOUTS = {
+    "default": 30.0,
+    "list": 30.0,
+    "delete": 30.0,
+    "embeddings": 30.0,
+    "chunks": 30.0,
+    "ingest_text": 30.0,
+    "ingest_async": 30.0,
+    "async": 30.0,  # création des tâches /v1/async/*
+    "tasks": 30.0,
+    "summarize": 300.0,
+    "bulk_rag": 600.0,  # un lot de questions par requête
+    "chat": 30.0,  # délai maximal entre deux événements SSE
+    "upload": 300.0,  # 5 minutes
+    "upload_large": 1800.0,  # 30 minutes pour les gros PDF
+    "upload_retry": 3600.0,  # 1 heure
+}
+
+CONNECT_TIMEOUT = _env_float("ZYLON_CONNECT_TIMEOUT", 10.0)
+
+
+def load_timeouts():
+    """Retourne les timeouts par endpoint en tenant compte des variables d'environnement"""
+    return {
+        name: _env_float(f"ZYLON_TIMEOUT_{name.upper()}", value)
+        for name, value in DEFAULT_TIMEOUTS.items()
+    }
+
+
+def load_limits():
+    """Retourne les limites du pool de connexions configurées via l'environnement"""
+    return httpx.Limits(
+        max_connections=_env_int("ZYLON_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=_env_int("ZYLON_MAX_KEEPALIVE", 20),
+        keepalive_expiry=_env_float("ZYLON_KEEPALIVE_EXPIRY", 30.0),
+    )
+
+
+class PoolStats:
+    """Compteurs d'utilisation du pool, partagés entre threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_requests = 0
+        self.errors = 0
+        self.by_endpoint = {}
+
+    def start(self, endpoint):
+        with self._lock:
+            self.in_flight += 1
+            self.total_requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.by_endpoint[endpoint] = self.by_endpoint.get(endpoint, 0) + 1
+
+    def finish(self, failed=False):
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "total_requests": self.total_requests,
+                "errors": self.errors,
+                "by_endpoint": dict(self.by_endpoint),
+            }
+
+
+def _pool_connections(client):
+    """Nombre de connexions ouvertes / inactives dans le pool httpcore (si accessible)"""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is None:
+        return None
+    idle = sum(1 for conn in connections if conn.is_idle())
+    return {"open": len(connections), "idle": idle}
+
+
+class ZylonClient:
+    """Client synchrone et asynchrone partageant la configuration du pool"""
+
+    def __init__(self, base_url, limits=None, timeouts=None, http2=None, telemetry=None, limiter=None):
+        self.base_url = base_url.rstrip("/")
+        self.limits = limits or load_limits()
+        self.timeouts = timeouts or load_timeouts()
+        if http2 is None:
+            http2 = HTTP2_AVAILABLE and os.getenv("ZYLON_HTTP2", "1") != "0"
+        self.http2 = http2
+        self.stats = PoolStats()
+        # Mesures optionnelles (telemetry.Telemetry) : un span "api.<endpoint>" par appel
+        self.telemetry = telemetry
+        # Concurrence adaptative par classe d'endpoint, partagée par toutes les sessions
+        if limiter is None and LIMITER_ENABLED:
+            limiter = ConcurrencyLimiter()
+        self.limiter = limiter
+        self._client = httpx.Client(
+            base_url=self.base_url,
+            limits=self.limits,
+            timeout=self.timeout("default"),
+            http2=self.http2,
+            headers={"accept": "application/json"},
+        )
+        # Boucle asyncio dédiée pour les appels concurrents, démarrée à la demande
+        self._loop = None
+        self._loop_thread = None
+        self._async_client = None
+        self._loop_lock = threading.Lock()
+
+    def timeout(self, endpoint):
+        """Construit le timeout httpx associé à un type d'endpoint"""
+        value = self.timeouts.get(endpoint, self.timeouts["default"])
+        return httpx.Timeout(value, connect=min(CONNECT_TIMEOUT, value))
+
+    def _record_queue(self, endpoint, waited):
+        if waited is not None and self.telemetry is not None:
+            self.telemetry.record(f"queue.{ENDPOINT_CLASSES[endpoint]}", waited)
+
+    @contextmanager
+    def _limit(self, endpoint, on_queue=None):
+        if self.limiter is None:
+            yield
+            return
+        with self.limiter.slot(endpoint, on_wait=on_queue) as waited:
+            self._record_queue(endpoint, waited)
+            yield
+
+    @asynccontextmanager
+    async def _alimit(self, endpoint):
+        if self.limiter is None:
+            yield
+            return
+        async with self.limiter.aslot(endpoint) as waited:
+            self._record_queue(endpoint, waited)
+            yield
+
+    @contextmanager
+    def _track(self, endpoint, method=None, path=None):
+        self.stats.start(endpoint)
+        failed = False
+        try:
+            if self.telemetry is None:
+                yield
+            else:
+                with self.telemetry.span(f"api.{endpoint}", **{"http.method": method, "http.route": path}):
+                    yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.stats.finish(failed)
+
+    def request(self, method, path, endpoint="default", timeout=None, on_queue=None, **kwargs):
+        """Effectue une requête via le pool partagé et lève une erreur si le statut n'est pas 2xx
+
+        on_queue(position) est appelé tant que la requête attend une place (backend saturé).
+        """
+        with self._limit(endpoint, on_queue), self._track(endpoint, method, path):
+            response = self._client.request(
+                method, path, timeout=timeout or self.timeout(endpoint), **kwargs
+            )
+            response.raise_for_status()
+            return response
+
+    @contextmanager
+    def stream(self, method, path, endpoint="default", timeout=None, on_queue=None, **kwargs):
+        """Ouvre une réponse en streaming via le pool partagé (la place est occupée jusqu'à la fin du flux)"""
+        with self._limit(endpoint, on_queue), self._track(endpoint, method, path):
+            with self._client.stream(
+                method, path, timeout=timeout or self.timeout(endpoint), **kwargs
+            ) as response:
+                response.raise_for_status()
+                yield response
+
+    # --- Partie asynchrone -------------------------------------------------
+
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever, name="zylon-client-loop", daemon=True
+                )
+                self._loop_thread.start()
+                self._async_client = httpx.AsyncClient(
+                    base_url=self.base_url,
+                    limits=self.limits,
+                    timeout=self.timeout("default"),
+                    http2=self.http2,
+                    headers={"accept": "application/json"},
+                )
+        return self._loop
+
+    @property
+    def async_client(self):
+        self._ensure_loop()
+        return self._async_client
+
+    def submit(self, coro):
+        """Planifie une coroutine sur la boucle du client et retourne un concurrent.futures.Future
+
+        La tâche hérite des contextvars de l'appelant (session de mesure, span courant).
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run(self, coro, timeout=None):
+        """Exécute une coroutine sur la boucle du client et attend son résultat"""
+        return self.submit(coro).result(timeout)
+
+    async def arequest(self, method, path, endpoint="default", timeout=None, **kwargs):
+        """Équivalent asynchrone de request(), à appeler depuis la boucle du client"""
+        async with self._alimit(endpoint):
+            with self._track(endpoint, method, path):
+                response = await self.async_client.request(
+                    method, path, timeout=timeout or self.timeout(endpoint), **kwargs
+                )
+                response.raise_for_status()
+                return response
+
+    # --- Observabilité / cycle de vie -------------------------------------
+
+    def pool_stats(self):
+        """Compteurs d'utilisation du pool de connexions"""
+        snapshot = self.stats.snapshot()
+        snapshot["http2"] = self.http2
+        snapshot["max_connections"] = self.limits.max_connections
+        snapshot["connections"] = _pool_connections(self._client)
+        snapshot["limiter"] = self.limiter.snapshot() if self.limiter is not None else None
+        snapshot["timestamp"] = time.time()
+        return snapshot
+
+    def close(self):
+        self._client.close()
+        if self._loop is not None:
+            self.run(self._async_client.aclose())
+            self._loop.call_soon_threadsafe(self._loop.stop)